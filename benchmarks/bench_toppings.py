@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks of the toppings subsystem.
+
+Times ConfidenceCutter.fit/predict, Curve.__call__, the CurveSliding
+construction and the criteria on synthetic events and writes the
+results as JSON. Each parameter is varied on its own around a baseline
+configuration. Results of two commits can be compared with --compare:
+
+    python benchmarks/bench_toppings.py -o before.json
+    (checkout other commit)
+    python benchmarks/bench_toppings.py -o after.json --compare before.json
+"""
+from __future__ import absolute_import, print_function, division
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from taco_salad.toppings import ConfidenceCutter, criteria  # noqa: E402
+from taco_salad.toppings.curve import Curve, CurveSliding  # noqa: E402
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+
+PRESETS = {
+    'quick': {
+        'baseline': {'n_events': 10000,
+                     'n_steps': 100,
+                     'n_bootstraps': 0,
+                     'window_size': 0.1,
+                     'n_jobs': 1},
+        'fit': {'n_events': [10000, 100000],
+                'n_bootstraps': [0, 3]},
+        'n_points': [100, 1000],
+        'n_cuts': [1000, 100000]},
+    'default': {
+        'baseline': {'n_events': 100000,
+                     'n_steps': 100,
+                     'n_bootstraps': 3,
+                     'window_size': 0.1,
+                     'n_jobs': 1},
+        'fit': {'n_events': [10000, 100000, 1000000],
+                'n_steps': [100, 1000],
+                'n_bootstraps': [0, 3, 10],
+                'window_size': [0.02, 0.1, 0.4],
+                'n_jobs': [1, 2, 4]},
+        'n_points': [100, 1000, 10000],
+        'n_cuts': [1000, 100000, 1000000]},
+    'full': {
+        'baseline': {'n_events': 1000000,
+                     'n_steps': 1000,
+                     'n_bootstraps': 3,
+                     'window_size': 0.1,
+                     'n_jobs': 1},
+        'fit': {'n_events': [10000, 100000, 1000000, 10000000, 100000000],
+                'n_steps': [100, 1000, 10000],
+                'n_bootstraps': [0, 3, 10, 30],
+                'window_size': [0.02, 0.1, 0.4],
+                'n_jobs': [1, 2, 4, 8]},
+        'n_points': [100, 1000, 10000],
+        'n_cuts': [1000, 100000, 10000000]},
+}
+
+
+def generate_lines(eff, pur, conf_cut):
+    """Parameters of the linear signal and background confidence pdfs
+    (same model as generate_lines in tests/test_conf_cutter.py).
+    """
+    B0 = 2 * pur + (2 * eff * pur - 2 * eff)
+    B0 /= conf_cut * np.sqrt(eff) * np.sqrt(1 - pur) * np.sqrt(pur) + \
+        conf_cut * pur
+    Bx = conf_cut * pur + conf_cut * np.sqrt(eff * pur - eff * pur**2)
+    Bx /= (eff * pur - eff) + pur
+    Bm = -B0 / Bx
+    Bb = B0
+    S0 = ((2 + 2 * np.sqrt(1 - eff)) * eff) / \
+        ((conf_cut - 1) * eff + (2 - conf_cut * 2) * np.sqrt(1 - eff) -
+         2 * conf_cut + 2)
+    Sx = (-1 + conf_cut + (conf_cut - 1) * np.sqrt(1 - eff) + eff) / eff
+    Sm = S0 / (1 - Sx)
+    Sb = S0 * Sx / (Sx - 1)
+    return Bm, Sm, Bb, Sb, Sx
+
+
+def generate_x(n, eff=0.9, pur=0.9, random_state=None):
+    """Synthetic events like generate_x in tests/test_conf_cutter.py with
+    a cut curve varying with X_o.
+
+    Returns
+    -------
+    X : array, shape=(n, 2)
+        Confidence (index 0) and X_o (index 1).
+
+    y_true : array, shape=(n)
+        Labels.
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+    y_true = random_state.randint(0, 2, size=n)
+    x = random_state.uniform(-1., 1., n)
+    conf_cut = 0.5 + 0.2 * x
+    Bm, Sm, Bb, Sb, Sx = generate_lines(eff, pur, conf_cut)
+    Sl = Sm / 2. * Sx**2 + Sb * Sx
+    r = random_state.uniform(size=n)
+    X = np.empty((n, 2))
+    idx_sig = y_true == 1
+    X[idx_sig, 0] = (-Sb / Sm + np.sqrt((Sb / Sm)**2 +
+                                        2 * (Sl + r) / Sm))[idx_sig]
+    X[~idx_sig, 0] = (-Bb / Bm - np.sqrt((Bb / Bm)**2 +
+                                         (2 * r) / Bm))[~idx_sig]
+    X[:, 1] = x
+    return X, y_true
+
+
+def time_call(func, setup=None, repeat=3):
+    """Returns the wall times of 'repeat' calls of func(setup())."""
+    times = []
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = timer()
+        func(*args)
+        times.append(timer() - start)
+    return times
+
+
+def sweep(baseline, grid):
+    """Yields the baseline and configurations differing from it in a
+    single parameter.
+    """
+    seen = []
+    for key in sorted(grid):
+        for value in grid[key]:
+            params = dict(baseline)
+            params[key] = value
+            if params not in seen:
+                seen.append(params)
+                yield params
+
+
+class Benchmarks(object):
+    """Collects the results of all benchmarks.
+
+    Parameters
+    ----------
+    preset : str
+        Key of PRESETS.
+
+    repeat : int
+        Number of repetitions of each timing.
+
+    pattern : str or None
+        Only benchmarks containing pattern in their name are run.
+
+    seed : int
+        Seed of the generated events.
+    """
+    def __init__(self, preset='default', repeat=3, pattern=None, seed=1337):
+        self.config = PRESETS[preset]
+        self.preset = preset
+        self.repeat = repeat
+        self.pattern = pattern
+        self.seed = seed
+        self.results = []
+        self.__events = {}
+
+    def get_events(self, n_events):
+        if n_events not in self.__events:
+            self.__events = {n_events: generate_x(n_events,
+                                                  random_state=self.seed)}
+        return self.__events[n_events]
+
+    def selected(self, name):
+        return self.pattern is None or self.pattern in name
+
+    def run_timing(self, name, params, func, setup=None):
+        if not self.selected(name):
+            return
+        times = time_call(func, setup=setup, repeat=self.repeat)
+        result = {'name': name,
+                  'params': params,
+                  'times': times,
+                  'min': min(times),
+                  'median': float(np.median(times))}
+        self.results.append(result)
+        print('{:<40} {:<70} {:10.4f}s'.format(
+            name, json.dumps(params, sort_keys=True), result['min']))
+
+    def bench_conf_cutter(self):
+        pur_crit = criteria.purity_criteria(threshold=0.9)
+        runs = sorted(sweep(self.config['baseline'], self.config['fit']),
+                      key=lambda params: params['n_events'])
+        for params in runs:
+            X, y_true = self.get_events(params['n_events'])
+            params = dict(params)
+            # Mean number of windows containing an event
+            params['overlap'] = params['window_size'] * params['n_steps'] / 2.
+
+            def new_cutter(params=params):
+                return ConfidenceCutter(
+                    n_steps=params['n_steps'],
+                    window_size=params['window_size'],
+                    n_bootstraps=params['n_bootstraps'],
+                    n_jobs=params['n_jobs'],
+                    criteria=pur_crit,
+                    random_state=self.seed)
+
+            self.run_timing('ConfidenceCutter.fit',
+                            params,
+                            lambda cutter: cutter.fit(X, y_true),
+                            setup=new_cutter)
+            if not self.selected('ConfidenceCutter.predict'):
+                continue
+            fitted = new_cutter()
+            fitted.cut_opts.n_bootstraps = 0
+            fitted.fit(X, y_true)
+            self.run_timing('ConfidenceCutter.predict',
+                            params,
+                            lambda: fitted.predict(X))
+
+    def bench_curves(self):
+        n_events = self.config['baseline']['n_events']
+        X, _ = self.get_events(n_events)
+        x = X[:, 1]
+        for n_points in self.config['n_points']:
+            x_curve = np.linspace(-1., 1., n_points)
+            y_curve = np.sin(x_curve)
+            for mode in ['linear', 'hist']:
+                params = {'n_points': n_points,
+                          'n_events': n_events,
+                          'mode': mode}
+                curve = Curve(x_curve, y_curve, mode=mode)
+                self.run_timing('Curve.__call__',
+                                params,
+                                lambda: curve(x))
+            edges = np.vstack((x_curve - 0.1, x_curve + 0.1)).T
+            for combination_mode in ['overlapping', 'single']:
+                params = {'n_steps': n_points,
+                          'combination_mode': combination_mode}
+                self.run_timing(
+                    'CurveSliding.__init__',
+                    params,
+                    lambda: CurveSliding(edges,
+                                         y_curve,
+                                         combination_mode=combination_mode))
+
+    def bench_criteria(self):
+        factories = [
+            ('purity_criteria',
+             lambda: criteria.purity_criteria(threshold=0.9)),
+            ('general_confusion_matrix_criteria',
+             lambda: criteria.general_confusion_matrix_criteria(
+                 'tp / (tp + fp)', threshold=0.9))]
+        random_state = np.random.RandomState(self.seed)
+        for n_cuts in self.config['n_cuts']:
+            tp, fp, tn, fn = random_state.uniform(0., 100., (4, n_cuts))
+            y_true = random_state.randint(0, 2, n_cuts)
+            y_pred = random_state.randint(0, 2, n_cuts)
+            for factory_name, factory in factories:
+                crit = factory()
+                params = {'n_cuts': n_cuts}
+                self.run_timing(
+                    'criteria.{}.evaluate_counts'.format(factory_name),
+                    params,
+                    lambda: crit.evaluate_counts(tp, fp, tn, fn, 0.))
+                params = {'n_events': n_cuts}
+                self.run_timing(
+                    'criteria.{}.__call__'.format(factory_name),
+                    params,
+                    lambda: crit(y_true, y_pred, 0.))
+        for factory_name, factory in factories:
+            self.run_timing('criteria.{}'.format(factory_name), {}, factory)
+
+    def run(self):
+        self.bench_criteria()
+        self.bench_curves()
+        self.bench_conf_cutter()
+        return self.results
+
+    def get_meta(self):
+        try:
+            commit = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.STDOUT).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {'commit': commit,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count() if hasattr(os, 'cpu_count')
+                else None,
+                'preset': self.preset,
+                'repeat': self.repeat,
+                'seed': self.seed}
+
+
+def result_key(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare(results, baseline_results):
+    """Prints the ratio of the min times to a previous run."""
+    baseline = {result_key(result): result['min']
+                for result in baseline_results}
+    print('\nRatio to baseline (>1: slower)')
+    for result in results:
+        key = result_key(result)
+        if key in baseline and baseline[key] > 0:
+            print('{:<40} {:<70} {:8.3f}'.format(
+                key[0], key[1], result['min'] / baseline[key]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-o', '--output', default='bench_toppings.json',
+                        help='JSON file the results are written to.')
+    parser.add_argument('-p', '--preset', default='default',
+                        choices=sorted(PRESETS),
+                        help='Set of benchmark parameters.')
+    parser.add_argument('-r', '--repeat', default=3, type=int,
+                        help='Number of repetitions of each timing.')
+    parser.add_argument('-k', '--pattern', default=None,
+                        help='Only run benchmarks containing PATTERN.')
+    parser.add_argument('--seed', default=1337, type=int,
+                        help='Seed of the generated events.')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file of a previous run.')
+    args = parser.parse_args()
+
+    benchmarks = Benchmarks(preset=args.preset,
+                            repeat=args.repeat,
+                            pattern=args.pattern,
+                            seed=args.seed)
+    results = benchmarks.run()
+    with open(args.output, 'w') as f:
+        json.dump({'meta': benchmarks.get_meta(), 'results': results},
+                  f,
+                  indent=2)
+    print('Results written to {}'.format(args.output))
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f)['results'])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, division
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+    wait, FIRST_COMPLETED
 import warnings
 import logging
 
+import numpy as np
 import pandas as pd
 
 from sklearn.model_selection import KFold
@@ -166,7 +169,9 @@ class TacoSalad(Recipe):
                   n_jobs=1,
                   fit_parallel=True,
                   predict_parallel=False,
-                  comment=''):
+                  comment='',
+                  dtype=np.float64,
+                  keep_fold_models=False):
         """Method to register and add a component to a layer.
 
         Parameters
@@ -192,6 +197,14 @@ class TacoSalad(Recipe):
         comment : sr, optional (default='')
             Comment for better documentation of the architecture.
 
+        dtype : numpy dtype, optional (default=numpy.float64)
+            Type of the scores of the layer during the fit, e.g.
+            numpy.float32 to half the memory.
+
+        keep_fold_models : boolean, optional (default=False)
+            Only relevant for n_jobs > 1. If True the components fitted
+            in each fold are kept (see layer.LayerParallel).
+
         Returns
         -------
         layer : taco_salad.layer.Layer or taco_salad.layer.LayerParallel
@@ -205,10 +218,13 @@ class TacoSalad(Recipe):
                                   n_jobs=n_jobs,
                                   comment=comment,
                                   fit_parallel=fit_parallel,
-                                  predict_parallel=predict_parallel)
+                                  predict_parallel=predict_parallel,
+                                  dtype=dtype,
+                                  keep_fold_models=keep_fold_models)
         else:
             layer = Layer(name=layer_name,
-                          comment=comment)
+                          comment=comment,
+                          dtype=dtype)
         super(TacoSalad, self).add_layer(layer)
         return layer
 
@@ -336,7 +352,13 @@ class TacoSalad(Recipe):
         self.set_dependencies(dependencies, layer=layer, component=component)
         return component
 
-    def fit_df(self, df, clear_df=True, final_mode=None):
+    def fit_df(self,
+               df,
+               clear_df=True,
+               final_mode=None,
+               scheduler='layers',
+               n_jobs=1,
+               backend='thread'):
         """Method to fit all components. To keep train/test data
         disjunct all the time and to train all layers with the maximal
         possible amout of samples. Each component is trained in a
@@ -364,6 +386,24 @@ class TacoSalad(Recipe):
             'False' the df has the out of the bag score for the complete
             salad.
 
+        scheduler : ['layers', 'dag'], optional (default='layers')
+            layers = the layers are fitted one after another.
+            dag = each component is fitted as soon as the components
+                  providing its inputs (see resolve_dependencies) are
+                  fitted, independent of the layers. Components with
+                  the longest chain of dependent components are started
+                  first. All components use the same folds.
+
+        n_jobs : int, optional (default=1)
+            Number of components fitted at once for scheduler='dag'.
+
+        backend : ['thread', 'process'], optional (default='thread')
+            Pool used for scheduler='dag'. The components are fitted
+            by n_jobs threads through BaseLayer.cross_fit. With
+            'process' layers of type LayerParallel send their
+            (fold, component) tasks to a pool of n_jobs processes as
+            for scheduler='layers'.
+
         Returns
         -------
 
@@ -374,29 +414,178 @@ class TacoSalad(Recipe):
         """
         logging.info('Fitting the wiht a DataFrame with {} folds.'.format(
                      self.kfold))
+        assert scheduler in ['layers', 'dag'], \
+            'Invalid scheduler [\'layers\', \'dag\']'
         df_input_cols = df.columns
         kf = KFold(n_splits=self.kfold, shuffle=True)
-        for i, layer in enumerate(self.layer_order):
-            if layer.active:
-                if final_mode is None:
-                    final_model = False
-                elif final_mode == 'all':
-                    final_mode = True
-                elif final_mode == 'last' or final_mode:
-                    if layer == self.layer_order[-1]:
-                        final_model = True
-                    else:
+        if scheduler == 'dag':
+            df = self.__fit_dag__(df,
+                                  kfold=kf,
+                                  final_mode=final_mode,
+                                  n_jobs=n_jobs,
+                                  backend=backend)
+            return self.__clear_df__(df, df_input_cols, clear_df)
+        # One process pool is shared by all parallel layers. Each layer
+        # keeps at most its own n_jobs tasks in flight.
+        n_workers = max([layer.n_jobs for layer in self.layer_order
+                         if isinstance(layer, LayerParallel) and
+                         layer.active and layer.fit_parallel] + [0])
+        executor = None
+        if n_workers > 1:
+            executor = ProcessPoolExecutor(max_workers=n_workers)
+        try:
+            for i, layer in enumerate(self.layer_order):
+                if layer.active:
+                    if not final_mode:
                         final_model = False
-                layer_df = layer.fit_df(df,
-                                        kfold=kf,
-                                        final_model=final_model)
-                if isinstance(layer_df, pd.DataFrame):
-                    df = pd.concat([df, layer_df], axis=1)
+                    elif final_mode == 'all':
+                        final_model = True
+                    elif final_mode == 'last' or final_mode:
+                        if layer == self.layer_order[-1]:
+                            final_model = True
+                        else:
+                            final_model = False
+                    kwargs = {}
+                    if isinstance(layer, LayerParallel):
+                        kwargs['executor'] = executor
+                    layer_df = layer.fit_df(df,
+                                            kfold=kf,
+                                            final_model=final_model,
+                                            **kwargs)
+                    if isinstance(layer_df, pd.DataFrame):
+                        df = pd.concat([df, layer_df], axis=1)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self.__clear_df__(df, df_input_cols, clear_df)
+
+    def __clear_df__(self, df, df_input_cols, clear_df):
         if clear_df:
             df_final_cols = df.columns
             drop_cols = [col for col in df_final_cols
                          if col not in df_input_cols]
-            df = df.drop(drop_cols)
+            df = df.drop(drop_cols, axis=1)
+        return df
+
+    def __fit_dag__(self, df, kfold, final_mode, n_jobs, backend):
+        assert backend in ['thread', 'process'], \
+            'Invalid backend [\'thread\', \'process\']'
+        nodes = {}
+        for layer in self.layer_order:
+            if isinstance(layer, Layer) and layer.active:
+                for name, component in layer.component_dict.items():
+                    if component.active:
+                        long_name = '{}:{}'.format(layer.name, name)
+                        nodes[long_name] = (layer, name)
+        order = {long_name: i for i, long_name in enumerate(nodes)}
+        predecessors = {}
+        successors = {long_name: set() for long_name in nodes}
+        for long_name in nodes:
+            predecessors[long_name] = set()
+            for unique_name in self.resolve_dependencies(long_name):
+                ingredient = self.ingredients.loc[unique_name]
+                predecessor = '{}:{}'.format(ingredient.layer,
+                                             ingredient.component)
+                if predecessor in nodes:
+                    predecessors[long_name].add(predecessor)
+                    successors[predecessor].add(long_name)
+
+        # Length of the longest chain of components depending on a node
+        chain_lengths = {}
+
+        def chain_length(long_name):
+            if long_name not in chain_lengths:
+                chain_lengths[long_name] = 1 + max(
+                    [chain_length(successor)
+                     for successor in successors[long_name]] + [0])
+            return chain_lengths[long_name]
+
+        last_layer = self.layer_order[-1]
+        final_models = {}
+        for long_name, [layer, _] in nodes.items():
+            if not final_mode:
+                final_models[long_name] = False
+            elif final_mode == 'all':
+                final_models[long_name] = True
+            else:
+                final_models[long_name] = layer == last_layer
+
+        folds = list(kfold.split(np.empty(df.shape)))
+        executor = ThreadPoolExecutor(max_workers=n_jobs)
+        layer_executor = None
+        if backend == 'process':
+            layer_executor = ProcessPoolExecutor(max_workers=n_jobs)
+        scores = {}
+        columns = {}
+        running = {}
+        n_missing = {long_name: len(predecessors[long_name])
+                     for long_name in nodes}
+        ready = [long_name for long_name in nodes
+                 if n_missing[long_name] == 0]
+
+        def get_column(name):
+            if name in columns:
+                return columns[name]
+            return df.loc[:, name].values
+
+        try:
+            while ready or running:
+                ready.sort(key=lambda long_name: (-chain_length(long_name),
+                                                  order[long_name]))
+                while ready and len(running) < max(n_jobs, 1):
+                    long_name = ready.pop(0)
+                    layer, name = nodes[long_name]
+                    component = layer.component_dict[name]
+                    attributes = tuple(component.attributes)
+                    data = {attributes: np.ascontiguousarray(
+                        np.column_stack([get_column(att)
+                                         for att in attributes]))}
+                    for col in [component.label, component.weight]:
+                        if col is not None:
+                            data[col] = get_column(col)
+                    inputs = {name: (attributes,
+                                     component.label,
+                                     component.weight)}
+                    future = executor.submit(layer.cross_fit,
+                                             data,
+                                             inputs,
+                                             folds,
+                                             final_model=final_models[
+                                                 long_name],
+                                             executor=layer_executor)
+                    running[future] = long_name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in sorted(done,
+                                     key=lambda f: order[running[f]]):
+                    long_name = running.pop(future)
+                    _, layer_columns, buffer = future.result()
+                    layer, name = nodes[long_name]
+                    component = layer.component_dict[name]
+                    scores[long_name] = buffer[:, layer_columns[name]]
+                    for i, return_i in enumerate(component.returns):
+                        columns[return_i] = scores[long_name][:, i]
+                    for successor in successors[long_name]:
+                        n_missing[successor] -= 1
+                        if n_missing[successor] == 0:
+                            ready.append(successor)
+        finally:
+            executor.shutdown()
+            if layer_executor is not None:
+                layer_executor.shutdown()
+
+        for layer in self.layer_order:
+            if isinstance(layer, Layer) and layer.active:
+                returns, layer_columns, buffer = layer.__init_returns__(
+                    len(df))
+                for name in layer.component_dict.keys():
+                    long_name = '{}:{}'.format(layer.name, name)
+                    if long_name in scores:
+                        buffer[:, layer_columns[name]] = scores[long_name]
+                layer_df = pd.DataFrame(buffer,
+                                        index=df.index,
+                                        columns=returns,
+                                        copy=False)
+                df = pd.concat([df, layer_df], axis=1)
         return df
 
     def predict_df(self, df, clear_df=False):
@@ -147,15 +147,65 @@ class Component(BaseComponent):
         """
         super(Component, self).fit_df()
         if self.active:
-            X = df.loc[:, self.attributes]
-            y = df.loc[:, self.label]
-            if self.weight is None:
-                self.clf = self.fit_func(X.values, y.values)
-            else:
-                sample_weight = df.loc[:, self.weight]
-                self.clf = self.clf.fit(X.values, y.values, sample_weight)
+            X, y, sample_weight = self.get_arrays(df)
+            self.fit_array(X, y, sample_weight)
         return self
 
+    def fit_array(self, X, y, sample_weight=None):
+        """Method to fit the component on numpy arrays.
+
+        Parameters
+        ----------
+        X : numpy.ndarray, shape=(n_samples, n_attributes)
+            Attributes in the order of 'attributes'.
+
+        y : numpy.ndarray, shape=(n_samples)
+            Label.
+
+        sample_weight : numpy.ndarray, shape=(n_samples) or None
+            Sample weights. Only used if the component has a weight.
+
+        Returns
+        -------
+        self : component.Component
+            Self.
+
+        """
+        if self.weight is None:
+            self.clf = self.fit_func(X, y)
+        else:
+            self.clf = self.fit_func(X, y, sample_weight)
+        return self
+
+    def get_arrays(self, df):
+        """Method to get the attributes, label and weight of a
+        dataframe as contiguous numpy arrays.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Dataframe containing all the features.
+
+        Returns
+        -------
+        X : numpy.ndarray, shape=(n_samples, n_attributes)
+            Attributes in the order of 'attributes'.
+
+        y : numpy.ndarray, shape=(n_samples)
+            Label.
+
+        sample_weight : numpy.ndarray, shape=(n_samples) or None
+            Sample weights or None if the component has no weight.
+
+        """
+        X = np.ascontiguousarray(df.loc[:, self.attributes].values)
+        y = df.loc[:, self.label].values
+        if self.weight is None:
+            sample_weight = None
+        else:
+            sample_weight = df.loc[:, self.weight].values
+        return X, y, sample_weight
+
     def predict_df(self, df):
         """Method to predict samples from a dataframe.
 
@@ -172,20 +222,33 @@ class Component(BaseComponent):
         """
         super(Component, self).predict_df()
         if self.active:
-            idx = df.index
-            X = df.loc[:, self.attributes]
-            return_clf = np.array(self.predict_func(X.values))
-            return_df = pd.DataFrame(columns=self.returns,
-                                     index=idx)
-            if len(self.returns) == 1:
-                return_df[self.returns[0]] = return_clf
-            else:
-                for i, name in enumerate(self.returns):
-                    return_df[name] = return_clf[:, i]
-            return return_df
+            X = df.loc[:, self.attributes].values
+            return pd.DataFrame(self.predict_array(X),
+                                columns=self.returns,
+                                index=df.index)
         else:
             return None
 
+    def predict_array(self, X):
+        """Method to predict samples from a numpy array without building
+        a dataframe of the scores.
+
+        Parameters
+        ----------
+        X : numpy.ndarray, shape=(n_samples, n_attributes)
+            Attributes in the order of 'attributes'.
+
+        Returns
+        -------
+        return_array : numpy.ndarray, shape=(n_samples, n_returns)
+            Scores with a column for each return.
+
+        """
+        return_clf = np.asarray(self.predict_func(X))
+        if len(self.returns) == 1:
+            return_clf = return_clf.reshape(len(X), 1)
+        return return_clf
+
     def get_needed_features(self):
         features = [att for att in self.attributes]
         features.append(self.label)
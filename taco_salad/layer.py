@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, division
-from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from fnmatch import fnmatch
 import logging
 
@@ -9,6 +9,68 @@ import pandas as pd
 import numpy as np
 
 from .component import BaseComponent
+from .utensils.shared_array import share_arrays, unlink_arrays
+
+
+def _fit_predict_fold(component, fold, train, test, X, y, sample_weight,
+                      return_component=False):
+    """Process pool task: fits a component on the train rows of the
+    inputs in shared memory and predicts the test rows.
+
+    Returns
+    -------
+    fold : int
+        Index of the fold.
+
+    predictions : numpy.ndarray, shape=(n_test, n_returns)
+        Scores of the test rows.
+
+    component : Component or None
+        The fitted component, if return_component is True.
+    """
+    shared_arrays = [train, test, X, y, sample_weight]
+    try:
+        train_idx = train.array
+        test_idx = test.array
+        if sample_weight is not None:
+            sample_weight = np.take(sample_weight.array, train_idx)
+        component.fit_array(np.take(X.array, train_idx, axis=0),
+                            np.take(y.array, train_idx),
+                            sample_weight)
+        predictions = component.predict_array(
+            np.take(X.array, test_idx, axis=0))
+    finally:
+        for shared_i in shared_arrays:
+            if shared_i is not None:
+                shared_i.close()
+    if not return_component:
+        component = None
+    return fold, predictions, component
+
+
+def _fit_shared(component, X, y, sample_weight):
+    """Process pool task: fits a component on all rows of the inputs in
+    shared memory and returns the fitted component.
+    """
+    shared_arrays = [X, y, sample_weight]
+    try:
+        if sample_weight is not None:
+            sample_weight = sample_weight.array
+        component.fit_array(X.array, y.array, sample_weight)
+    finally:
+        for shared_i in shared_arrays:
+            if shared_i is not None:
+                shared_i.close()
+    return component
+
+
+def _take_rows(data, idx, keys=None):
+    """Selects the rows idx (positions) of the arrays in data as
+    contiguous copies.
+    """
+    if keys is None:
+        keys = data.keys()
+    return {key: np.take(data[key], idx, axis=0) for key in keys}
 
 
 class BaseLayer(object):
@@ -72,6 +134,68 @@ class BaseLayer(object):
         assert self.active, 'Trying to fit an inactive layer!'
         logging.info('Fitting layer \'{}\'.'.format(self.name))
 
+    def cross_fit(self, data, inputs, folds, *args, **kwargs):
+        assert self.active, 'Trying to fit an inactive layer!'
+        for key in inputs.keys():
+            assert self.component_dict[key].active, \
+                'Trying to fit the inactive component {}!'.format(key)
+        logging.debug('Fitting components {} of layer \'{}\'.'.format(
+            ', '.join(inputs.keys()), self.name))
+
+    def __init_returns__(self, n_samples):
+        """Preallocates the buffer for the out-of-fold scores.
+
+        Returns
+        -------
+        returns : list of str
+            Names of the returns of all components.
+
+        columns : dict
+            Slice of the columns of each component in the buffer.
+
+        buffer : numpy.ndarray, shape=(n_samples, n_returns)
+            Buffer filled with NaN.
+        """
+        returns = []
+        columns = {}
+        for key, component in self.component_dict.items():
+            columns[key] = slice(len(returns),
+                                 len(returns) + len(component.returns))
+            returns.extend(component.returns)
+        buffer = np.full((n_samples, len(returns)), np.nan, dtype=self.dtype)
+        return returns, columns, buffer
+
+    def __get_inputs__(self, df):
+        """Extracts the features needed by the active components once as
+        numpy arrays. Components with the same attributes share the
+        attribute matrix.
+
+        Returns
+        -------
+        data : dict
+            Contiguous attribute matrices (keys: tuple of the attribute
+            names) and 1d arrays of the labels/weights (keys: names).
+
+        inputs : dict
+            Keys of (X, y, sample_weight) in data for each active
+            component. The key of sample_weight is None without a
+            weight.
+        """
+        data = {}
+        inputs = {}
+        for key, component in self.component_dict.items():
+            if not component.active:
+                continue
+            attributes = tuple(component.attributes)
+            if attributes not in data:
+                data[attributes] = np.ascontiguousarray(
+                    df.loc[:, list(attributes)].values)
+            for name in [component.label, component.weight]:
+                if name is not None and name not in data:
+                    data[name] = df.loc[:, name].values
+            inputs[key] = (attributes, component.label, component.weight)
+        return data, inputs
+
     def predict_df(self, *args, **kwargs):
         assert self.active, 'Trying to predict with an inactive layer!'
         logging.info('Predicting with layer \'{}\'.'.format(self.name))
@@ -107,6 +231,9 @@ class Layer(BaseLayer):
     comment : str, optional (default='')
         Commet for better documentation of the architecture.
 
+    dtype : numpy dtype, optional (default=numpy.float64)
+        Type of the scores returned by 'fit_df'.
+
     Attributes
     ----------
     name : str
@@ -121,10 +248,14 @@ class Layer(BaseLayer):
     n_components : int
         Number of components.
 
+    dtype : numpy dtype
+        Type of the scores returned by 'fit_df'.
+
     """
-    def __init__(self, name, comment=''):
+    def __init__(self, name, comment='', dtype=np.float64):
         super(Layer, self).__init__(name, comment=comment)
         self.active = True
+        self.dtype = dtype
 
     def activate(self):
         self.active = True
@@ -154,26 +285,75 @@ class Layer(BaseLayer):
 
         """
         super(Layer, self).fit_df()
-        returns = []
-        for _, comp in self.component_dict.items():
-            returns.extend(comp.returns)
-        new_df = pd.DataFrame(index=df.index, columns=returns)
-        for train, test in kfold.split(np.empty(df.shape)):
-            df_train = df.loc[train, :]
-            df_test = df.loc[test, :]
-            for key, component in self.component_dict.items():
-                if component.active:
-                    component.fit_df(df_train)
-                    comp_df = component.predict_df(df_test)
-                    return_names = component.returns
-                    new_df.loc[comp_df.index, return_names] = comp_df
-        if final_model:
-            for key, component in self.component_dict.items():
-                if component.active:
-                    component = component.fit_df(df)
+        data, inputs = self.__get_inputs__(df)
+        folds = list(kfold.split(np.empty(df.shape)))
+        returns, _, buffer = self.cross_fit(data,
+                                            inputs,
+                                            folds,
+                                            final_model=final_model)
+        return pd.DataFrame(buffer,
+                            index=df.index,
+                            columns=returns,
+                            copy=False)
+
+    def cross_fit(self, data, inputs, folds, final_model=False,
+                  executor=None):
+        """Method to get the out-of-fold scores of a selection of
+        components. Used by 'fit_df' for all active components and by
+        the 'dag' scheduler of TacoSalad for single components.
 
-                    self.component_dict[component.name] = component
-        return new_df
+        Parameters
+        ----------
+        data : dict
+            Attribute matrices and labels/weights (see __get_inputs__).
+
+        inputs : dict
+            Keys of (X, y, sample_weight) in data for each component
+            to fit.
+
+        folds : list of tuples
+            Positions of the train and test rows of each fold.
+
+        final_model : bool, optional (defaultFalse)
+            Whether the components are refittet on all samples, after
+            the x-validation is run to get scores for all samples.
+
+        executor : concurrent.futures.Executor, optional
+            Not used, the components are fitted in this process.
+
+        Returns
+        -------
+        returns : list of str
+            Names of the returns of all components of the layer.
+
+        columns : dict
+            Slice of the columns of each component in buffer.
+
+        buffer : numpy.ndarray, shape=(n_samples, n_returns)
+            Out-of-fold scores. NaN for the components not fitted.
+
+        """
+        super(Layer, self).cross_fit(data, inputs, folds)
+        n_samples = sum(len(test) for _, test in folds)
+        returns, columns, buffer = self.__init_returns__(n_samples)
+        attribute_keys = set(x_key for x_key, _, _ in inputs.values())
+        for train, test in folds:
+            data_train = _take_rows(data, train)
+            data_test = _take_rows(data, test, keys=attribute_keys)
+            for key, [x_key, y_key, w_key] in inputs.items():
+                component = self.component_dict[key]
+                component.fit_array(data_train[x_key],
+                                    data_train[y_key],
+                                    data_train.get(w_key))
+                buffer[test, columns[key]] = component.predict_array(
+                    data_test[x_key])
+            del data_train, data_test
+        if final_model:
+            for key, [x_key, y_key, w_key] in inputs.items():
+                self.component_dict[key].fit_array(data[x_key],
+                                                   data[y_key],
+                                                   data.get(w_key))
+        return returns, columns, buffer
 
     def predict_df(self, df):
         """Method to get the prediction of all the components.
@@ -223,6 +403,15 @@ class LayerParallel(Layer):
     comment : str, optional (default='')
         Commet for better documentation of the architecture.
 
+    dtype : numpy dtype, optional (default=numpy.float64)
+        Type of the scores returned by 'fit_df'.
+
+    keep_fold_models : bool, optional (default=False)
+        If True, the components fitted in each fold of 'fit_df' are
+        kept in 'fold_components'. Otherwise only the component of the
+        last fold is returned by the workers (installed as for Layer)
+        and the others are discarded in the workers.
+
     Attributes
     ----------
     name : str
@@ -243,6 +432,10 @@ class LayerParallel(Layer):
     n_components : int
         Number of components.
 
+    fold_components : dict
+        Lists of the components fitted in each fold for each component
+        name, if keep_fold_models is True.
+
     """
 
     def __init__(self,
@@ -250,22 +443,31 @@ class LayerParallel(Layer):
                  n_jobs,
                  predict_parallel=False,
                  fit_parallel=True,
-                 comment=''):
+                 comment='',
+                 dtype=np.float64,
+                 keep_fold_models=False):
         super(LayerParallel, self).__init__(name=name,
-                                            comment=comment)
+                                            comment=comment,
+                                            dtype=dtype)
         self.n_jobs = n_jobs
         self.fit_parallel = fit_parallel
         self.predict_parallel = predict_parallel
+        self.keep_fold_models = keep_fold_models
+        self.fold_components = {}
 
-    def fit_predict_single_component(self, component, df_train, df_test):
-        df_train = df_train
-        df_test = df_test
-        component = component.fit_df(df_train)
-        return component, component.predict_df(df_test)
-
-    def fit_df(self, df, kfold, final_model=False):
+    def fit_df(self, df, kfold, final_model=False, executor=None):
         """Method to fit all the components.
 
+        The inputs of the components and the indices of the folds are
+        placed in shared memory once. Each (fold, component) task only
+        transfers the component and the handles of the shared arrays
+        and returns the scores of the fold. The final refits on all
+        samples are submitted together with the folds and use the same
+        shared inputs. At most n_jobs tasks of the layer are in flight,
+        also in a larger pool shared with other layers. The results are
+        collected in the order of submission, so the fit is
+        deterministic.
+
         Parameters
         ----------
         df : pandas.DataFrame
@@ -278,52 +480,111 @@ class LayerParallel(Layer):
             Whether the layer is refittet on all samples, after the
             x-validation is run to get scores for all samples.
 
+        executor : concurrent.futures.ProcessPoolExecutor, optional
+            Pool used for the tasks, e.g. a pool shared by all layers.
+            If None, a pool with n_jobs processes is started. The layer
+            never uses more than n_jobs workers of the pool.
+
         Returns
         -------
         new_df : pandas.DataFrame
             Dataframe with the new scores.
 
         """
+        if not self.fit_parallel:
+            return super(LayerParallel, self).fit_df(df,
+                                                     kfold=kfold,
+                                                     final_model=final_model)
         super(Layer, self).fit_df()
-
-        if self.fit_parallel:
-            returns = []
-            for _, comp in self.component_dict.items():
-                returns.extend(comp.returns)
-            new_df = pd.DataFrame(index=df.index, columns=returns)
-            with ProcessPoolExecutor(max_workers=self.n_jobs) as executor:
-                futures = []
-                for train, test in kfold.split(np.empty(df.shape)):
-                    df_train = df.loc[train, :]
-                    df_test = df.loc[test, :]
-                    for key, component in self.component_dict.items():
-                        if component.active:
-                            sel_att = component.get_needed_features()
-                            futures.append(executor.submit(
-                                self.fit_predict_single_component,
-                                component=component,
-                                df_train=df_train.loc[:, sel_att],
-                                df_test=df_test.loc[:, sel_att]))
-            for future_i in as_completed(futures):
-                component, comp_df = future_i.result()
-                self.component_dict[component.name] = component
-                return_names = component.returns
-                new_df.loc[comp_df.index, return_names] = comp_df
+        data, inputs = self.__get_inputs__(df)
+        folds = list(kfold.split(np.empty(df.shape)))
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=self.n_jobs)
+        try:
+            returns, _, buffer = self.cross_fit(data,
+                                                inputs,
+                                                folds,
+                                                final_model=final_model,
+                                                executor=executor)
+        finally:
+            if own_executor:
+                executor.shutdown()
+        return pd.DataFrame(buffer,
+                            index=df.index,
+                            columns=returns,
+                            copy=False)
+
+    def cross_fit(self, data, inputs, folds, final_model=False,
+                  executor=None):
+        """Method to get the out-of-fold scores of a selection of
+        components with (fold, component) tasks in the executor. See
+        Layer.cross_fit for the parameters and returns. Without an
+        executor or for fit_parallel=False the components are fitted
+        in this process as for Layer.
+        """
+        if executor is None or not self.fit_parallel:
+            return super(LayerParallel, self).cross_fit(
+                data, inputs, folds, final_model=final_model)
+        super(Layer, self).cross_fit(data, inputs, folds)
+        n_samples = sum(len(test) for _, test in folds)
+        returns, columns, buffer = self.__init_returns__(n_samples)
+        keys = list(data.keys())
+        shared_data = dict(zip(keys, share_arrays(*[data[key]
+                                                    for key in keys])))
+        shared_folds = []
+        try:
+            for train, test in folds:
+                shared_folds.extend(share_arrays(train, test))
+            tasks = []
+            for fold, [train, test] in enumerate(folds):
+                is_last = fold == len(folds) - 1
+                for key, [x_key, y_key, w_key] in inputs.items():
+                    tasks.append((key, _fit_predict_fold, (
+                        self.component_dict[key],
+                        fold,
+                        shared_folds[2 * fold],
+                        shared_folds[2 * fold + 1],
+                        shared_data[x_key],
+                        shared_data[y_key],
+                        shared_data.get(w_key),
+                        self.keep_fold_models or is_last)))
             if final_model:
-                with ProcessPoolExecutor(max_workers=self.n_jobs) as executor:
-                    for key, component in self.component_dict.items():
-                        if component.active:
-                            sel_att = component.get_needed_features()
-                            component.fit_df(df.loc[:, sel_att])
-                    results = wait(futures)
-                for i, future_i in enumerate(results.done):
-                    component = future_i.result()
-                    self.component_dict[component.name] = component
-        else:
-            new_df = super(LayerParallel, self).fit_df(df,
-                                                       kfold=kfold,
-                                                       final_model=final_model)
-        return new_df
+                for key, [x_key, y_key, w_key] in inputs.items():
+                    tasks.append((key, _fit_shared, (
+                        self.component_dict[key],
+                        shared_data[x_key],
+                        shared_data[y_key],
+                        shared_data.get(w_key))))
+            futures = []
+            running = set()
+            for key, task, args in tasks:
+                if len(running) >= max(self.n_jobs, 1):
+                    _, running = wait(running, return_when=FIRST_COMPLETED)
+                future = executor.submit(task, *args)
+                running.add(future)
+                futures.append((key, future))
+            n_fold_tasks = len(folds) * len(inputs)
+            final_futures = futures[n_fold_tasks:]
+            futures = futures[:n_fold_tasks]
+            fold_components = {key: [] for key in inputs}
+            for key, future in futures:
+                fold, predictions, component = future.result()
+                buffer[folds[fold][1], columns[key]] = predictions
+                if component is not None:
+                    fold_components[key].append(component)
+            final_components = [(key, future.result())
+                                for key, future in final_futures]
+        finally:
+            unlink_arrays(list(shared_data.values()) + shared_folds)
+        for key, components in fold_components.items():
+            # Same state as after Layer.fit_df: fitted on the last fold
+            self.component_dict[key] = components[-1]
+        for key, component in final_components:
+            self.component_dict[key] = component
+        if self.keep_fold_models:
+            self.fold_components.update(fold_components)
+        return returns, columns, buffer
 
     def predict_df(self, df):
         """Method to get the prediction of all the components.
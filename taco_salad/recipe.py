@@ -303,7 +303,7 @@ class Recipe(object):
             raise KeyError('{} not found!'.format(long_name))
         component_dependencies = self.dependencies.loc[:, long_name]
         dependencies = set()
-        for unique_name, used in component_dependencies.iteritems():
+        for unique_name, used in component_dependencies.items():
             if used:
                 layer = self.ingredients.loc[unique_name, 'layer']
                 component = self.ingredients.loc[unique_name, 'component']
@@ -396,14 +396,14 @@ class Recipe(object):
             state_components = state_layers[1]
             state_layers = state_layers[0]
         if state_layers is not None:
-            for layer_i, state in state_layers.iteritems():
+            for layer_i, state in state_layers.items():
                 if state:
                     self.layer_dict[layer_i].activate()
                 else:
                     self.layer_dict[layer_i].deactivate()
 
         if state_components is not None:
-            for long_i, state in state_components.iteritems():
+            for long_i, state in state_components.items():
                 layer_i, comp_i = long_i.split(':')
                 if state:
                     self.layer_dict[layer_i][comp_i].activate()
@@ -448,7 +448,7 @@ class Recipe(object):
         component.deactivate()
         for unique_name in component_returns:
             dependcy_series = self.dependencies.loc[unique_name, :]
-            for long_name_i, used in dependcy_series.iteritems():
+            for long_name_i, used in dependcy_series.items():
                 if used:
                     self.deactivate_component(long_name=long_name_i)
 
@@ -460,7 +460,7 @@ class Recipe(object):
         component.activate()
         for unique_name in component_returns:
             dependcy_series = self.dependencies.loc[unique_name, :]
-            for long_name_i, used in dependcy_series.iteritems():
+            for long_name_i, used in dependcy_series.items():
                 if used:
                     self.activate_component(long_name=long_name_i)
 
@@ -472,7 +472,7 @@ class Recipe(object):
         unique_names = self.get('{}:*'.format(layer.name))
         for unique_name in unique_names.index:
             dependcy_series = self.dependencies.loc[unique_name, :]
-            for long_name_i, used in dependcy_series.iteritems():
+            for long_name_i, used in dependcy_series.items():
                 if used:
                     self.deactivate_component(long_name=long_name_i)
 
@@ -483,6 +483,6 @@ class Recipe(object):
         unique_names = self.get('{}:*'.format(layer.name))
         for unique_name in unique_names.index:
             dependcy_series = self.dependencies.loc[unique_name, :]
-            for long_name_i, used in dependcy_series.iteritems():
+            for long_name_i, used in dependcy_series.items():
                 if used:
                     self.deactivate_component(long_name=long_name_i)
@@ -1,11 +1,42 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, division
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from copy import copy, deepcopy
+import platform
+import time
 
 import numpy as np
 from . import criteria
-from .curve import CurveSliding, Curve
+from .curve import CurveSliding, Curve, CurveBank, reduce_curves  # noqa
+from .curve import fill_gaps, GAP_FILLING
+from . import curve_io
+from .grid import GridConfidenceCutter  # noqa
+from .search import find_best_cut, find_best_cuts, find_best_binned_cuts, \
+    find_best_cut_approx
+from .statistics import WindowHistograms, fill_histograms
+from ..utensils.shared_array import share_arrays, unlink_arrays
+
+
+def _determine_cut_values_shared(cutter, seed, X, y, sample_weight,
+                                 windows=None):
+    """Process pool task: determines the cut values of one bootstrap
+    with the inputs read from shared memory.
+    """
+    shared_arrays = [X, y, sample_weight]
+    if sample_weight is not None:
+        sample_weight = sample_weight.array
+    try:
+        return cutter.__determine_cut_values_mp__(
+            seed=seed,
+            X_full=X.array,
+            y_true_full=y.array,
+            sample_weight_full=sample_weight,
+            windows=windows)
+    finally:
+        for shared_i in shared_arrays:
+            if shared_i is not None:
+                shared_i.close()
 
 
 class ConfidenceCutter(object):
@@ -20,10 +51,36 @@ class ConfidenceCutter(object):
     n_steps : integer, optional (default=1000)
         Number of steps for the sliding window
 
+    window_placement : ['uniform', 'quantile'], optional
+        How the windows are placed, if no positions are provided
+        (default='uniform'):
+
+        uniform = n_steps windows of width window_size equally
+                  distributed between min(X_o) and max(X_o)
+        quantile = windows between weighted quantiles of X_o, so each
+                   window contains the same sum of sample weights and
+                   overlaps half of its neighbours. window_size is not
+                   used.
+
+    window_events : float or None, optional (default=None)
+        Sum of sample weights (number of events without weights) in
+        each window for window_placement='quantile'. n_steps is
+        derived from it. If None, n_steps windows are placed.
+
     n_bootstraps : integer (default=3)
         Number of bootstraps. The curve is determined on n_boostraps
         samples and averaged.
 
+    bootstrap_mode : ['index', 'multinomial', 'poisson'], optional
+        How the bootstrap samples are drawn (default='index'):
+
+        index = the sample is resampled with replacement and copied
+        multinomial = the number of draws of each event (same
+            distribution as 'index') is multiplied to the sample
+            weights, nothing is copied
+        poisson = like 'multinomial', but with independent Poisson(1)
+            distributed multiplicities
+
     criteria : callable, optional (default=purity_criteria(threshold=0.99))
         Funtion criteria(y_true, y_pred, position, sample_weights=None)
         return True/False if the criteria is fulfilled.
@@ -41,9 +98,77 @@ class ConfidenceCutter(object):
     n_jobs : int, optinal (default=0)
         Max number of jobs used for the bootstrap loop.
 
+    batch_bootstraps : boolean, optional (default=False)
+        If True, all bootstraps are evaluated in a single pass over the
+        windows. The bootstraps are represented by their multiplicity
+        counts (see bootstrap_mode, 'index' is treated as
+        'multinomial') stacked into a (n_samples, n_bootstraps) matrix
+        and the cuts of all bootstraps are searched at once for each
+        window. n_jobs is not used in this mode.
+
+    backend : ['thread', 'process'], optional (default='thread')
+        Executor used for the bootstrap loop if n_jobs > 1. The
+        'process' backend places X, y and sample_weight in shared
+        memory, so the workers don't copy them. It needs a picklable
+        criteria (e.g. no lambda thresholds).
+
+    n_conf_bins : int, optional (default=1000)
+        Number of confidence bins of the histograms used by
+        partial_fit/fit_stream.
+
+    conf_range : tuple, optional (default=(0., 1.))
+        Range of the confidence bins used by partial_fit/fit_stream.
+
     curve_file : str, optional (default=None)
         File from which a fitted cut curve should be loaded.
 
+    combination_mode : ['overlapping', 'single'], optional
+        How the cuts of the windows are combined to the cut curve
+        (default='overlapping'). See curve.CurveSliding.
+
+    occupancy_weighting : boolean, optional (default=False)
+        If True, the cuts of overlapping windows are averaged weighted
+        by the sum of the sample weights in each window.
+
+    curve_lookup_size : int or None, optional (default=None)
+        If not None, the cut curve is evaluated from a lookup table
+        with curve_lookup_size intervals instead of exactly, which
+        speeds up predict. See curve.Curve.
+
+    gap_filling : ['linear', 'nearest', 'hold', 'spline'], optional
+        How the cuts of windows without a valid cut are filled from the
+        neighbouring windows (default='linear'). See curve.fill_gaps.
+
+    gap_smoothing : float or None, optional (default=None)
+        Smoothing factor of gap_filling='spline'. See curve.fill_gaps.
+
+    incremental : boolean, optional (default=False)
+        If True, fit keeps the sorted events, so 'update' can add new
+        events and refit only the windows overlapping them.
+
+    cut_tolerance : float, optional (default=1e-3)
+        All unique confidences of a window are tested as cuts. Cuts with
+        a criteria value within cut_tolerance of the best value are
+        treated as equally good and the lowest of them is used, e.g. the
+        first crossing of a purity threshold. The tolerance is absolute,
+        so it depends on the scale of the criteria. With 0. the cut with
+        the minimal criteria value is used.
+
+    approx_bins : int or None, optional (default=None)
+        If None, the cuts are searched exactly. Otherwise windows with
+        more than approx_bins examples are searched approximately: the
+        confidences are binned into approx_bins bins and only the lower
+        bin edges are tested as cuts. The examples of a window don't
+        have to be sorted, which is much faster for large windows.
+        The width of the bin starting at the cut is stored for each
+        cut in cut_opts.cut_errors (0 for exactly searched windows).
+
+    approx_binning : ['quantile', 'uniform'], optional
+        Binning used if approx_bins is not None (default='quantile'):
+
+        quantile = bins containing the same number of examples
+        uniform = bins of equal width between the min/max confidence
+
     random_state: None, int or RandomState
         If int, random_state is the seed used by the random number generator;
         If RandomState instance, random_state is the random number generator;
@@ -69,25 +194,58 @@ class ConfidenceCutter(object):
     def __init__(self,
                  n_steps=1000,
                  window_size=0.1,
+                 window_placement='uniform',
+                 window_events=None,
                  n_bootstraps=3,
+                 bootstrap_mode='index',
                  criteria=criteria.purity_criteria(threshold=0.99),
                  positions=None,
                  conf_index=0,
                  n_jobs=0,
+                 batch_bootstraps=False,
+                 backend='thread',
+                 n_conf_bins=1000,
+                 conf_range=(0., 1.),
                  curve_file=None,
                  combination_mode='overlapping',
+                 occupancy_weighting=False,
+                 curve_lookup_size=None,
+                 gap_filling='linear',
+                 gap_smoothing=None,
+                 incremental=False,
                  min_examples=10,
+                 cut_tolerance=1e-3,
+                 approx_bins=None,
+                 approx_binning='quantile',
                  random_state=None):
         self.cut_opts = self.CutOpts(n_steps=n_steps,
                                      window_size=window_size,
+                                     window_placement=window_placement,
+                                     window_events=window_events,
                                      n_bootstraps=n_bootstraps,
+                                     bootstrap_mode=bootstrap_mode,
                                      positions=positions,
                                      combination_mode=combination_mode,
-                                     min_examples=min_examples)
+                                     occupancy_weighting=occupancy_weighting,
+                                     curve_lookup_size=curve_lookup_size,
+                                     gap_filling=gap_filling,
+                                     gap_smoothing=gap_smoothing,
+                                     min_examples=min_examples,
+                                     cut_tolerance=cut_tolerance,
+                                     approx_bins=approx_bins,
+                                     approx_binning=approx_binning)
 
         self.criteria = criteria
         self.conf_index = conf_index
         self.n_jobs = n_jobs
+        self.batch_bootstraps = batch_bootstraps
+        self.backend = backend
+        self.n_conf_bins = n_conf_bins
+        self.conf_range = conf_range
+        self.incremental = incremental
+        self.events = None
+        self.statistics = None
+        self.fit_info = None
         if curve_file is not None:
             self.load_curve(curve_file)
         if not isinstance(random_state, np.random.RandomState):
@@ -95,37 +253,100 @@ class ConfidenceCutter(object):
         self.random_state = random_state
 
     def save_curve(self, filename):
-        """Function to save a fitted curve. 'numpy.savez' is used to
-        store the curve. If the filename doesn't end with '.npz' it is
-        added.
+        """Function to save a fitted curve.
+
+        If the filename ends with '.tcurve' the binary curve format
+        (see curve_io) is used. It stores the curve, the windows, the
+        options of the cutter, a description of the criteria and the
+        provenance of the fit, and can be memory-mapped when loading.
+        Otherwise 'numpy.savez' is used to store only the curve. If the
+        filename doesn't end with '.npz' it is added.
 
         Parameters
         ----------
         filename: str
             Path where the curve is saved.
+
+        Returns
+        -------
+        filename: str
+            Path of the saved file.
         """
         cut_curve = self.cut_opts.curve
+        if filename.endswith(curve_io.CURVE_EXTENSION):
+            return curve_io.write_curve(filename,
+                                        self.__get_curve_arrays__(),
+                                        self.__get_curve_header__())
         np.savez(filename,
                  x=cut_curve.x,
                  y=cut_curve.y,
                  conf_index=self.conf_index)
         return filename
 
-    def load_curve(self, filename):
+    def load_curve(self, filename, mmap=True):
         """Function to load a fitted curve.
 
         Parameters
         ----------
         filename: str
             Path from which the curve is loaded.
+
+        mmap : boolean, optional (default=True)
+            If True, the arrays of a curve in the binary format are
+            memory-mapped instead of read into memory.
         """
+        for filename_i in [filename, filename + curve_io.CURVE_EXTENSION]:
+            if curve_io.is_curve_file(filename_i):
+                header, arrays = curve_io.read_curve(filename_i, mmap=mmap)
+                self.__set_from_curve_file__(header, arrays)
+                return
         if not filename.endswith('.npz'):
             filename += '.npz'
         npzfile = np.load(filename)
-        curve = Curve(npzfile['x'], npzfile['y'])
+        curve = Curve(npzfile['x'],
+                      npzfile['y'],
+                      lookup_size=self.cut_opts.curve_lookup_size)
         self.cut_opts.curve = curve
         self.conf_index = int(npzfile['conf_index'])
 
+    def __get_curve_arrays__(self):
+        cut_opts = self.cut_opts
+        arrays = curve_io.curve_arrays(cut_opts.curve)
+        for key in ['edges', 'positions', 'cut_errors', 'occupancy']:
+            value = getattr(cut_opts, key)
+            if value is not None:
+                arrays[key] = value
+        return arrays
+
+    def __get_curve_header__(self):
+        cut_opts = self.cut_opts
+        options = ['n_steps', 'window_size', 'window_placement',
+                   'window_events', 'n_bootstraps',
+                   'bootstrap_mode', 'curve_type', 'combination_mode',
+                   'occupancy_weighting', 'curve_lookup_size',
+                   'gap_filling', 'gap_smoothing', 'min_examples',
+                   'cut_tolerance', 'approx_bins', 'approx_binning']
+        return {'mode': cut_opts.curve.mode,
+                'lookup_size': getattr(cut_opts.curve, 'lookup_size', None),
+                'conf_index': self.conf_index,
+                'cut_opts': {key: getattr(cut_opts, key) for key in options},
+                'criteria': repr(self.criteria),
+                'provenance': {
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'fit': self.fit_info}}
+
+    def __set_from_curve_file__(self, header, arrays):
+        cut_opts = self.cut_opts
+        for key, value in header.get('cut_opts', {}).items():
+            setattr(cut_opts, key, value)
+        for key in ['edges', 'positions', 'cut_errors', 'occupancy']:
+            setattr(cut_opts, key, arrays.get(key))
+        cut_opts.curve = curve_io.curve_from_file(header, arrays)
+        self.conf_index = int(header['conf_index'])
+        self.fit_info = header.get('provenance', {}).get('fit')
+
     def init_curve(self, x, y, conf_index=0):
         """Function to init a fitted curve with x, y.
 
@@ -139,7 +360,7 @@ class ConfidenceCutter(object):
             Index of the confidence_value
 
         """
-        curve = Curve(x, y)
+        curve = Curve(x, y, lookup_size=self.cut_opts.curve_lookup_size)
         self.cut_opts.curve = curve
         self.conf_index = int(conf_index)
 
@@ -196,23 +417,55 @@ class ConfidenceCutter(object):
         def __init__(self,
                      n_steps=1000,
                      window_size=0.1,
+                     window_placement='uniform',
+                     window_events=None,
                      n_bootstraps=10,
+                     bootstrap_mode='index',
                      positions=None,
                      curve_type='mid',
                      combination_mode='overlapping',
-                     min_examples=10):
+                     occupancy_weighting=False,
+                     curve_lookup_size=None,
+                     gap_filling='linear',
+                     gap_smoothing=None,
+                     min_examples=10,
+                     cut_tolerance=1e-3,
+                     approx_bins=None,
+                     approx_binning='quantile'):
             if positions is not None:
-                self.positions = positions
-                self.n_steps = len(self.positions)
+                positions = np.asarray(positions, dtype=float)
+                self.n_steps = len(positions)
             else:
                 self.n_steps = n_steps
             self.n_bootstraps = n_bootstraps
+            assert bootstrap_mode in ['index', 'multinomial', 'poisson'], \
+                'Invalid bootstrap_mode [\'index\', \'multinomial\', ' \
+                '\'poisson\']'
+            self.bootstrap_mode = bootstrap_mode
             self.window_size = window_size
+            assert window_placement in ['uniform', 'quantile'], \
+                'Invalid window_placement [\'uniform\', \'quantile\']'
+            self.window_placement = window_placement
+            self.window_events = window_events
             self.edges = None
             self.positions = positions
             self.curve_type = curve_type
             self.combination_mode = combination_mode
+            self.occupancy_weighting = occupancy_weighting
+            self.curve_lookup_size = curve_lookup_size
+            assert gap_filling in GAP_FILLING, \
+                'Invalid gap_filling {}'.format(GAP_FILLING)
+            self.gap_filling = gap_filling
+            self.gap_smoothing = gap_smoothing
+            self.occupancy = None
             self.min_examples = min_examples
+            self.cut_tolerance = cut_tolerance
+            self.window_cuts = None
+            assert approx_binning in ['quantile', 'uniform'], \
+                'Invalid approx_binning [\'quantile\', \'uniform\']'
+            self.approx_bins = approx_bins
+            self.approx_binning = approx_binning
+            self.cut_errors = None
             self.curve = None
 
         def init_sliding_windows(self, X_o=None, sample_weight=None):
@@ -222,7 +475,8 @@ class ConfidenceCutter(object):
             of all the different windows. If positions were provided in
             the __init__ method, those are used to determine the edges.
             If not the windows are equally distributed between min(X_o)
-            and max(X_o). When the edges are set, the positions are
+            and max(X_o) or placed at weighted quantiles of X_o (see
+            window_placement). When the edges are set, the positions are
             evaluated according to the position_type set in the
             constructor.
 
@@ -245,12 +499,18 @@ class ConfidenceCutter(object):
                 Returns positions corresponding to the sliding windows.
                 See Paremeters positions_type for more infos.
             """
+            if self.window_placement == 'quantile' and \
+                    self.edges is not None:
+                # Keep the windows placed by an earlier call
+                return
             h_width = self.window_size / 2.
             if self.positions is None:
                 assert X_o is not None, 'If not positions are provided, the ' \
                                         'the sliding windows has to be '\
                                         'initiated with data (X_0 != None)'
-
+                if self.window_placement == 'quantile':
+                    self.__init_quantile_windows__(X_o, sample_weight)
+                    return
                 min_e = np.min(X_o)
                 max_e = np.max(X_o)
                 self.positions = np.linspace(min_e + h_width,
@@ -260,6 +520,108 @@ class ConfidenceCutter(object):
             self.edges[:, 0] = self.positions - h_width
             self.edges[:, 1] = self.positions + h_width
 
+        def __init_quantile_windows__(self, X_o, sample_weight=None):
+            """Places the windows between weighted quantiles of X_o.
+            Window i spans the quantiles i / (n_steps + 1) to
+            (i + 2) / (n_steps + 1) and is positioned at the quantile
+            (i + 1) / (n_steps + 1). Quantiles collapsing onto the same
+            value (ties in X_o) are merged, so n_steps can be smaller
+            than requested and no window has zero width.
+            """
+            X_o = np.asarray(X_o, dtype=float)
+            order = np.argsort(X_o, kind='mergesort')
+            X_o_sorted = X_o[order]
+            if sample_weight is None:
+                cum_weights = np.arange(1., len(X_o) + 1.)
+            else:
+                cum_weights = np.cumsum(
+                    np.asarray(sample_weight, dtype=float)[order])
+            total = cum_weights[-1]
+            if self.window_events is not None:
+                self.n_steps = max(
+                    int(round(2. * total / self.window_events)) - 1, 1)
+            fractions = np.arange(self.n_steps + 2) / (self.n_steps + 1.)
+            idx = np.searchsorted(cum_weights, fractions * total)
+            quantiles = X_o_sorted[np.clip(idx, 0, len(X_o) - 1)]
+            quantiles[0] = X_o_sorted[0]
+            # Upper edges are exclusive
+            quantiles[-1] = np.nextafter(X_o_sorted[-1], np.inf)
+            quantiles = np.unique(quantiles)
+            if len(quantiles) < 3:
+                # Single X_o value: one window positioned at it
+                quantiles = quantiles[[0, 0, -1]]
+            self.n_steps = len(quantiles) - 2
+            self.positions = quantiles[1:-1]
+            self.edges = np.zeros((self.n_steps, 2))
+            self.edges[:, 0] = quantiles[:-2]
+            self.edges[:, 1] = quantiles[2:]
+
+        def sort_events(self, X_o):
+            """Returns the order sorting the events by X_o. The order
+            is stable, so bootstrap indices applied to the sorted
+            events keep them sorted, if the indices are sorted.
+
+            Parameters
+            ----------
+            X_o : array-like, shape=(n_samples)
+                1d array with the X_o values.
+
+            Returns
+            -------
+            order : array of shape=(n_samples)
+                Indices sorting X_o.
+            """
+            return np.argsort(X_o, kind='mergesort')
+
+        def get_window_slices(self, X_o_sorted):
+            """Determines the events in each sliding window. Because the
+            events are sorted by X_o, each window is a contiguous slice
+            of the events, found by a binary search of the edges.
+
+            Parameters
+            ----------
+            X_o_sorted : array-like, shape=(n_samples)
+                1d array with the sorted X_o values.
+
+            Returns
+            -------
+            slices : array of shape=(n_steps, 2)
+                Start and stop index of the events in each window.
+                An event belongs to a window if lower <= X_o < upper.
+            """
+            slices = np.zeros((self.n_steps, 2), dtype=int)
+            slices[:, 0] = np.searchsorted(X_o_sorted,
+                                           self.edges[:, 0],
+                                           side='left')
+            slices[:, 1] = np.searchsorted(X_o_sorted,
+                                           self.edges[:, 1],
+                                           side='left')
+            return slices
+
+        def get_occupancy(self, slices, sample_weight=None):
+            """Sums the sample weights of the events in each window.
+
+            Parameters
+            ----------
+            slices : array of shape=(n_steps, 2)
+                Start and stop index of the events in each window (see
+                get_window_slices).
+
+            sample_weight : array-like, shape=(n_samples) or None
+                Sample weights of the sorted events. If None, the
+                number of events is returned.
+
+            Returns
+            -------
+            occupancy : array of shape=(n_steps)
+                Sum of the weights in each window.
+            """
+            if sample_weight is None:
+                return np.array(slices[:, 1] - slices[:, 0], dtype=float)
+            cumsum = np.zeros(len(sample_weight) + 1)
+            np.cumsum(sample_weight, out=cumsum[1:])
+            return cumsum[slices[:, 1]] - cumsum[slices[:, 0]]
+
         def generate_cut_curve(self, cut_values):
             """Evaluating all cut values and edges.
 
@@ -278,39 +640,77 @@ class ConfidenceCutter(object):
             curve_values : 1-d array
                 Values defining the final cut curve
             """
-            if self.n_bootstraps > 0:
+            if np.ndim(cut_values) > 1:
                 cut_values = np.mean(cut_values, axis=1)
+            window_weights = None
+            if self.occupancy_weighting:
+                window_weights = self.occupancy
             self.curve = CurveSliding(self.edges,
                                       cut_values,
-                                      combination_mode=self.combination_mode)
+                                      combination_mode=self.combination_mode,
+                                      window_weights=window_weights,
+                                      lookup_size=self.curve_lookup_size)
             return self.curve
 
-    def predict(self, X):
+    def predict(self, X, out=None, dtype=None, chunk_size=65536):
         """Predict class for X.
-        The predicted class of an input sample is a vote by the trees in
-        the forest, weighted by their probability estimates. That is,
-        the predicted class is the one with highest mean probability
-        estimate across the trees.
+        An example is predicted as positive (1) if its confidence is
+        greater or equal than the cut curve at its X_o.
+        The examples are processed in chunks of chunk_size examples,
+        so only chunk sized temporary arrays are allocated. If n_jobs
+        > 1, the chunks are processed by a thread pool.
+
         Parameters
         ----------
         X : array-like shape=(n_samples, 2)
             The input samples. With the confidence at index 'conf_index'
             (default=0) and X_o as the other index.
+
+        out : array, shape=(n_samples), optional
+            Array the predicted classes are written to.
+
+        dtype : numpy dtype, optional
+            Type of the returned array, e.g. bool or np.uint8. If None,
+            the type of 'out' or int is used.
+
+        chunk_size : int, optional (default=65536)
+            Number of examples processed at once.
+
         Returns
         -------
         y_pred : array of shape = [n_samples]
             The predicted classes.
         """
-        if self.conf_index == 1:
-            new_X = np.zeros_like(X)
-            new_X[:, 1] = X[:, 0]
-            new_X[:, 0] = X[:, 1]
-            X = new_X
-        X_o = X[:, 1]
-        X_c = X[:, 0]
-        thresholds = self.cut_opts.curve(X_o)
-        y_pred = np.array(X_c >= thresholds, dtype=int)
-        return y_pred
+        X = np.asarray(X)
+        X_c = X[:, self.conf_index]
+        X_o = X[:, 1 - self.conf_index]
+        n_samples = X.shape[0]
+        if out is None:
+            if dtype is None:
+                dtype = int
+            out = np.empty(n_samples, dtype=dtype)
+        elif out.shape != (n_samples,):
+            raise ValueError('\'out\' must have the shape (n_samples,)')
+        elif dtype is not None and np.dtype(dtype) != out.dtype:
+            raise ValueError('\'dtype\' and the type of \'out\' differ')
+        curve = self.cut_opts.curve
+
+        def predict_chunk(start):
+            stop = start + chunk_size
+            np.greater_equal(X_c[start:stop],
+                             curve(X_o[start:stop]),
+                             out=out[start:stop],
+                             casting='unsafe')
+
+        chunk_starts = range(0, n_samples, chunk_size)
+        if self.n_jobs > 1 and n_samples > chunk_size:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                # list() re-raises exceptions of the workers
+                list(executor.map(predict_chunk, chunk_starts))
+        else:
+            for start in chunk_starts:
+                predict_chunk(start)
+        return out
 
     def fit(self, X, y, sample_weight=None):
         """Fit estimator.
@@ -339,338 +739,724 @@ class ConfidenceCutter(object):
             assert len(y) == len(sample_weight), 'weights and y need the' \
                 'same length'
 
-        if self.conf_index == 1:
-            new_X = np.zeros_like(X)
-            new_X[:, 1] = X[:, 0]
-            new_X[:, 0] = X[:, 1]
-            X = new_X
-
-        assert len(np.unique(X[:, 0])) >= 5, 'Less than five different ' \
+        self.statistics = None
+        X_c = X[:, self.conf_index]
+        X_o = X[:, 1 - self.conf_index]
+        assert len(np.unique(X_c)) >= 5, 'Less than five different ' \
             ' confidence values!'
         n_events = X.shape[0]
-        self.cut_opts.init_sliding_windows(X[:, 1], sample_weight)
+        self.cut_opts.init_sliding_windows(X_o, sample_weight)
+        order = self.cut_opts.sort_events(X_o)
+        X = np.empty((n_events, 2))
+        X[:, 0] = X_c[order]
+        X[:, 1] = X_o[order]
+        y = np.asarray(y)[order]
+        if sample_weight is not None:
+            sample_weight = np.asarray(sample_weight)[order]
+        if self.cut_opts.occupancy_weighting:
+            self.cut_opts.occupancy = self.cut_opts.get_occupancy(
+                self.cut_opts.get_window_slices(X[:, 1]), sample_weight)
+        self.events = None
+        self.__fit_windows__(X, y, sample_weight)
+        if self.incremental:
+            self.events = (X, y, sample_weight)
+        if sample_weight is None:
+            sum_weights = float(n_events)
+        else:
+            sum_weights = float(np.sum(sample_weight))
+        self.fit_info = {'method': 'fit',
+                         'n_events': n_events,
+                         'sum_weights': sum_weights,
+                         'n_bootstraps': self.cut_opts.n_bootstraps}
+        return self
+
+    def update(self, X, y, sample_weight=None):
+        """Adds events to a fitted estimator and refits only the windows
+        overlapping the X_o range of the new events. The windows are
+        not moved.
+
+        After fit with incremental=True, the new events are merged into
+        the kept events (same order as a fit on all events) and the
+        windows are refitted with new bootstraps. The merge copies all
+        kept events, so each update costs O(n_total) memory traffic
+        besides the refit; for many small updates partial_fit is
+        cheaper. After partial_fit, fit_stream or fit_statistics, the
+        events are added to the histograms (see partial_fit).
+
+        Parameters
+        ----------
+        X : array-like shape=(n_samples, 2)
+            The new samples. With the confidence at index 'conf_index'
+            (default=0) and X_o as the other index.
+
+        y : array-like, shape=(n_samples)
+            The target values (class labels in classification,
+            possible_classed=[0, 1]).
+
+        sample_weight : array-like, shape=(n_samples) or None
+            Sample weights. If None, then samples are equally weighted.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        if self.statistics is not None:
+            return self.partial_fit(X, y, sample_weight)
+        if self.events is None:
+            raise RuntimeError('update needs a previous fit with '
+                               'incremental=True or a fit from '
+                               'histograms (partial_fit/fit_stream)!')
+        X_o, X_c, y, sample_weight = self.__split_chunk__(X, y,
+                                                          sample_weight)
+        if len(y) == 0:
+            return self
+        X_full, y_full, sample_weight_full = self.events
+        n_old = len(y_full)
+        order = self.cut_opts.sort_events(X_o)
+        X_new = np.empty((len(order), 2))
+        X_new[:, 0] = X_c[order]
+        X_new[:, 1] = X_o[order]
+        # Inserting after equal X_o gives the order of a stable sort
+        # of the old events followed by the new events
+        idx = np.searchsorted(X_full[:, 1], X_new[:, 1], side='right')
+        X_full = np.insert(X_full, idx, X_new, axis=0)
+        y_full = np.insert(y_full, idx, np.asarray(y)[order])
+        if sample_weight is not None or sample_weight_full is not None:
+            if sample_weight is None:
+                sample_weight = np.ones(len(order))
+            if sample_weight_full is None:
+                sample_weight_full = np.ones(n_old)
+            sample_weight_full = np.insert(
+                sample_weight_full, idx, np.asarray(sample_weight)[order])
+
+        edges = self.cut_opts.edges
+        windows = np.where(np.logical_and(edges[:, 0] <= X_new[-1, 1],
+                                          edges[:, 1] > X_new[0, 1]))[0]
+        if self.cut_opts.occupancy_weighting:
+            self.cut_opts.occupancy = self.cut_opts.get_occupancy(
+                self.cut_opts.get_window_slices(X_full[:, 1]),
+                sample_weight_full)
+        if len(windows) > 0:
+            self.__fit_windows__(X_full, y_full, sample_weight_full,
+                                 windows=windows)
+        elif self.cut_opts.occupancy_weighting:
+            self.__generate_curve_from_window_cuts__()
+        self.events = (X_full, y_full, sample_weight_full)
+        if sample_weight_full is None:
+            sum_weights = float(len(y_full))
+        else:
+            sum_weights = float(np.sum(sample_weight_full))
+        self.fit_info = {'method': 'fit',
+                         'n_events': len(y_full),
+                         'sum_weights': sum_weights,
+                         'n_bootstraps': self.cut_opts.n_bootstraps}
+        return self
+
+    def __fit_windows__(self, X, y, sample_weight, windows=None):
+        """Determines the cuts of all windows or the windows with the
+        indices 'windows' and generates the cut curve.
+        """
         n_bootstraps = self.cut_opts.n_bootstraps
         if n_bootstraps is None or n_bootstraps <= 0:
-            cut_values = self.__determine_cut_values_mp__(
-                idx=None,
+            cut_values, cut_errors = self.__determine_cut_values_mp__(
+                seed=None,
                 X_full=X,
-                y_full=y,
-                sample_weight_full=sample_weight)
+                y_true_full=y,
+                sample_weight_full=sample_weight,
+                windows=windows)
         else:
-            idx_bootstraps = []
-            cut_values = np.zeros((len(self.cut_opts.positions),
-                                   n_bootstraps))
-            for i in range(n_bootstraps):
-                bootstrap = self.random_state.choice(
-                    n_events, n_events, replace=True)
-                idx_bootstraps.append(np.sort(bootstrap))
-            if self.n_jobs > 1:
-                n_jobs = min(self.n_jobs, n_bootstraps)
-                import time
-                from concurrent.futures import ThreadPoolExecutor
-                with ThreadPoolExecutor(max_workers=n_jobs) as executor:
-
-                    def future_callback(future):
-                        if not future.cancelled():
-                            i = future_callback.finished
-                            cut_values[:, i] = future.result()
-                        else:
-                            raise RuntimeError('Subprocess crashed!')
-                        future_callback.finished += 1
-                        future_callback.running -= 1
-
-                    future_callback.running = 0
-                    future_callback.finished = 0
-
-                    for bootstrap in idx_bootstraps:
-                        future = executor.submit(
-                            self.__determine_cut_values_mp__,
-                            idx=bootstrap,
-                            X_full=X,
-                            y_true_full=y,
-                            sample_weight_full=sample_weight)
-
-                        future.add_done_callback(future_callback)
-                        future_callback.running += 1
-                        while True:
-                            if future_callback.running < n_jobs:
-                                break
-                            else:
-                                time.sleep(1)
-                    while future_callback.finished < n_bootstraps:
-                        time.sleep(1)
+            if windows is None:
+                n_windows = len(self.cut_opts.positions)
             else:
-                for i, bootstrap in enumerate(idx_bootstraps):
-                    cut_values[:, i] = self.__determine_cut_values_mp__(
-                        idx=bootstrap,
-                        X_full=X,
-                        y_true_full=y,
-                        sample_weight_full=sample_weight)
+                n_windows = len(windows)
+            cut_values = np.zeros((n_windows, n_bootstraps))
+            cut_errors = np.zeros_like(cut_values)
+            seeds = self.random_state.randint(np.iinfo(np.int32).max,
+                                              size=n_bootstraps)
+            if self.batch_bootstraps:
+                cut_values_batch, cut_errors_batch = \
+                    self.__determine_cut_values_batched__(
+                        seeds, X, y, sample_weight, windows=windows)
+                results = zip(cut_values_batch.T, cut_errors_batch.T)
+            elif self.n_jobs > 1:
+                results = self.__determine_cut_values_parallel__(
+                    seeds, X, y, sample_weight, windows=windows)
+            else:
+                results = [self.__determine_cut_values_mp__(
+                    seed=seed,
+                    X_full=X,
+                    y_true_full=y,
+                    sample_weight_full=sample_weight,
+                    windows=windows) for seed in seeds]
+            for i, [cut_values_i, cut_errors_i] in enumerate(results):
+                cut_values[:, i] = cut_values_i
+                cut_errors[:, i] = cut_errors_i
+        if windows is None:
+            self.cut_opts.window_cuts = cut_values
+            self.cut_opts.cut_errors = cut_errors
+        else:
+            self.cut_opts.window_cuts[windows] = cut_values
+            self.cut_opts.cut_errors[windows] = cut_errors
+        self.__generate_curve_from_window_cuts__()
+
+    def __generate_curve_from_window_cuts__(self):
+        cut_values = self.__fill_cut_values__(self.cut_opts.window_cuts)
         self.cut_opts.generate_cut_curve(cut_values)
+
+    def partial_fit(self, X, y, sample_weight=None, X_o_range=None):
+        """Fit estimator on a chunk of the data.
+
+        The chunk is added to weighted confidence histograms of the
+        signal and background for each window (see
+        statistics.WindowHistograms) and the cut curve is derived from
+        the accumulated histograms. The cuts are the lower edges of
+        'n_conf_bins' bins in 'conf_range'. Bootstraps are not used.
+        After the first call, only the windows overlapping the X_o
+        range of the chunk are refitted.
+
+        Parameters
+        ----------
+        X : array-like shape=(n_samples, 2)
+            The input samples. With the confidence at index 'conf_index'
+            (default=0) and X_o as the other index.
+
+        y : array-like, shape=(n_samples)
+            The target values (class labels in classification,
+            possible_classed=[0, 1]).
+
+        sample_weight : array-like, shape=(n_samples) or None
+            Sample weights. If None, then samples are equally weighted.
+
+        X_o_range : tuple (min, max) or None
+            Range of X_o used to place the windows at the first call,
+            if no positions were provided. Later calls ignore it.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        refit_all = self.statistics is None or \
+            self.cut_opts.window_cuts is None or \
+            self.fit_info is None or \
+            self.fit_info['method'] != 'statistics'
+        self.__fill_statistics__(X, y, sample_weight, X_o_range)
+        windows = None
+        if not refit_all:
+            # Only the windows containing new events changed
+            X_o = np.asarray(X)[:, 1 - self.conf_index]
+            if len(X_o) == 0:
+                return self
+            edges = self.cut_opts.edges
+            windows = np.where(np.logical_and(
+                edges[:, 0] <= np.max(X_o),
+                edges[:, 1] > np.min(X_o)))[0]
+            if len(windows) == 0:
+                return self
+        self.__generate_curve_from_statistics__(windows)
         return self
 
-    def __find_best_cut__(self, i, lower, upper, position,
-                          X, y_true, sample_weight, n_points=10):
-        X_o = X[:, 1]
-        X_c = X[:, 0]
-        idx = np.logical_and(X_o >= lower, X_o < upper)
-        confidence_i = X_c[idx]
-        y_true_i = y_true[idx]
-        weights_i = None
-        if sample_weight is not None:
-            weights_i = sample_weight[idx]
-
-        possible_cuts = np.sort(np.unique(confidence_i))
-        if len(possible_cuts) <= self.cut_opts.min_examples:
-            return np.nan
-
-        def wrapped_decision_func(cut):
-            y_pred_i_j = np.array(confidence_i >= cut, dtype=int)
-            return self.criteria(y_true_i,
-                                 y_pred_i_j,
-                                 position,
-                                 sample_weights=weights_i)
-        cut_value = self.__find_best_cut_inner__(wrapped_decision_func,
-                                                 possible_cuts,
-                                                 n_points=n_points)
-
-        return cut_value
-
-    def __find_best_cut_inner__(self, eval_func, conf, n_points=100):
-        n_confs = len(conf)
-        step_width = int(n_confs / (n_points - 1))
-        if len(conf) == 0:
-            return np.nan
-        if step_width == 0:
-            final = True
-            selected_cuts = conf
+    def fit_stream(self, chunks, X_o_range=None):
+        """Fit estimator from an iterable of chunks without holding
+        all events in memory. See partial_fit.
+
+        If n_jobs > 1, the chunks are histogrammed in parallel with
+        the executor selected by 'backend' and the histograms are
+        merged in the order of the chunks.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Iterable of (X, y) or (X, y, sample_weight) tuples.
+
+        X_o_range : tuple (min, max) or None
+            Range of X_o used to place the windows, if no positions
+            were provided.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        self.statistics = None
+        self.events = None
+        if self.n_jobs > 1:
+            if self.backend == 'thread':
+                executor_class = ThreadPoolExecutor
+            else:
+                executor_class = ProcessPoolExecutor
+            with executor_class(max_workers=self.n_jobs) as executor:
+                futures = []
+                for chunk in chunks:
+                    self.__init_statistics__(X_o_range)
+                    X_o, X_c, y, sample_weight = self.__split_chunk__(
+                        *chunk)
+                    futures.append(executor.submit(fill_histograms,
+                                                   self.statistics.edges,
+                                                   self.statistics.conf_bins,
+                                                   self.statistics.positions,
+                                                   X_o,
+                                                   X_c,
+                                                   y,
+                                                   sample_weight))
+                    # Keep the number of chunks in memory bounded
+                    if len(futures) >= 2 * self.n_jobs:
+                        self.statistics.merge(futures.pop(0).result())
+                for future in futures:
+                    self.statistics.merge(future.result())
         else:
-            final = False
-            idx = [(i * step_width) for i in range(n_points)]
-            idx[-1] = n_confs - 1
-            selected_cuts = conf[idx]
-        criteria_values = [eval_func(cut) for cut in selected_cuts]
-        idx_min = np.argmin(criteria_values)
-        if final:
-            return selected_cuts[idx_min]
+            for chunk in chunks:
+                self.__fill_statistics__(*chunk, X_o_range=X_o_range)
+        if self.statistics is None:
+            raise ValueError('No chunks provided!')
+        self.__generate_curve_from_statistics__()
+        return self
+
+    def compute_statistics(self, X, y, sample_weight=None, X_o_range=None):
+        """Fills the events into new window histograms without fitting
+        the cutter. The histograms of independent shards of the data can
+        be merged (see statistics.merge_histograms) and passed to
+        fit_statistics. All shards have to use the same windows, so
+        either positions or the same X_o_range have to be provided.
+
+        Parameters
+        ----------
+        X : array-like shape=(n_samples, 2)
+            The input samples. With the confidence at index 'conf_index'
+            (default=0) and X_o as the other index.
+
+        y : array-like, shape=(n_samples)
+            The target values (class labels in classification,
+            possible_classed=[0, 1]).
+
+        sample_weight : array-like, shape=(n_samples) or None
+            Sample weights. If None, then samples are equally weighted.
+
+        X_o_range : tuple (min, max) or None
+            Range of X_o used to place the windows, if no positions
+            were provided.
+
+        Returns
+        -------
+        statistics : statistics.WindowHistograms
+            Weighted confidence histograms of the shard.
+        """
+        statistics = self.__new_statistics__(X_o_range)
+        X_o, X_c, y, sample_weight = self.__split_chunk__(X, y,
+                                                          sample_weight)
+        return statistics.fill(X_o, X_c, y, sample_weight)
+
+    def fit_statistics(self, statistics):
+        """Fit estimator from window histograms, e.g. merged from the
+        results of compute_statistics on several shards. The windows
+        and confidence bins of the histograms are used.
+
+        Parameters
+        ----------
+        statistics : statistics.WindowHistograms
+            Accumulated histograms. They are used as 'statistics' of
+            the cutter, so later calls of partial_fit add to them.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        if not isinstance(statistics, WindowHistograms):
+            raise TypeError('\'statistics\' must be WindowHistograms!')
+        self.cut_opts.edges = np.array(statistics.edges)
+        self.cut_opts.positions = np.array(statistics.positions)
+        self.cut_opts.n_steps = len(statistics.positions)
+        self.statistics = statistics
+        self.events = None
+        self.__generate_curve_from_statistics__()
+        return self
+
+    def __split_chunk__(self, X, y, sample_weight=None):
+        assert X.shape[1] == 2, 'X must have the shape (n_events, 2)'
+        assert len(y) == X.shape[0], 'len(X) and len(y) must be the same'
+        if sample_weight is not None:
+            assert len(y) == len(sample_weight), 'weights and y need the' \
+                'same length'
+        return X[:, 1 - self.conf_index], X[:, self.conf_index], y, \
+            sample_weight
+
+    def __init_statistics__(self, X_o_range=None):
+        if self.statistics is None:
+            self.statistics = self.__new_statistics__(X_o_range)
+
+    def __new_statistics__(self, X_o_range=None):
+        if self.cut_opts.positions is None:
+            if self.cut_opts.window_placement == 'quantile':
+                raise ValueError('window_placement=\'quantile\' needs the '
+                                 'events, use fit or provide positions!')
+            if X_o_range is None:
+                raise ValueError('Without positions the X_o_range has to '
+                                 'be provided to place the windows!')
+            self.cut_opts.init_sliding_windows(np.asarray(X_o_range))
+        elif self.cut_opts.edges is None:
+            self.cut_opts.init_sliding_windows()
+        conf_bins = np.linspace(self.conf_range[0],
+                                self.conf_range[1],
+                                self.n_conf_bins + 1)
+        return WindowHistograms(self.cut_opts.edges,
+                                conf_bins,
+                                self.cut_opts.positions)
+
+    def __fill_statistics__(self, X, y, sample_weight=None, X_o_range=None):
+        self.__init_statistics__(X_o_range)
+        X_o, X_c, y, sample_weight = self.__split_chunk__(X, y,
+                                                          sample_weight)
+        self.statistics.fill(X_o, X_c, y, sample_weight)
+
+    def __generate_curve_from_statistics__(self, windows=None):
+        """Determines the cuts of all windows or the windows with the
+        indices 'windows' from the histograms and generates the curve.
+        """
+        cuts, tp, fp, tn, fn, is_cut = self.statistics.confusion_counts(
+            windows)
+        positions = self.cut_opts.positions
+        if windows is not None:
+            positions = positions[windows]
+        cut_values = find_best_binned_cuts(
+            cuts, tp, fp, tn, fn, is_cut,
+            self.criteria,
+            positions,
+            min_examples=self.cut_opts.min_examples,
+            tolerance=self.cut_opts.cut_tolerance)
+        bin_widths = np.diff(self.statistics.conf_bins)
+        idx_bin = np.searchsorted(cuts, cut_values)
+        cut_errors = np.full(len(cut_values), np.nan)
+        is_valid = np.isfinite(cut_values)
+        cut_errors[is_valid] = bin_widths[idx_bin[is_valid]]
+        if windows is None:
+            self.cut_opts.window_cuts = cut_values
+            self.cut_opts.cut_errors = cut_errors
         else:
-            if idx_min == 0:
-                conf = conf[:idx[idx_min + 1]]
-            elif idx_min == n_points - 1:
-                conf = conf[idx[idx_min - 1]:]
-            else:
-                conf = conf[idx[idx_min - 1]:idx[idx_min + 1]]
-            return self.__find_best_cut_inner__(eval_func, conf, n_points)
+            self.cut_opts.window_cuts[windows] = cut_values
+            self.cut_opts.cut_errors[windows] = cut_errors
+        if self.cut_opts.occupancy_weighting:
+            self.cut_opts.occupancy = self.statistics.get_occupancy()
+        self.__generate_curve_from_window_cuts__()
+        sum_weights = np.sum(self.statistics.signal) + \
+            np.sum(self.statistics.background)
+        self.fit_info = {'method': 'statistics',
+                         'sum_weights': float(sum_weights)}
+
+    def __find_best_cut__(self, start, stop, position,
+                          confidence, y_true, sample_weight):
+        weights_i = None
+        if sample_weight is not None:
+            weights_i = sample_weight[start:stop]
+        if self.__use_approx__(start, stop):
+            return find_best_cut_approx(
+                confidence[start:stop],
+                y_true[start:stop],
+                weights_i,
+                self.criteria,
+                position,
+                n_bins=self.cut_opts.approx_bins,
+                binning=self.cut_opts.approx_binning,
+                min_examples=self.cut_opts.min_examples,
+                tolerance=self.cut_opts.cut_tolerance)
+        cut_value = find_best_cut(confidence[start:stop],
+                                  y_true[start:stop],
+                                  weights_i,
+                                  self.criteria,
+                                  position,
+                                  min_examples=self.cut_opts.min_examples,
+                                  tolerance=self.cut_opts.cut_tolerance)
+        return cut_value, 0.
+
+    def __use_approx__(self, start, stop):
+        approx_bins = self.cut_opts.approx_bins
+        return approx_bins is not None and stop - start > approx_bins
 
     def fill_gaps(self, cut_values):
-        not_nan_mask = np.array(np.isfinite(cut_values), dtype=int)
-        idx_not_nan = np.where(not_nan_mask == 1)[0]
-        first_value_idx = idx_not_nan[0]
-        last_value_idx = idx_not_nan[-1]
-        if first_value_idx != 0:
-            cut_values[:first_value_idx] = cut_values[first_value_idx]
-            not_nan_mask[:first_value_idx] = 1
-
-        if last_value_idx != 0:
-            cut_values[last_value_idx:] = cut_values[last_value_idx]
-            not_nan_mask[last_value_idx:] = 1
-
-        diff = np.diff(not_nan_mask)
-        falling = np.where(diff == -1)[0]
-        rising = np.where(diff == 1)[0]
-        for fall, rise in zip(falling, rising):
-            idx_first_nan = fall + 1
-            idx_last_nan = rise
-            value_before = cut_values[idx_first_nan - 1]
-            value_after = cut_values[idx_last_nan + 1]
-            gap_length = rise - fall
-            slope = (value_after - value_before) / (gap_length + 1)
-            for i in range(gap_length):
-                cut_values[idx_first_nan + i] = value_before + (i + 1) * slope
-        return cut_values
+        """Fills the cuts of windows without a valid cut with the
+        strategy 'cut_opts.gap_filling' (see curve.fill_gaps). The
+        window positions are used as x values.
+
+        Parameters
+        ----------
+        cut_values : array-like, shape=(n_steps) or (n_steps, n_bootstraps)
+            Cut of each window (and bootstrap). NaN for missing cuts.
+
+        Returns
+        -------
+        cut_values : array, shape like cut_values
+            Filled copy of the cut values.
+        """
+        return fill_gaps(cut_values,
+                         x=self.cut_opts.positions,
+                         strategy=self.cut_opts.gap_filling,
+                         smoothing=self.cut_opts.gap_smoothing)
+
+    def __determine_cut_values_parallel__(self, seeds, X, y, sample_weight,
+                                          windows=None):
+        n_jobs = min(self.n_jobs, len(seeds))
+        if self.backend == 'thread':
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(self.__determine_cut_values_mp__,
+                                           seed=seed,
+                                           X_full=X,
+                                           y_true_full=y,
+                                           sample_weight_full=sample_weight,
+                                           windows=windows)
+                           for seed in seeds]
+                return [future.result() for future in futures]
+        elif self.backend == 'process':
+            task_cutter = self.__task_copy__()
+            shared_arrays = share_arrays(X, y, sample_weight)
+            try:
+                with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                    futures = [executor.submit(_determine_cut_values_shared,
+                                               task_cutter,
+                                               seed,
+                                               *shared_arrays,
+                                               windows=windows)
+                               for seed in seeds]
+                    return [future.result() for future in futures]
+            finally:
+                unlink_arrays(shared_arrays)
+        else:
+            raise ValueError('Invalid backend [\'thread\', \'process\']')
+
+    def __task_copy__(self):
+        """Copy of the cutter for pool tasks. Only the windows, the
+        criteria and the options are kept, the fitted state (curve,
+        cuts, histograms and events) is not pickled into the tasks.
+        """
+        task_cutter = copy(self)
+        task_cutter.events = None
+        task_cutter.statistics = None
+        task_cutter.fit_info = None
+        task_cutter.cut_opts = copy(self.cut_opts)
+        for key in ['curve', 'window_cuts', 'cut_errors', 'occupancy']:
+            setattr(task_cutter.cut_opts, key, None)
+        return task_cutter
+
+    def __draw_bootstrap__(self, n_events, seed):
+        random_state = np.random.RandomState(seed)
+        bootstrap = random_state.choice(n_events, n_events, replace=True)
+        # Sorted indices keep the sample sorted by X_o
+        return np.sort(bootstrap)
+
+    def __draw_bootstrap_counts__(self, n_events, seed):
+        random_state = np.random.RandomState(seed)
+        if self.cut_opts.bootstrap_mode == 'poisson':
+            counts = random_state.poisson(1., size=n_events)
+        else:
+            bootstrap = random_state.choice(n_events, n_events, replace=True)
+            counts = np.bincount(bootstrap, minlength=n_events)
+        return np.array(counts, dtype=float)
 
     def __determine_cut_values_mp__(self,
-                                    idx,
+                                    seed,
                                     X_full,
                                     y_true_full,
-                                    sample_weight_full):
-        if idx is None:
+                                    sample_weight_full,
+                                    windows=None):
+        if seed is None:
             X = X_full
             y_true = y_true_full
             sample_weight = sample_weight_full
-        else:
+        elif self.cut_opts.bootstrap_mode == 'index':
+            idx = self.__draw_bootstrap__(len(y_true_full), seed)
             X = X_full[idx]
             y_true = y_true_full[idx]
             if sample_weight_full is not None:
                 sample_weight = sample_weight_full[idx]
             else:
                 sample_weight = sample_weight_full
+        else:
+            X = X_full
+            y_true = y_true_full
+            sample_weight = self.__draw_bootstrap_counts__(len(y_true_full),
+                                                           seed)
+            if sample_weight_full is not None:
+                sample_weight *= sample_weight_full
 
-        edges = self.cut_opts.edges
+        slices = self.cut_opts.get_window_slices(X[:, 1])
         positions = self.cut_opts.positions
-        n_points = 5
+        if windows is not None:
+            slices = slices[windows]
+            positions = positions[windows]
+        confidence = np.ascontiguousarray(X[:, 0])
 
         cut_values = np.zeros_like(positions)
-        for i, [[lower, upper], position] in enumerate(zip(edges,
-                                                           positions)):
-            cut_value = self.__find_best_cut__(i, lower, upper, position,
-                                               X, y_true, sample_weight,
-                                               n_points=n_points)
-
-            cut_values[i] = cut_value
-        n_valid_cuts = np.sum(np.isfinite(cut_values))
-        if n_valid_cuts == 0:
+        cut_errors = np.zeros_like(positions)
+        for i, [[start, stop], position] in enumerate(zip(slices,
+                                                          positions)):
+            cut_values[i], cut_errors[i] = self.__find_best_cut__(
+                start, stop, position, confidence, y_true, sample_weight)
+        cut_errors[~np.isfinite(cut_values)] = np.nan
+        return cut_values, cut_errors
+
+    def __determine_cut_values_batched__(self,
+                                         seeds,
+                                         X_full,
+                                         y_true_full,
+                                         sample_weight_full,
+                                         windows=None):
+        n_events = len(y_true_full)
+        counts = np.zeros((n_events, len(seeds)), dtype=np.uint8)
+        for i, seed in enumerate(seeds):
+            counts_i = self.__draw_bootstrap_counts__(n_events, seed)
+            if counts_i.max() > np.iinfo(counts.dtype).max:
+                counts = counts.astype(np.uint32)
+            counts[:, i] = counts_i
+
+        slices = self.cut_opts.get_window_slices(X_full[:, 1])
+        positions = self.cut_opts.positions
+        if windows is not None:
+            slices = slices[windows]
+            positions = positions[windows]
+        confidence = np.ascontiguousarray(X_full[:, 0])
+
+        cut_values = np.zeros((len(positions), len(seeds)))
+        cut_errors = np.zeros_like(cut_values)
+        for i, [[start, stop], position] in enumerate(zip(slices,
+                                                          positions)):
+            weights_i = np.array(counts[start:stop], dtype=float)
+            if sample_weight_full is not None:
+                weights_i *= sample_weight_full[start:stop, np.newaxis]
+            if self.__use_approx__(start, stop):
+                cut_values[i], cut_errors[i] = find_best_cut_approx(
+                    confidence[start:stop],
+                    y_true_full[start:stop],
+                    weights_i,
+                    self.criteria,
+                    position,
+                    n_bins=self.cut_opts.approx_bins,
+                    binning=self.cut_opts.approx_binning,
+                    min_examples=self.cut_opts.min_examples,
+                    tolerance=self.cut_opts.cut_tolerance)
+            else:
+                cut_values[i] = find_best_cuts(
+                    confidence[start:stop],
+                    y_true_full[start:stop],
+                    weights_i,
+                    self.criteria,
+                    position,
+                    min_examples=self.cut_opts.min_examples,
+                    tolerance=self.cut_opts.cut_tolerance)
+        cut_errors[~np.isfinite(cut_values)] = np.nan
+        return cut_values, cut_errors
+
+    def __fill_cut_values__(self, cut_values):
+        n_valid_cuts = np.sum(np.isfinite(cut_values), axis=0)
+        if np.any(n_valid_cuts == 0):
             raise RuntimeError('No valid cuts found! If manual positions '
                                'being used, they are not in the range of the '
                                'examples!')
-        cut_values_filled = self.fill_gaps(cut_values)
+        return self.fill_gaps(cut_values)
 
-        return cut_values_filled
+    def copy(self, deep=False):
+        """Returns a copy of the cutter.
 
-    def __add__(self, other):
-        copy = deepcopy(self)
+        Parameters
+        ----------
+        deep : boolean, optional (default=False)
+            If False, the copy has its own options (cut_opts) and random
+            state, but shares the curve, the events, the histograms and
+            the arrays of the options with the cutter. Use deep=True
+            before the copy or the cutter is refitted or updated.
+
+        Returns
+        -------
+        cutter : ConfidenceCutter
+            The copy.
+        """
+        if deep:
+            return deepcopy(self)
+        cutter = copy(self)
+        cutter.cut_opts = copy(self.cut_opts)
+        cutter.random_state = deepcopy(self.random_state)
+        return cutter
+
+    def __calc__(self, other, operation, inplace=False):
+        # The operators build a new curve, so a shallow copy is enough
+        result = self if inplace else self.copy()
         if isinstance(other, ConfidenceCutter):
-            if copy.cut_opts.curve is None:
-                copy.cut_opts.curve = deepcopy(other.cut_opts.curve)
-            else:
-                copy.cut_opts.curve += other.cut_opts.curve
-        else:
-            try:
-                copy.cut_opts.curve += other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return copy
+            other = other.cut_opts.curve
+            if result.cut_opts.curve is None:
+                result.cut_opts.curve = deepcopy(other)
+                return result
+        try:
+            result.cut_opts.curve = result.cut_opts.curve.__calc__(
+                other, operation=operation, inplace=inplace)
+        except (TypeError, AttributeError):
+            raise TypeError('Valid types [float, int, Curve, '
+                            'ConfidenceCutter]')
+        return result
+
+    def __add__(self, other):
+        return self.__calc__(other, '+')
 
     def __sub__(self, other):
-        copy = deepcopy(self)
-        if isinstance(other, ConfidenceCutter):
-            if copy.cut_opts.curve is None:
-                copy.cut_opts.curve = deepcopy(other.cut_opts.curve)
-            else:
-                copy.cut_opts.curve -= other.cut_opts.curve
-        else:
-            try:
-                copy.cut_opts.curve -= other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return copy
+        return self.__calc__(other, '-')
 
     def __mul__(self, other):
-        copy = deepcopy(self)
-        if isinstance(other, ConfidenceCutter):
-            if copy.cut_opts.curve is None:
-                copy.cut_opts.curve = deepcopy(other.cut_opts.curve)
-            else:
-                copy.cut_opts.curve *= other.cut_opts.curve
-        else:
-            try:
-                copy.cut_opts.curve *= other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return copy
+        return self.__calc__(other, '*')
 
     def __div__(self, other):
-        copy = deepcopy(self)
-        if isinstance(other, ConfidenceCutter):
-            if copy.cut_opts.curve is None:
-                copy.cut_opts.curve /= deepcopy(other.cut_opts.curve)
-            else:
-                copy.cut_opts.curve /= other.cut_opts.curve
-        else:
-            try:
-                copy.cut_opts.curve /= other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return copy
+        return self.__calc__(other, '/')
 
     def __truediv__(self, other):
-        copy = deepcopy(self)
-        if isinstance(other, ConfidenceCutter):
-            if copy.cut_opts.curve is None:
-                copy.cut_opts.curve /= deepcopy(other.cut_opts.curve)
-            else:
-                copy.cut_opts.curve /= other.cut_opts.curve
-        else:
-            try:
-                copy.cut_opts.curve /= other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return copy
+        return self.__calc__(other, '/')
 
     def __iadd__(self, other):
-        if isinstance(other, ConfidenceCutter):
-            if self.cut_opts.curve is None:
-                self.cut_opts.curve = deepcopy(other.cut_opts.curve)
-            else:
-                self.cut_opts.curve += other.cut_opts.curve
-        else:
-            try:
-                self.cut_opts.curve += other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return self
+        return self.__calc__(other, '+', inplace=True)
 
     def __isub__(self, other):
-        if isinstance(other, ConfidenceCutter):
-            if self.cut_opts.curve is None:
-                self.cut_opts.curve = deepcopy(other.cut_opts.curve)
-            else:
-                self.cut_opts.curve -= other.cut_opts.curve
-        else:
-            try:
-                self.cut_opts.curve -= other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return self
+        return self.__calc__(other, '-', inplace=True)
 
     def __imul__(self, other):
-        if isinstance(other, ConfidenceCutter):
-            if self.cut_opts.curve is None:
-                self.cut_opts.curve = deepcopy(other.cut_opts.curve)
-            else:
-                self.cut_opts.curve *= other.cut_opts.curve
-        else:
-            try:
-                self.cut_opts.curve *= other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return self
+        return self.__calc__(other, '*', inplace=True)
 
     def __idiv__(self, other):
-        if isinstance(other, ConfidenceCutter):
-            if self.cut_opts.curve is None:
-                self.cut_opts.curve = deepcopy(other.cut_opts.curve)
-            else:
-                self.cut_opts.curve /= other.cut_opts.curve
-        else:
-            try:
-                self.cut_opts.curve /= other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return self
+        return self.__calc__(other, '/', inplace=True)
 
     def __itruediv__(self, other):
-        if isinstance(other, ConfidenceCutter):
-            if self.cut_opts.curve is None:
-                self.cut_opts.curve = deepcopy(other.cut_opts.curve)
-            else:
-                self.cut_opts.curve /= other.cut_opts.curve
-        else:
-            try:
-                self.cut_opts.curve /= other
-            except TypeError:
-                raise TypeError('Valid types [float, int, Curve, '
-                                'ConfidenceCutter]')
-        return self
+        return self.__calc__(other, '/', inplace=True)
 
     def __call__(self, x):
         return self.cut_opts.curve(x)
+
+
+def combine_cutters(cutters, operation='mean', q=None, deep=False):
+    """Combines the cut curves of many fitted cutters in one pass, e.g.
+    to average bootstrap or systematic variations. See
+    curve.reduce_curves.
+
+    Parameters
+    ----------
+    cutters : list of ConfidenceCutter
+        Fitted cutters.
+
+    operation : ['sum', 'mean', 'min', 'max', 'median', 'quantile']
+        Pointwise reduction (default='mean').
+
+    q : float, optional
+        Quantile in [0, 1] for operation='quantile'.
+
+    deep : boolean, optional (default=False)
+        Whether the first cutter is deep-copied (see
+        ConfidenceCutter.copy).
+
+    Returns
+    -------
+    cutter : ConfidenceCutter
+        Copy of the first cutter with the combined cut curve.
+    """
+    cutters = list(cutters)
+    if len(cutters) == 0:
+        raise ValueError('No cutters provided!')
+    curve = reduce_curves([cutter.cut_opts.curve for cutter in cutters],
+                          operation=operation,
+                          q=q)
+    combined = cutters[0].copy(deep=deep)
+    combined.cut_opts.curve = curve
+    return combined
@@ -6,9 +6,19 @@ import numpy as np
 import numexpr as ne
 
 
-def purity_criteria(threshold=0.99):
-    """Returns decisison function which returns the absolute difference
-    between the achieved and desired purity.
+CONFUSION_MATRIX_ENTRIES = ('tp', 'fp', 'tn', 'fn')
+
+
+class ConfusionMatrixCriteria(object):
+    """Base class for criteria depending only on the weighted confusion
+    matrix. The criteria returns the absolute difference between the
+    criteria value and the threshold.
+
+    The criteria can be evaluated for many cuts (and many windows) at
+    once with 'evaluate_counts'. Calling the object with
+    (y_true, y_pred, position, sample_weights=None) evaluates a single
+    prediction.
+
     Parameters
     ----------
     threshold : float or callable
@@ -16,27 +26,84 @@ def purity_criteria(threshold=0.99):
         criteria, which has to be fulfilled for each window, is used.
         If callable the function has to take the position and return a
         criteria not greater than 1.
-    Returns
-    -------
-    decisison function : callable
-        Returns a func(y_true, y_pred, position, sample_weights=None)
-        returning 'difference' which is the absolute difference between
-        the achieved and desired purity
     """
-    if isinstance(threshold, float):
-        if threshold > 1.:
-            raise ValueError('Constant threshold must be <= 1')
-
-        def threshold_func(x):
-            return threshold
-    elif callable(threshold):
-        threshold_func = threshold
-    else:
-        raise TypeError('\'threshold\' must be either float or callable')
-
-    def decision_function(y_true, y_pred, position, sample_weights=None):
-        """Returns decisison function which returns if the desired purity
-        is fulfilled.
+    def __init__(self, threshold=0.99):
+        if isinstance(threshold, float):
+            if threshold > 1.:
+                raise ValueError('Constant threshold must be <= 1')
+        elif not callable(threshold):
+            raise TypeError('\'threshold\' must be either float or callable')
+        self.threshold = threshold
+
+    def get_threshold(self, position):
+        """Returns the threshold for a window position.
+
+        Parameters
+        ----------
+        position : float or array-like, shape=(n_windows) or
+                   (n_windows, n_dims)
+            Postion(s) of the cut window(s). For windows in several
+            dimensions, each row is the position of a window.
+
+        Returns
+        -------
+        threshold : float or 1d array, shape=(n_windows)
+            Threshold(s) for the window(s).
+        """
+        if not callable(self.threshold):
+            if np.ndim(position) == 0:
+                return self.threshold
+            return np.full(np.shape(position)[:1], self.threshold)
+        if np.ndim(position) == 0:
+            return self.__check_threshold__(self.threshold(position))
+        return np.array([self.__check_threshold__(self.threshold(pos_i))
+                         for pos_i in position])
+
+    def __check_threshold__(self, float_criteria):
+        if not isinstance(float_criteria, float):
+            raise TypeError('Callable threshold must return float <= 1.')
+        if float_criteria > 1.:
+            raise ValueError('Callable threshold returned value > 1')
+        return float_criteria
+
+    def criteria_value(self, tp, fp, tn, fn):
+        """Calculates the criteria from the weighted confusion matrix
+        entries. Has to be implemented by the derived classes.
+        """
+        raise NotImplementedError
+
+    def evaluate_counts(self, tp, fp, tn, fn, position):
+        """Returns the absolute difference between the criteria and the
+        threshold for arrays of weighted confusion matrix entries.
+
+        Parameters
+        ----------
+        tp, fp, tn, fn : array-like, shape=(n_cuts) or (n_windows, ...)
+            Weighted confusion matrix entries. If the position is an
+            array, the first axis corresponds to the windows.
+
+        position : float or 1d array-like, shape=(n_windows)
+            Postion(s) of the cut window(s).
+
+        Returns
+        -------
+        difference : array, same shape as the entries
+            Absolute difference between the criteria and the threshold.
+        """
+        tp, fp, tn, fn = [np.asarray(entry, dtype=float)
+                          for entry in (tp, fp, tn, fn)]
+        criteria_value = self.criteria_value(tp, fp, tn, fn)
+        threshold = self.get_threshold(position)
+        if np.ndim(threshold) > 0:
+            n_add_dims = np.ndim(criteria_value) - np.ndim(threshold)
+            threshold = np.reshape(threshold,
+                                   np.shape(threshold) + (1,) * n_add_dims)
+        return np.absolute(criteria_value - threshold)
+
+    def __call__(self, y_true, y_pred, position, sample_weights=None):
+        """Returns the absolute difference between the criteria and the
+        threshold for a single prediction.
+
         Parameters
         ----------
         y_true : 1d array-like
@@ -49,33 +116,117 @@ def purity_criteria(threshold=0.99):
         position : float
             Value indicating the postion of the cut window.
 
+        sample_weights : 1d array-like or None
+            Sample weights. If None, then samples are equally weighted.
+
         Returns
         -------
-        fulfilled : boolean
-            Return if the criteria is fulfilled.
+        difference : float
+            Absolute difference between the criteria and the threshold.
         """
-        float_criteria = threshold_func(position)
-        if not isinstance(float_criteria, float):
-            raise TypeError('Callable threshold must return float <= 1.')
-        if float_criteria > 1.:
-            raise ValueError('Callable threshold returned value > 1')
         y_true_bool = np.array(y_true, dtype=bool)
         y_pred_bool = np.array(y_pred, dtype=bool)
         if sample_weights is None:
-            tp = np.sum(y_true_bool[y_pred_bool])
-            fp = np.sum(~y_true_bool[y_pred_bool])
-        else:
-            idx_tp = np.logical_and(y_true_bool, y_pred_bool)
-            idx_fp = np.logical_and(~y_true_bool, y_pred_bool)
-            tp = np.sum(sample_weights[idx_tp])
-            fp = np.sum(sample_weights[idx_fp])
-        if tp + fp == 0:
-            purity = 0.
+            sample_weights = np.ones(len(y_true_bool))
         else:
-            purity = tp / (tp + fp)
-        return np.absolute(purity - float_criteria)
+            sample_weights = np.asarray(sample_weights, dtype=float)
+        tp = np.sum(sample_weights[y_true_bool & y_pred_bool])
+        fp = np.sum(sample_weights[~y_true_bool & y_pred_bool])
+        tn = np.sum(sample_weights[~y_true_bool & ~y_pred_bool])
+        fn = np.sum(sample_weights[y_true_bool & ~y_pred_bool])
+        return self.evaluate_counts(tp, fp, tn, fn, position)[()]
 
-    return decision_function
+
+class PurityCriteria(ConfusionMatrixCriteria):
+    """Criteria returning the absolute difference between the achieved
+    and desired purity. If nothing is predicted as positive the purity
+    is 0.
+
+    Parameters
+    ----------
+    threshold : float or callable
+        See ConfusionMatrixCriteria.
+    """
+    def criteria_value(self, tp, fp, tn, fn):
+        n_pos = tp + fp
+        purity = np.zeros(np.shape(n_pos))
+        np.divide(tp, n_pos, out=purity, where=n_pos != 0)
+        return purity
+
+    def __repr__(self):
+        return 'PurityCriteria(threshold={!r})'.format(self.threshold)
+
+
+class GeneralConfusionMatrixCriteria(ConfusionMatrixCriteria):
+    """Criteria defined by an expression of the confusion matrix
+    entries. The expression is compiled once with numexpr.
+
+    Parameters
+    ----------
+    eval_str: string
+        String for the criteria. Usable values are:
+            tp: True Positives
+            fp: False Positives
+            tn: True Negatives
+            fn: False Negatives
+        E.g.: Purity as the criteria: 'tp / (tp + fp)'
+
+    threshold : float or callable
+        See ConfusionMatrixCriteria.
+    """
+    def __init__(self, eval_str, threshold=0.99):
+        super(GeneralConfusionMatrixCriteria, self).__init__(
+            threshold=threshold)
+        self.eval_str = eval_str
+        self.__compile__()
+
+    def __compile__(self):
+        used_names = compile(self.eval_str, '<criteria>', 'eval').co_names
+        self.input_names = [name for name in CONFUSION_MATRIX_ENTRIES
+                            if name in used_names]
+        signature = [(name, np.float64) for name in self.input_names]
+        self.compiled_expr = ne.NumExpr(self.eval_str, signature=signature)
+
+    def criteria_value(self, tp, fp, tn, fn):
+        entries = {'tp': tp, 'fp': fp, 'tn': tn, 'fn': fn}
+        inputs = [entries[name] for name in self.input_names]
+        if len(inputs) > 1:
+            inputs = np.broadcast_arrays(*inputs)
+        return self.compiled_expr(*inputs)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['compiled_expr']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__compile__()
+
+    def __repr__(self):
+        return 'GeneralConfusionMatrixCriteria(eval_str={!r}, ' \
+            'threshold={!r})'.format(self.eval_str, self.threshold)
+
+
+def purity_criteria(threshold=0.99):
+    """Returns decisison function which returns the absolute difference
+    between the achieved and desired purity.
+    Parameters
+    ----------
+    threshold : float or callable
+        If float, independent from the positon of the window a constant
+        criteria, which has to be fulfilled for each window, is used.
+        If callable the function has to take the position and return a
+        criteria not greater than 1.
+    Returns
+    -------
+    decisison function : PurityCriteria
+        Callable func(y_true, y_pred, position, sample_weights=None)
+        returning 'difference' which is the absolute difference between
+        the achieved and desired purity. Use 'evaluate_counts' to
+        evaluate many cuts at once.
+    """
+    return PurityCriteria(threshold=threshold)
 
 
 def general_confusion_matrix_criteria(eval_str, threshold=0.99):
@@ -101,94 +252,10 @@ def general_confusion_matrix_criteria(eval_str, threshold=0.99):
 
     Returns
     -------
-    decisison function : callable
-        Returns a func(y_true, y_pred, position, sample_weights=None)
+    decisison function : GeneralConfusionMatrixCriteria
+        Callable func(y_true, y_pred, position, sample_weights=None)
         returning 'difference' which is the absolute difference between
-        the achieved and desired purity
+        the achieved and desired purity. Use 'evaluate_counts' to
+        evaluate many cuts at once.
     """
-    if isinstance(threshold, float):
-        if threshold > 1.:
-            raise ValueError('Constant threshold must be <= 1')
-
-        def threshold_func(x):
-            return threshold
-
-    elif callable(threshold):
-        threshold_func = threshold
-    else:
-        raise TypeError('\'threshold\' must be either float or callable')
-
-    if 'tp' in eval_str:
-        calc_tp = True
-    else:
-        calc_tp = False
-    if 'fp' in eval_str:
-        calc_fp = True
-    else:
-        calc_fp = False
-    if 'tn' in eval_str:
-        calc_tn = True
-    else:
-        calc_tn = False
-    if 'fn' in eval_str:
-        calc_fn = True
-    else:
-        calc_fn = False
-
-    def decision_function(y_true, y_pred, position, sample_weights=None):
-        """Returns decisison function which returns if the desired purity
-        is fulfilled.
-        Parameters
-        ----------
-        y_true : 1d array-like
-            Ground truth (correct) target values. Only binary
-            classification is supported.
-
-        y_pred : 1d array-like
-            Estimated targets.
-
-        position : float
-            Value indicating the postion of the cut window.
-
-        Returns
-        -------
-        fulfilled : boolean
-            Return if the criteria is fulfilled.
-        """
-        float_criteria = threshold_func(position)
-        if not isinstance(float_criteria, float):
-            raise TypeError('Callable threshold must return float <= 1.')
-        if float_criteria > 1.:
-            raise ValueError('Callable threshold returned value > 1')
-        y_true_bool = np.array(y_true, dtype=bool)
-        y_pred_bool = np.array(y_pred, dtype=bool)
-        if calc_tp:
-            if sample_weights is None:
-                tp = np.sum(y_true_bool[y_pred_bool])
-            else:
-                idx_tp = np.logical_and(y_true_bool, y_pred_bool)
-                tp = np.sum(sample_weights[idx_tp]) # NOQA
-
-        if calc_fp:
-            if sample_weights is None:
-                fp = np.sum(~y_true_bool[y_pred_bool])
-            else:
-                idx_fp = np.logical_and(~y_true_bool, y_pred_bool)
-                fp = np.sum(sample_weights[idx_fp]) # NOQA
-
-        if calc_tn:
-            if sample_weights is None:
-                tn = np.sum(~y_true_bool[~y_pred_bool])
-            else:
-                idx_tn = np.logical_and(~y_true_bool, ~y_pred_bool)
-                tn = np.sum(sample_weights[idx_tn]) # NOQA
-        if calc_fn:
-            if sample_weights is None:
-                fn = np.sum(y_true_bool[~y_pred_bool])
-            else:
-                idx_fn = np.logical_and(y_true_bool, ~y_pred_bool)
-                fn = np.sum(sample_weights[idx_fn]) # NOQA
-        criteria_value = ne.evaluate(eval_str)
-        return np.absolute(criteria_value - float_criteria)
-
-    return decision_function
+    return GeneralConfusionMatrixCriteria(eval_str, threshold=threshold)
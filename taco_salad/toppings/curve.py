@@ -23,23 +23,157 @@ class Curve(object):
 
         hist = stepwise, only input y are possible returns when evaluted
         linear = linear interpolation between neigbouring X values.
+
+    lookup_size : int or None, optional (default=None)
+        If None, the curve is evaluated exactly with a binary search of
+        the x values for each point. Otherwise the curve is tabulated
+        on lookup_size + 1 equidistant nodes between min(x) and max(x)
+        and evaluated from the table in O(1) per point: 'linear' curves
+        are interpolated linearly between the nodes and 'hist' curves
+        return the value of the nearest node. The result differs from
+        the exact evaluation only within (x.max() - x.min()) /
+        lookup_size of a kink/step of the curve. Outside the x range
+        the curve is constant in both modes. NaNs are not supported
+        by the lookup table.
+
+    tables : dict, optional (default=None)
+        Precomputed arrays of the evaluation (see get_tables), e.g.
+        memory-mapped from a curve file. Missing or mismatching arrays
+        are computed from x and y on the first evaluation.
     """
-    def __init__(self, x, y, mode='linear'):
-        order = np.argsort(x)
-        self.x = x[order]
-        self.y = y[order]
+    def __init__(self, x, y, mode='linear', lookup_size=None, tables=None):
+        if np.all(x[1:] >= x[:-1]):
+            # Sorted input (e.g. memory-mapped) is used without a copy
+            self.x = x
+            self.y = y
+        else:
+            order = np.argsort(x)
+            self.x = x[order]
+            self.y = y[order]
         self.mode = mode.lower()
         assert self.mode in ['hist', 'linear'], \
             'Invalid mode [\'hist\', \'linear\']'
-        self.setup_curve(mode)
+        self.setup_curve(self.mode, lookup_size=lookup_size, tables=tables)
 
-    def setup_curve(self, mode='linear'):
+    def setup_curve(self, mode='linear', lookup_size=None, tables=None):
+        tables = tables or {}
+        self._slope = self.__get_table__(tables, 'slope', len(self.x) + 1)
+        self._offset = self.__get_table__(tables, 'offset', len(self.x) + 1)
+        self._edges = self.__get_table__(tables, 'edges', len(self.x) - 1)
         if mode == 'hist':
             self.evaluate = self.__eval_hist__
-            self.__setup_hist__()
         if mode == 'linear':
             self.evaluate = self.__eval_linear__
+        self.setup_lookup(lookup_size, tables=tables)
+
+    def __get_table__(self, tables, key, length):
+        table = tables.get(key)
+        if table is None or len(table) != max(length, 0):
+            return None
+        return table
+
+    def get_tables(self):
+        """Returns the arrays used for the evaluation, to store them
+        with the curve (see curve_io).
+
+        Returns
+        -------
+        tables : dict
+            'slope'/'offset' ('linear') or 'edges' ('hist') and
+            'lookup_table'/'lookup_slope' if a lookup table is used.
+        """
+        if self.mode == 'linear':
+            tables = {'slope': self.slope, 'offset': self.offset}
+        else:
+            tables = {'edges': self.edges}
+        if self.lookup_table is not None:
+            tables['lookup_table'] = self.lookup_table
+            if self.mode == 'linear':
+                tables['lookup_slope'] = self.lookup_slope
+        return tables
+
+    @property
+    def slope(self):
+        if self._slope is None:
             self.__setup_linear__()
+        return self._slope
+
+    @property
+    def offset(self):
+        if self._offset is None:
+            self.__setup_linear__()
+        return self._offset
+
+    @property
+    def edges(self):
+        if self._edges is None:
+            self.__setup_hist__()
+        return self._edges
+
+    def setup_lookup(self, lookup_size=None, tables=None):
+        """Tabulates the curve for the evaluation from a lookup table.
+
+        Parameters
+        ----------
+        lookup_size : int or None
+            Number of intervals of the table. If None, the exact
+            evaluation is used.
+
+        tables : dict, optional (default=None)
+            Precomputed 'lookup_table'/'lookup_slope' (see get_tables).
+        """
+        if self.mode == 'linear':
+            self.evaluate = self.__eval_linear__
+        else:
+            self.evaluate = self.__eval_hist__
+        self.lookup_size = lookup_size
+        if lookup_size is None:
+            self.lookup_table = None
+            return
+        lookup_size = int(lookup_size)
+        assert lookup_size > 0, '\'lookup_size\' must be > 0'
+        tables = tables or {}
+        self.lookup_table = self.__get_table__(tables, 'lookup_table',
+                                               lookup_size + 1)
+        if self.lookup_table is None:
+            nodes = np.linspace(self.x[0], self.x[-1], lookup_size + 1)
+            self.lookup_table = self.evaluate(nodes)
+        self.lookup_x0 = self.x[0]
+        if self.x[-1] > self.x[0]:
+            self.lookup_scale = lookup_size / (self.x[-1] - self.x[0])
+        else:
+            self.lookup_scale = 0.
+        if self.mode == 'linear':
+            self.lookup_slope = self.__get_table__(tables, 'lookup_slope',
+                                                   lookup_size + 1)
+            if self.lookup_slope is None:
+                self.lookup_slope = np.append(np.diff(self.lookup_table),
+                                              0.)
+            self.evaluate = self.__eval_lookup_linear__
+        else:
+            self.evaluate = self.__eval_lookup_hist__
+
+    def __lookup_position__(self, x):
+        position = np.array(x, dtype=float)
+        position -= self.lookup_x0
+        position *= self.lookup_scale
+        return np.clip(position, 0, self.lookup_size, out=position)
+
+    def __eval_lookup_linear__(self, x):
+        position = self.__lookup_position__(x)
+        idx = position.astype(np.intp)
+        np.clip(idx, 0, self.lookup_size, out=idx)
+        position -= idx
+        position *= self.lookup_slope[idx]
+        position += self.lookup_table[idx]
+        return position[()]
+
+    def __eval_lookup_hist__(self, x):
+        position = self.__lookup_position__(x)
+        position += 0.5
+        idx = position.astype(np.intp)
+        np.clip(idx, 0, self.lookup_size, out=idx)
+        return self.lookup_table[idx][()]
 
     def __call__(self, x):
         return self.evaluate(x)
@@ -50,46 +184,52 @@ class Curve(object):
 
     def __setup_linear__(self):
         slope = (self.y[1:] - self.y[:-1]) / (self.x[1:] - self.x[:-1])
-        self.slope = np.zeros(len(self.x) + 1)
-        self.slope[1:-1] = slope
-        self.offset = np.hstack((self.y[0], self.y))
+        self._slope = np.zeros(len(self.x) + 1)
+        self._slope[1:-1] = slope
+        self._offset = np.hstack((self.y[0], self.y))
         offset = self.y[:-1] - slope * self.x[:-1]
-        self.offset[1:-1] = offset
+        self._offset[1:-1] = offset
 
     def __eval_hist__(self, x):
         digitized = np.digitize(x, self.edges)
         return self.y[digitized]
 
     def __setup_hist__(self):
-        self.edges = (self.x[1:] + self.x[:-1]) / 2.
+        self._edges = (self.x[1:] + self.x[:-1]) / 2.
 
     def __calc_eval__(self, other):
-        x_combined = np.append(self.x, other.x)
-        x = np.sort(np.unique(x_combined))
+        if len(self.x) == len(other.x) and np.all(self.x == other.x):
+            return self.x, self.y, other.y
+        x = np.unique(np.append(self.x, other.x))
         y_1 = self(x)
         y_2 = other(x)
         return x, y_1, y_2
 
-    def __calc__(self, other, operation='add'):
+    def __calc__(self, other, operation='add', inplace=False):
         if isinstance(other, float) or isinstance(other, int):
-            other = Curve(self.x, np.ones_like(self.y) * other)
+            x, y_1, y_2 = self.x, self.y, other
         elif isinstance(other, Curve):
-            pass
+            x, y_1, y_2 = self.__calc_eval__(other)
         elif other is None:
-            return deepcopy(self)
+            return self if inplace else deepcopy(self)
         else:
             raise TypeError('Valid types [float, int, Curve]')
-        x, y_1, y_2 = self.__calc_eval__(other)
         if operation == 'add' or operation == '+':
-            return Curve(x, y_1 + y_2, mode=self.mode)
+            y = y_1 + y_2
         elif operation == 'sub' or operation == '-':
-            return Curve(x, y_1 - y_2, mode=self.mode)
+            y = y_1 - y_2
         elif operation == 'mult' or operation == '*':
-            return Curve(x, y_1 * y_2, mode=self.mode)
+            y = y_1 * y_2
         elif operation == 'div' or operation == '/':
-            return Curve(x, y_1 / y_2, mode=self.mode)
+            y = y_1 / y_2
         else:
             raise AttributeError('Valid operations [+, -, * , /]')
+        if inplace:
+            self.x = x
+            self.y = y
+            self.setup_curve(self.mode, lookup_size=self.lookup_size)
+            return self
+        return Curve(x, y, mode=self.mode, lookup_size=self.lookup_size)
 
     def __add__(self, other):
         return self.__calc__(other, operation='+')
@@ -101,25 +241,25 @@ class Curve(object):
         return self.__calc__(other, operation='*')
 
     def __div__(self, other):
-        return self.__calc__(other, operation='*')
+        return self.__calc__(other, operation='/')
 
     def __truediv__(self, other):
         return self.__calc__(other, operation='/')
 
     def __iadd__(self, other):
-        return self.__calc__(other, operation='+')
+        return self.__calc__(other, operation='+', inplace=True)
 
     def __isub__(self, other):
-        return self.__calc__(other, operation='-')
+        return self.__calc__(other, operation='-', inplace=True)
 
     def __imul__(self, other):
-        return self.__calc__(other, operation='*')
+        return self.__calc__(other, operation='*', inplace=True)
 
     def __idiv__(self, other):
-        return self.__calc__(other, operation='/')
+        return self.__calc__(other, operation='/', inplace=True)
 
     def __itruediv__(self, other):
-        return self.__calc__(other, operation='/')
+        return self.__calc__(other, operation='/', inplace=True)
 
 
 class CurveSliding(Curve):
@@ -141,30 +281,358 @@ class CurveSliding(Curve):
 
         hist = stepwise, only input y are possible returns when evaluted
         linear = linear interpolation between neigbouring X values.
+
+    lookup_size : int or None, optional (default=None)
+        See Curve.
+
+    combination_mode : ['overlapping', 'single'], optional
+        How the windows are combined (default='single'):
+
+        overlapping = a point for each window edge, with the mean y of
+            all windows containing the edge
+        single = a point for each window center
+
+    window_weights : np.array, shape=(n_steps), optional
+        Weights of the windows, e.g. their occupancy, used for the mean
+        in the 'overlapping' mode. If None, all windows have the same
+        weight.
     """
     def __init__(self,
                  edges,
                  y_input,
                  mode='linear',
-                 combination_mode='single'):
+                 combination_mode='single',
+                 window_weights=None,
+                 lookup_size=None):
         self.combination_mode = combination_mode
+        self.window_weights = window_weights
         self.mode = mode.lower()
         assert self.mode in ['hist', 'linear'], \
             'Invalid mode [\'hist\', \'linear\']'
         assert self.combination_mode in ['overlapping', 'single'], \
             'Invalid mode [\'overlapping\', \'single\']'
         self.x, self.y = self.setup_x_y(edges, y_input)
-        self.setup_curve(mode)
+        self.setup_curve(self.mode, lookup_size=lookup_size)
 
     def setup_x_y(self, edges, y_input):
         if self.combination_mode == 'overlapping':
-            switch_points = np.sort(np.unique(edges))[:-1]
-            y_values = np.zeros_like(switch_points)
-            for i, x_i in enumerate(switch_points):
-                idx = np.logical_and(edges[:, 0] <= x_i,
-                                     edges[:, 1] > x_i)
-                y_values[i] = np.mean(y_input[idx])
+            edges = np.asarray(edges, dtype=float)
+            switch_points = np.unique(edges)[:-1]
+            if self.window_weights is None:
+                weights = np.ones(len(edges))
+            else:
+                weights = np.asarray(self.window_weights, dtype=float)
+            sum_y = self.__sum_overlapping__(edges, weights * y_input,
+                                             switch_points)
+            sum_weights = self.__sum_overlapping__(edges, weights,
+                                                   switch_points)
+            y_values = np.full(len(switch_points), np.nan)
+            np.divide(sum_y, sum_weights, out=y_values,
+                      where=sum_weights != 0)
             return switch_points, y_values
         elif self.combination_mode == 'single':
             window_mids = (edges[:, 1] + edges[:, 0]) / 2.
             return window_mids, y_input
+
+    def __sum_overlapping__(self, edges, values, x):
+        """Sums the values of all windows with lower <= x < upper as
+        the sum over windows started minus windows ended before x.
+        """
+        sums = []
+        for edge_i in [edges[:, 0], edges[:, 1]]:
+            order = np.argsort(edge_i, kind='mergesort')
+            cumsum = np.zeros(len(order) + 1)
+            np.cumsum(values[order], out=cumsum[1:])
+            idx = np.searchsorted(edge_i[order], x, side='right')
+            sums.append(cumsum[idx])
+        return sums[0] - sums[1]
+
+
+class CurveBank(object):
+    """Several curves evaluated at once on a merged grid.
+
+    The breakpoints of all curves (x values of 'linear' and step
+    edges of 'hist' curves) are merged into one grid. Between two
+    neighbouring grid points each curve is linear, so it is described
+    by a slope and offset per grid segment. The points are digitized
+    once for all curves. The slopes/offsets are taken from the
+    tables of the curves, so the results are identical to the exact
+    evaluation of each curve (lookup tables of the curves are not
+    used).
+
+    Parameters
+    ----------
+    curves : list of Curve
+        The curves (Curve or CurveSliding).
+
+    Attributes
+    ----------
+    grid : 1d array, shape=(n_grid)
+        Merged breakpoints.
+
+    slope : 2d array, shape=(n_grid + 1, n_curves)
+        Slope of each curve in each segment.
+
+    offset : 2d array, shape=(n_grid + 1, n_curves)
+        Offset of each curve in each segment.
+    """
+    def __init__(self, curves):
+        self.curves = list(curves)
+        if len(self.curves) == 0:
+            raise ValueError('No curves provided!')
+        breakpoints = [self.__get_breakpoints__(curve)
+                       for curve in self.curves]
+        self.grid = np.unique(np.concatenate(breakpoints))
+        # A point inside of each segment of the grid
+        segment_points = np.zeros(len(self.grid) + 1)
+        if len(self.grid) > 0:
+            segment_points[0] = self.grid[0] - 1.
+            segment_points[1:-1] = (self.grid[1:] + self.grid[:-1]) / 2.
+            segment_points[-1] = self.grid[-1]
+        self.slope = np.zeros((len(segment_points), len(self.curves)))
+        self.offset = np.zeros_like(self.slope)
+        for i, [curve, breakpoints_i] in enumerate(zip(self.curves,
+                                                       breakpoints)):
+            digitized = np.digitize(segment_points, breakpoints_i)
+            if curve.mode == 'linear':
+                self.slope[:, i] = curve.slope[digitized]
+                self.offset[:, i] = curve.offset[digitized]
+            else:
+                self.offset[:, i] = curve.y[digitized]
+
+    @classmethod
+    def from_cutters(cls, cutters):
+        """Creates a CurveBank of the cut curves of fitted
+        ConfidenceCutters. 'decide' with the confidences and X_o of the
+        examples gives the predictions of all cutters.
+        """
+        return cls([cutter.cut_opts.curve for cutter in cutters])
+
+    def __get_breakpoints__(self, curve):
+        if curve.mode == 'linear':
+            return np.asarray(curve.x)
+        return np.asarray(curve.edges)
+
+    @property
+    def n_curves(self):
+        return len(self.curves)
+
+    def __call__(self, x, out=None, chunk_size=65536):
+        """Evaluates all curves.
+
+        Parameters
+        ----------
+        x : 1d array-like, shape=(n_samples)
+            Points to evaluate.
+
+        out : array, shape=(n_samples, n_curves), optional
+            Array the results are written to.
+
+        chunk_size : int, optional (default=65536)
+            Number of points processed at once.
+
+        Returns
+        -------
+        y : array, shape=(n_samples, n_curves)
+            Values of all curves.
+        """
+        x = np.asarray(x, dtype=float)
+        if out is None:
+            out = np.empty((len(x), self.n_curves))
+        for start in range(0, len(x), chunk_size):
+            x_i = x[start:start + chunk_size]
+            digitized = np.digitize(x_i, self.grid)
+            out_i = out[start:start + chunk_size]
+            np.multiply(x_i[:, np.newaxis], self.slope[digitized], out=out_i)
+            out_i += self.offset[digitized]
+        return out
+
+    def decide(self, confidence, x, out=None, chunk_size=65536):
+        """Compares the confidences to all curves.
+
+        Parameters
+        ----------
+        confidence : 1d array-like, shape=(n_samples)
+            Confidences of the examples.
+
+        x : 1d array-like, shape=(n_samples)
+            Points at which the curves are evaluated (X_o).
+
+        out : array, shape=(n_samples, n_curves), optional
+            Array the decisions are written to (e.g. bool or uint8).
+
+        chunk_size : int, optional (default=65536)
+            Number of examples processed at once.
+
+        Returns
+        -------
+        decisions : array, shape=(n_samples, n_curves)
+            confidence >= curve(x) for each curve. Bool if out is None.
+        """
+        confidence = np.asarray(confidence)
+        x = np.asarray(x, dtype=float)
+        if out is None:
+            out = np.empty((len(x), self.n_curves), dtype=bool)
+        for start in range(0, len(x), chunk_size):
+            stop = start + chunk_size
+            thresholds = self(x[start:stop], chunk_size=chunk_size)
+            np.greater_equal(confidence[start:stop, np.newaxis],
+                             thresholds,
+                             out=out[start:stop],
+                             casting='unsafe')
+        return out
+
+
+REDUCTIONS = {'sum': lambda values, q: np.sum(values, axis=1),
+              'mean': lambda values, q: np.mean(values, axis=1),
+              'min': lambda values, q: np.min(values, axis=1),
+              'max': lambda values, q: np.max(values, axis=1),
+              'median': lambda values, q: np.median(values, axis=1),
+              'quantile': lambda values, q: np.percentile(values,
+                                                          100. * q,
+                                                          axis=1)}
+
+
+def reduce_curves(curves, operation='mean', q=None):
+    """Combines many curves into one curve in a single pass.
+
+    All curves are evaluated on the union of their x values at once
+    (see CurveBank) and reduced pointwise. 'sum' and 'mean' of
+    'linear' curves are exact. For the other operations, the result
+    is exact at the x values; crossings of curves between them are
+    not resolved.
+
+    Parameters
+    ----------
+    curves : list of Curve
+        Curves to combine.
+
+    operation : ['sum', 'mean', 'min', 'max', 'median', 'quantile']
+        Pointwise reduction (default='mean').
+
+    q : float, optional
+        Quantile in [0, 1] for operation='quantile'.
+
+    Returns
+    -------
+    curve : Curve
+        Curve with the mode and lookup_size of the first curve.
+    """
+    curves = list(curves)
+    if operation not in REDUCTIONS:
+        raise ValueError('Invalid operation {}'.format(sorted(REDUCTIONS)))
+    if operation == 'quantile' and q is None:
+        raise ValueError('\'q\' has to be provided for \'quantile\'!')
+    if len(curves) == 0:
+        raise ValueError('No curves provided!')
+    x = np.unique(np.concatenate([curve.x for curve in curves]))
+    values = CurveBank(curves)(x)
+    return Curve(x,
+                 REDUCTIONS[operation](values, q),
+                 mode=curves[0].mode,
+                 lookup_size=getattr(curves[0], 'lookup_size', None))
+
+
+GAP_FILLING = ['linear', 'nearest', 'hold', 'spline']
+
+
+def fill_gaps(values, x=None, strategy='linear', smoothing=None):
+    """Fills non-finite values (gaps) of each column of 'values'.
+    Leading and trailing gaps are filled with the first/last finite
+    value of the column for all strategies.
+
+    Parameters
+    ----------
+    values : array-like, shape=(n_steps) or (n_steps, n_columns)
+        Values with gaps, e.g. the cuts of each window for each
+        bootstrap.
+
+    x : array-like, shape=(n_steps) or None
+        Sorted positions of the values. If None, the indices are used.
+
+    strategy : ['linear', 'nearest', 'hold', 'spline'], optional
+        How gaps are filled (default='linear'):
+
+        linear = linear interpolation between the neighbouring values
+        nearest = value of the nearest neighbour (the previous for ties)
+        hold = previous finite value
+        spline = cubic smoothing spline (scipy.interpolate) of the
+                 finite values of the column; values at the same x
+                 are averaged and columns with less than five
+                 distinct x are filled linearly
+
+    smoothing : float or None, optional
+        Regularization parameter 'lam' of the spline. If None, it is
+        chosen by generalized cross-validation.
+
+    Returns
+    -------
+    filled : array, shape like values
+        Filled copy of values. The finite values are unchanged.
+    """
+    if strategy not in GAP_FILLING:
+        raise ValueError('Invalid strategy {}'.format(GAP_FILLING))
+    values = np.array(values, dtype=float)
+    is_1d = values.ndim == 1
+    if is_1d:
+        values = values[:, np.newaxis]
+    n_steps = values.shape[0]
+    if x is None:
+        x = np.arange(n_steps, dtype=float)
+    else:
+        x = np.asarray(x, dtype=float)
+    is_valid = np.isfinite(values)
+    if not np.all(np.any(is_valid, axis=0)):
+        raise ValueError('Each column needs at least one finite value!')
+    if np.all(is_valid):
+        return values[:, 0] if is_1d else values
+    # Index of the previous/next finite value for each entry
+    idx = np.arange(n_steps)[:, np.newaxis]
+    idx_prev = np.maximum.accumulate(np.where(is_valid, idx, -1), axis=0)
+    idx_next = np.minimum.accumulate(
+        np.where(is_valid, idx, n_steps)[::-1], axis=0)[::-1]
+    is_leading = idx_prev < 0
+    is_trailing = idx_next >= n_steps
+    idx_prev[is_leading] = idx_next[is_leading]
+    idx_next[is_trailing] = idx_prev[is_trailing]
+    columns = np.arange(values.shape[1])[np.newaxis, :]
+    value_prev = values[idx_prev, columns]
+    value_next = values[idx_next, columns]
+    if strategy == 'hold':
+        filled = value_prev
+    else:
+        x_prev = x[idx_prev]
+        x_next = x[idx_next]
+        x_step = np.broadcast_to(x[:, np.newaxis], values.shape)
+        if strategy == 'nearest':
+            filled = np.where(x_next - x_step < x_step - x_prev,
+                              value_next,
+                              value_prev)
+        else:
+            gap_width = x_next - x_prev
+            weight = np.zeros_like(values)
+            np.divide(x_step - x_prev, gap_width,
+                      out=weight, where=gap_width > 0)
+            filled = value_prev + weight * (value_next - value_prev)
+            if strategy == 'spline':
+                from scipy.interpolate import make_smoothing_spline
+                is_inner = ~(is_valid | is_leading | is_trailing)
+                use_spline = np.logical_and(np.any(is_inner, axis=0),
+                                            np.sum(is_valid, axis=0) > 4)
+                for i in np.where(use_spline)[0]:
+                    # The spline needs strictly increasing x
+                    x_unique, inverse, counts = np.unique(
+                        x[is_valid[:, i]],
+                        return_inverse=True,
+                        return_counts=True)
+                    if len(x_unique) <= 4:
+                        continue
+                    y_mean = np.bincount(inverse,
+                                         weights=values[is_valid[:, i], i])
+                    filled[is_inner[:, i], i] = make_smoothing_spline(
+                        x_unique,
+                        y_mean / counts,
+                        w=counts,
+                        lam=smoothing)(x[is_inner[:, i]])
+    filled[is_valid] = values[is_valid]
+    return filled[:, 0] if is_1d else filled
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+import glob
+import json
+import os
+import struct
+
+import numpy as np
+
+from .curve import Curve
+
+
+MAGIC = b'TACOCRV\x00'
+FORMAT_VERSION = 1
+CURVE_EXTENSION = '.tcurve'
+# Data blocks start at multiples of ALIGNMENT bytes
+ALIGNMENT = 64
+# magic, format version, length of the json header
+PREAMBLE = struct.Struct('<8sII')
+# Prefix of the stored evaluation tables of the curve (Curve.get_tables)
+TABLE_PREFIX = 'curve_'
+
+
+def _padding(n_bytes):
+    return (-n_bytes) % ALIGNMENT
+
+
+def _json_default(obj):
+    # numpy scalars/arrays in the header
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return repr(obj)
+
+
+def write_curve(filename, arrays, header=None):
+    """Writes arrays and a json header into the binary curve format.
+
+    Layout of the file:
+        8 bytes magic, uint32 format version, uint32 header length,
+        utf-8 json header, and the arrays as little-endian raw data
+        aligned to 64 bytes. The header lists offset, shape and dtype
+        of each array, so the arrays can be memory-mapped.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the file. CURVE_EXTENSION is added if missing.
+
+    arrays : dict
+        Arrays to store. Has to contain 'x' and 'y' of the curve.
+        Arrays starting with TABLE_PREFIX are the evaluation tables of
+        the curve (see curve_arrays).
+
+    header : dict, optional
+        Json serializable meta data.
+
+    Returns
+    -------
+    filename : str
+        Path of the written file.
+    """
+    if not filename.endswith(CURVE_EXTENSION):
+        filename += CURVE_EXTENSION
+    for key in ['x', 'y']:
+        if key not in arrays:
+            raise ValueError('\'{}\' of the curve is missing!'.format(key))
+    header = dict(header or {})
+    header['version'] = FORMAT_VERSION
+    data = []
+    array_specs = {}
+    offset = 0
+    for key in sorted(arrays):
+        array = np.asarray(arrays[key])
+        dtype = array.dtype.newbyteorder('<')
+        array = np.ascontiguousarray(array, dtype=dtype)
+        array_specs[key] = {'offset': offset,
+                            'shape': list(array.shape),
+                            'dtype': dtype.str}
+        data.append(array)
+        offset += array.nbytes + _padding(array.nbytes)
+    header['arrays'] = array_specs
+    header_bytes = json.dumps(header,
+                              sort_keys=True,
+                              default=_json_default).encode('utf-8')
+    header_bytes += b' ' * _padding(PREAMBLE.size + len(header_bytes))
+    with open(filename, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for array in data:
+            f.write(array.tobytes())
+            f.write(b'\x00' * _padding(array.nbytes))
+    return filename
+
+
+def is_curve_file(filename):
+    """Returns True if the file starts with the magic of the binary
+    curve format.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+
+def read_header(filename):
+    """Reads the json header of a binary curve file.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the file.
+
+    Returns
+    -------
+    header : dict
+        The header. 'data_offset' is added with the start of the
+        array data in the file.
+    """
+    with open(filename, 'rb') as f:
+        magic, version, header_length = PREAMBLE.unpack(
+            f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError('{} is no curve file!'.format(filename))
+        if version > FORMAT_VERSION:
+            raise ValueError('Curve file version {} is newer than the '
+                             'supported version {}!'.format(version,
+                                                            FORMAT_VERSION))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    header['data_offset'] = PREAMBLE.size + header_length
+    return header
+
+
+def read_curve(filename, mmap=True):
+    """Reads a binary curve file.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the file. CURVE_EXTENSION is added if the file does not
+        exist without it.
+
+    mmap : boolean, optional (default=True)
+        If True, the arrays are read-only memory maps of the file, so
+        processes opening the same file share the memory and only the
+        accessed pages are read.
+
+    Returns
+    -------
+    header : dict
+        See read_header.
+
+    arrays : dict
+        The stored arrays.
+    """
+    if not os.path.exists(filename) and \
+            not filename.endswith(CURVE_EXTENSION):
+        filename += CURVE_EXTENSION
+    header = read_header(filename)
+    arrays = {}
+    for key, spec in header['arrays'].items():
+        offset = header['data_offset'] + spec['offset']
+        dtype = np.dtype(spec['dtype'])
+        shape = tuple(spec['shape'])
+        count = int(np.prod(shape))
+        if mmap and count > 0:
+            arrays[key] = np.memmap(filename,
+                                    dtype=dtype,
+                                    mode='r',
+                                    offset=offset,
+                                    shape=shape)
+        else:
+            with open(filename, 'rb') as f:
+                f.seek(offset)
+                arrays[key] = np.fromfile(f, dtype=dtype,
+                                          count=count).reshape(shape)
+    return header, arrays
+
+
+def curve_from_file(header, arrays):
+    """Creates the Curve of read_curve results. The evaluation tables
+    stored with the curve (arrays starting with TABLE_PREFIX) are used
+    directly, so a memory-mapped curve allocates no arrays.
+    """
+    tables = {key[len(TABLE_PREFIX):]: array
+              for key, array in arrays.items()
+              if key.startswith(TABLE_PREFIX)}
+    return Curve(arrays['x'],
+                 arrays['y'],
+                 mode=header.get('mode', 'linear'),
+                 lookup_size=header.get('lookup_size'),
+                 tables=tables)
+
+
+def curve_arrays(curve):
+    """Returns the arrays of a Curve to store with write_curve: x, y
+    and the evaluation tables of the curve (see Curve.get_tables)."""
+    arrays = {'x': curve.x, 'y': curve.y}
+    for key, table in curve.get_tables().items():
+        arrays[TABLE_PREFIX + key] = table
+    return arrays
+
+
+class CurveStack(object):
+    """Curves of several files. The arrays of each file are kept as
+    returned by read_curve, so with memory maps nothing is copied and
+    only the pages of the evaluated curves are read.
+
+    Parameters
+    ----------
+    names : list of str
+        Names of the curves (file names without extension).
+
+    headers : list of dict
+        Headers of the curve files.
+
+    arrays : list of dict
+        Arrays of the curve files (see read_curve).
+
+    Attributes
+    ----------
+    common_x : 1d array or None
+        If all curves share the same x values, the x values.
+    """
+    def __init__(self, names, headers, arrays):
+        self.names = list(names)
+        self.headers = list(headers)
+        self.arrays = list(arrays)
+        self.common_x = None
+        self._y_matrix = None
+        if len(self.arrays) > 0:
+            x_0 = self.arrays[0]['x']
+            if all(np.array_equal(arrays_i['x'], x_0)
+                   for arrays_i in self.arrays[1:]):
+                self.common_x = x_0
+
+    @property
+    def y_matrix(self):
+        """2d array or None, shape=(n_curves, n_points): If all curves
+        share the same x values, the y values with a row per curve.
+        Built on the first access, which reads the y values of all
+        files into memory.
+        """
+        if self.common_x is None:
+            return None
+        if self._y_matrix is None:
+            self._y_matrix = np.vstack([arrays_i['y']
+                                        for arrays_i in self.arrays])
+        return self._y_matrix
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, idx):
+        """Returns the Curve of the curve with index or name idx."""
+        if not isinstance(idx, (int, np.integer)):
+            idx = self.names.index(idx)
+        return curve_from_file(self.headers[idx], self.arrays[idx])
+
+
+def load_curves(directory, pattern='*' + CURVE_EXTENSION, mmap=True):
+    """Loads all curve files of a directory into a CurveStack.
+
+    Parameters
+    ----------
+    directory : str
+        Directory containing the curve files.
+
+    pattern : str, optional
+        Glob pattern of the files (default='*.tcurve').
+
+    mmap : boolean, optional (default=True)
+        If True, the arrays of the stack are memory maps of the files
+        (see read_curve).
+
+    Returns
+    -------
+    stack : CurveStack
+        The curves, sorted by file name.
+    """
+    filenames = sorted(glob.glob(os.path.join(directory, pattern)))
+    names = []
+    headers = []
+    arrays = []
+    for filename in filenames:
+        header, arrays_i = read_curve(filename, mmap=mmap)
+        names.append(os.path.splitext(os.path.basename(filename))[0])
+        headers.append(header)
+        arrays.append(arrays_i)
+    return CurveStack(names, headers, arrays)
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import criteria
+from .search import find_best_binned_cuts
+from .statistics import histogram_confusion_counts
+
+
+def _box_sum(hist, window_cells):
+    """Sums each cell of 'hist' with its neighbours within window_cells
+    cells along each axis (windows are clipped at the borders). The
+    sums along each axis are differences of cumulative sums.
+    """
+    for axis, n_cells in enumerate(window_cells):
+        if n_cells == 0:
+            continue
+        size = hist.shape[axis]
+        cumsum_shape = list(hist.shape)
+        cumsum_shape[axis] += 1
+        cumsum = np.zeros(cumsum_shape)
+        np.cumsum(hist,
+                  axis=axis,
+                  out=cumsum[(slice(None),) * axis + (slice(1, None),)])
+        idx = np.arange(size)
+        upper = np.minimum(idx + n_cells + 1, size)
+        lower = np.maximum(idx - n_cells, 0)
+        hist = np.take(cumsum, upper, axis=axis) - \
+            np.take(cumsum, lower, axis=axis)
+    return hist
+
+
+class GridConfidenceCutter(object):
+    """Method to find a confidence (X_c) cut surface depending on
+    several observables (X_o).
+
+    The observables are divided into a grid of cells. Each event is
+    binned once into a weighted confidence histogram of its cell. The
+    sliding windows are hyper-rectangles of (2 * window_cells + 1)
+    cells around each cell and their histograms are sums of the cell
+    histograms. The cut of each cell is searched on the confusion
+    matrices of its window (see search.find_best_binned_cuts). The
+    memory footprint depends on the number of cells and confidence bins
+    and not on the number of events, so fit can process large samples
+    in chunks.
+
+    Parameters
+    ----------
+    bins : int, sequence of int or sequence of arrays
+        Cells of the observables. An int is the number of equal width
+        cells between the min/max of an observable (for all observables,
+        if bins is an int). An array gives the cell edges.
+
+    window_cells : int or sequence of int, optional (default=1)
+        Half width of the windows in cells for each observable. 0 means
+        the window of a cell is the cell.
+
+    criteria : callable, optional
+        See ConfidenceCutter. A callable threshold receives the center
+        of a cell as 1d array (a float for a single observable).
+
+    conf_index : int, optional (default=0)
+        Column of X containing the confidence. The other columns are
+        the observables.
+
+    n_conf_bins : int, optional (default=1000)
+        Number of confidence bins. The cuts are the lower bin edges.
+
+    conf_range : tuple, optional (default=(0., 1.))
+        Range of the confidence bins. Confidences outside the range are
+        put into the first/last bin.
+
+    interpolation : ['linear', 'nearest'], optional
+        How the cut surface is evaluated between the cell centers
+        (default='linear'). Outside the centers the cut of the border
+        cell is used.
+
+    min_examples : int, optional (default=10)
+        Windows with not more than min_examples filled confidence bins
+        get no cut. Cells without a cut are filled with the cut of the
+        nearest cell with a cut (distance in cells).
+
+    cut_tolerance : float, optional (default=1e-3)
+        See ConfidenceCutter.
+
+    n_jobs : int, optional (default=0)
+        If n_jobs > 1, predict processes chunks with a thread pool.
+
+    chunk_size : int, optional (default=1048576)
+        Number of events binned/predicted at once.
+
+    Attributes
+    ----------
+    edges : list of arrays
+        Cell edges of each observable.
+
+    centers : list of arrays
+        Cell centers of each observable.
+
+    signal, background : arrays, shape=(n_cells_1, ..., n_conf_bins)
+        Weighted confidence histograms of the signal/background events
+        in each cell.
+
+    cut_values : array, shape=(n_cells_1, ..., n_cells_n)
+        Cut of each cell (gaps filled).
+
+    cut_errors : array, shape=(n_cells_1, ..., n_cells_n)
+        Width of the confidence bin starting at the cut of each cell.
+        NaN for filled cells.
+    """
+    def __init__(self,
+                 bins=10,
+                 window_cells=1,
+                 criteria=criteria.purity_criteria(threshold=0.99),
+                 conf_index=0,
+                 n_conf_bins=1000,
+                 conf_range=(0., 1.),
+                 interpolation='linear',
+                 min_examples=10,
+                 cut_tolerance=1e-3,
+                 n_jobs=0,
+                 chunk_size=2**20):
+        assert interpolation in ['linear', 'nearest'], \
+            'Invalid interpolation [\'linear\', \'nearest\']'
+        self.bins = bins
+        self.window_cells = window_cells
+        self.criteria = criteria
+        self.conf_index = conf_index
+        self.n_conf_bins = n_conf_bins
+        self.conf_range = conf_range
+        self.interpolation = interpolation
+        self.min_examples = min_examples
+        self.cut_tolerance = cut_tolerance
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.edges = None
+        self.centers = None
+        self.signal = None
+        self.background = None
+        self.cut_values = None
+        self.cut_errors = None
+        self.interpolator = None
+
+    @property
+    def n_dims(self):
+        return len(self.edges)
+
+    @property
+    def grid_shape(self):
+        return tuple(len(edges_i) - 1 for edges_i in self.edges)
+
+    def __get_observables__(self, X):
+        assert X.ndim == 2 and X.shape[1] >= 2, \
+            'X must have the shape (n_events, 1 + n_observables)'
+        return [i for i in range(X.shape[1]) if i != self.conf_index]
+
+    def __split_chunk__(self, X, start, stop):
+        # Only the rows of the chunk are copied
+        X_chunk = X[start:stop]
+        return X_chunk[:, self.__get_observables__(X)], \
+            X_chunk[:, self.conf_index]
+
+    def __get_range__(self, X):
+        """Finite min/max of each observable, determined in chunks."""
+        X_o_range = []
+        for i in self.__get_observables__(X):
+            min_i, max_i = np.inf, -np.inf
+            for start in range(0, X.shape[0], self.chunk_size):
+                column = X[start:start + self.chunk_size, i]
+                column = column[np.isfinite(column)]
+                if len(column) > 0:
+                    min_i = min(min_i, np.min(column))
+                    max_i = max(max_i, np.max(column))
+            if min_i > max_i:
+                raise ValueError('Observable without finite values!')
+            X_o_range.append((min_i, max_i))
+        return X_o_range
+
+    def __has_edges__(self):
+        if isinstance(self.bins, (int, np.integer)):
+            return False
+        return all(np.ndim(bins_i) > 0 for bins_i in self.bins)
+
+    def __init_grid__(self, X_o_range):
+        n_dims = len(X_o_range)
+        bins = self.bins
+        if isinstance(bins, (int, np.integer)):
+            bins = [bins] * n_dims
+        if len(bins) != n_dims:
+            raise ValueError('\'bins\' needs an entry for each observable!')
+        self.edges = []
+        for bins_i, (min_i, max_i) in zip(bins, X_o_range):
+            if np.ndim(bins_i) == 0:
+                edges_i = np.linspace(min_i, max_i, int(bins_i) + 1)
+            else:
+                edges_i = np.array(bins_i, dtype=float)
+            self.edges.append(edges_i)
+        self.centers = [(edges_i[1:] + edges_i[:-1]) / 2.
+                        for edges_i in self.edges]
+        hist_shape = self.grid_shape + (self.n_conf_bins,)
+        self.signal = np.zeros(hist_shape)
+        self.background = np.zeros(hist_shape)
+
+    def __fill__(self, X_o, X_c, y, sample_weight=None):
+        grid_shape = self.grid_shape
+        # Events with non-finite values are not filled
+        in_grid = np.isfinite(X_c)
+        cells = []
+        for i, edges_i in enumerate(self.edges):
+            in_grid &= np.isfinite(X_o[:, i])
+            cell = np.searchsorted(edges_i, X_o[:, i], side='right') - 1
+            # The upper edge belongs to the last cell
+            cell[X_o[:, i] == edges_i[-1]] = grid_shape[i] - 1
+            in_grid &= np.logical_and(cell >= 0, cell < grid_shape[i])
+            cells.append(cell)
+        cells = [cell[in_grid] for cell in cells]
+        conf_min, conf_max = self.conf_range
+        conf_bin = (np.asarray(X_c)[in_grid] - conf_min) * \
+            (self.n_conf_bins / (conf_max - conf_min))
+        conf_bin = np.clip(conf_bin, 0, self.n_conf_bins - 1).astype(int)
+        flat_idx = np.ravel_multi_index(cells, grid_shape) * \
+            self.n_conf_bins + conf_bin
+        is_signal = np.asarray(y, dtype=bool)[in_grid]
+        if sample_weight is None:
+            weights = np.ones(len(flat_idx))
+        else:
+            weights = np.asarray(sample_weight, dtype=float)[in_grid]
+        n_flat = self.signal.size
+        self.signal += np.bincount(flat_idx[is_signal],
+                                   weights=weights[is_signal],
+                                   minlength=n_flat).reshape(
+                                       self.signal.shape)
+        self.background += np.bincount(flat_idx[~is_signal],
+                                       weights=weights[~is_signal],
+                                       minlength=n_flat).reshape(
+                                           self.background.shape)
+
+    def fit(self, X, y, sample_weight=None):
+        """Fit estimator. The events are binned in chunks of
+        chunk_size events.
+
+        Parameters
+        ----------
+        X : array-like shape=(n_samples, 1 + n_observables)
+            The input samples. With the confidence at index 'conf_index'
+            (default=0) and the observables as the other columns.
+
+        y : array-like, shape=(n_samples)
+            The target values (class labels in classification,
+            possible_classed=[0, 1]).
+
+        sample_weight : array-like, shape=(n_samples) or None
+            Sample weights. If None, then samples are equally weighted.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        X = np.asarray(X)
+        X_o_range = self.__get_range__(X)
+        self.edges = None
+        return self.partial_fit(X, y, sample_weight, X_o_range=X_o_range)
+
+    def partial_fit(self, X, y, sample_weight=None, X_o_range=None):
+        """Fit estimator on a chunk of the data. The chunk is added to
+        the histograms and the cut surface is derived from the
+        accumulated histograms.
+
+        Parameters
+        ----------
+        X, y, sample_weight
+            See fit.
+
+        X_o_range : sequence of (min, max) or None
+            Range of each observable used to place the cells at the
+            first call, if 'bins' contains numbers of cells. Later calls
+            ignore it.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        X = np.asarray(X)
+        n_observables = len(self.__get_observables__(X))
+        assert len(y) == X.shape[0], 'len(X) and len(y) must be the same'
+        if sample_weight is not None:
+            assert len(y) == len(sample_weight), 'weights and y need the' \
+                'same length'
+        if self.edges is None:
+            if X_o_range is None:
+                if self.__has_edges__():
+                    X_o_range = [(None, None)] * n_observables
+                else:
+                    raise ValueError('Without cell edges the X_o_range has '
+                                     'to be provided to place the cells!')
+            self.__init_grid__(X_o_range)
+        if n_observables != self.n_dims:
+            raise ValueError('X has {} observables, the grid {}!'.format(
+                n_observables, self.n_dims))
+        for start in range(0, len(y), self.chunk_size):
+            stop = start + self.chunk_size
+            X_o, X_c = self.__split_chunk__(X, start, stop)
+            self.__fill__(X_o,
+                          X_c,
+                          np.asarray(y)[start:stop],
+                          None if sample_weight is None
+                          else np.asarray(sample_weight)[start:stop])
+        self.__generate_surface__()
+        return self
+
+    def __generate_surface__(self):
+        window_cells = self.window_cells
+        if np.ndim(window_cells) == 0:
+            window_cells = [window_cells] * self.n_dims
+        n_cells = int(np.prod(self.grid_shape))
+        signal = _box_sum(self.signal, window_cells).reshape(
+            n_cells, self.n_conf_bins)
+        background = _box_sum(self.background, window_cells).reshape(
+            n_cells, self.n_conf_bins)
+        tp, fp, tn, fn, is_cut = histogram_confusion_counts(signal,
+                                                            background)
+        positions = np.stack(np.meshgrid(*self.centers, indexing='ij'),
+                             axis=-1).reshape(n_cells, self.n_dims)
+        if self.n_dims == 1:
+            positions = positions[:, 0]
+        conf_bins = np.linspace(self.conf_range[0],
+                                self.conf_range[1],
+                                self.n_conf_bins + 1)
+        cut_values = find_best_binned_cuts(conf_bins[:-1],
+                                           tp, fp, tn, fn, is_cut,
+                                           self.criteria,
+                                           positions,
+                                           min_examples=self.min_examples,
+                                           tolerance=self.cut_tolerance)
+        cut_values = cut_values.reshape(self.grid_shape)
+        is_valid = np.isfinite(cut_values)
+        if not np.any(is_valid):
+            raise RuntimeError('No valid cuts found!')
+        cut_errors = np.full(self.grid_shape, np.nan)
+        idx_bin = np.searchsorted(conf_bins, cut_values[is_valid])
+        cut_errors[is_valid] = np.diff(conf_bins)[idx_bin]
+        if not np.all(is_valid):
+            from scipy.ndimage import distance_transform_edt
+            nearest = distance_transform_edt(~is_valid,
+                                             return_distances=False,
+                                             return_indices=True)
+            cut_values = cut_values[tuple(nearest)]
+        self.cut_values = cut_values
+        self.cut_errors = cut_errors
+        self.__init_interpolator__()
+
+    def __init_interpolator__(self):
+        from scipy.interpolate import RegularGridInterpolator
+        self.interpolator = RegularGridInterpolator(self.centers,
+                                                    self.cut_values,
+                                                    method=self.interpolation,
+                                                    bounds_error=False,
+                                                    fill_value=None)
+
+    def get_cut(self, X_o):
+        """Evaluates the cut surface.
+
+        Parameters
+        ----------
+        X_o : array-like, shape=(n_samples, n_observables)
+            Observables of the samples.
+
+        Returns
+        -------
+        cuts : array, shape=(n_samples)
+            Cut at each sample.
+        """
+        X_o = np.array(X_o, dtype=float, ndmin=2)
+        for i, centers_i in enumerate(self.centers):
+            np.clip(X_o[:, i], centers_i[0], centers_i[-1], out=X_o[:, i])
+        return self.interpolator(X_o)
+
+    def predict(self, X, out=None, dtype=None, chunk_size=None):
+        """Predict class for X. An example is predicted as positive (1)
+        if its confidence is greater or equal than the cut surface at
+        its observables.
+
+        Parameters
+        ----------
+        X : array-like shape=(n_samples, 1 + n_observables)
+            The input samples. See fit.
+
+        out : array, shape=(n_samples), optional
+            Array the predicted classes are written to.
+
+        dtype : numpy dtype, optional
+            Type of the returned array, e.g. bool or np.uint8. If None,
+            the type of 'out' or int is used.
+
+        chunk_size : int, optional
+            Number of examples processed at once. If None, the
+            chunk_size of the estimator is used.
+
+        Returns
+        -------
+        y_pred : array of shape = [n_samples]
+            The predicted classes.
+        """
+        X = np.asarray(X)
+        self.__get_observables__(X)
+        n_samples = X.shape[0]
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        if out is None:
+            if dtype is None:
+                dtype = int
+            out = np.empty(n_samples, dtype=dtype)
+        elif out.shape != (n_samples,):
+            raise ValueError('\'out\' must have the shape (n_samples,)')
+        elif dtype is not None and np.dtype(dtype) != out.dtype:
+            raise ValueError('\'dtype\' and the type of \'out\' differ')
+
+        def predict_chunk(start):
+            stop = start + chunk_size
+            X_o, X_c = self.__split_chunk__(X, start, stop)
+            np.greater_equal(X_c,
+                             self.get_cut(X_o),
+                             out=out[start:stop],
+                             casting='unsafe')
+
+        chunk_starts = range(0, n_samples, chunk_size)
+        if self.n_jobs > 1 and n_samples > chunk_size:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                list(executor.map(predict_chunk, chunk_starts))
+        else:
+            for start in chunk_starts:
+                predict_chunk(start)
+        return out
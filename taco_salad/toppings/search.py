@@ -0,0 +1,603 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+import numpy as np
+
+
+def confusion_counts(confidence, y_true, sample_weight=None):
+    """Calculates the weighted confusion matrix for every possible cut
+    on the confidence. The confidences are sorted once and the counts
+    for all cuts are obtained from cumulative sums.
+
+    An example is predicted as positive if confidence >= cut. The
+    possible cuts are the unique confidence values.
+
+    Parameters
+    ----------
+    confidence : 1d array-like, shape=(n_samples)
+        Confidence values of the examples.
+
+    y_true : 1d array-like, shape=(n_samples)
+        Ground truth (correct) target values. Only binary
+        classification is supported.
+
+    sample_weight : array-like, shape=(n_samples) or (n_samples, n_sets)
+        Sample weights. If None, then samples are equally weighted.
+        If 2d, the counts are calculated for each set of weights
+        (e.g. one set per bootstrap).
+
+    Returns
+    -------
+    cuts : 1d array, shape=(n_cuts)
+        Sorted unique confidence values.
+
+    tp : array, shape=(n_cuts) or (n_cuts, n_sets)
+        Weighted true positives for each cut.
+
+    fp : array, shape=(n_cuts) or (n_cuts, n_sets)
+        Weighted false positives for each cut.
+
+    tn : array, shape=(n_cuts) or (n_cuts, n_sets)
+        Weighted true negatives for each cut.
+
+    fn : array, shape=(n_cuts) or (n_cuts, n_sets)
+        Weighted false negatives for each cut.
+    """
+    cuts, first_idx, y_sorted, weights = _sort_confidence(confidence,
+                                                          y_true,
+                                                          sample_weight)
+    tp, fp, tn, fn = _cumulative_counts(first_idx, y_sorted, weights)
+    return cuts, tp, fp, tn, fn
+
+
+def _cumulative_counts(first_idx, y_sorted, weights):
+    if weights.ndim > 1:
+        y_sorted = y_sorted[:, np.newaxis]
+    cumsum_shape = (weights.shape[0] + 1,) + weights.shape[1:]
+    sig_cumsum = np.zeros(cumsum_shape)
+    bkg_cumsum = np.zeros(cumsum_shape)
+    np.cumsum(np.where(y_sorted, weights, 0.), axis=0, out=sig_cumsum[1:])
+    np.cumsum(np.where(y_sorted, 0., weights), axis=0, out=bkg_cumsum[1:])
+
+    fn = sig_cumsum[first_idx]
+    tn = bkg_cumsum[first_idx]
+    tp = sig_cumsum[-1] - fn
+    fp = bkg_cumsum[-1] - tn
+    return tp, fp, tn, fn
+
+
+def _sort_confidence(confidence, y_true, sample_weight):
+    confidence = np.asarray(confidence)
+    order = np.argsort(confidence, kind='mergesort')
+    conf_sorted = confidence[order]
+    y_sorted = np.asarray(y_true, dtype=bool)[order]
+    if sample_weight is None:
+        weights = np.ones(len(conf_sorted))
+    else:
+        weights = np.asarray(sample_weight, dtype=float)[order]
+
+    is_first = np.ones(len(conf_sorted), dtype=bool)
+    is_first[1:] = conf_sorted[1:] != conf_sorted[:-1]
+    first_idx = np.flatnonzero(is_first)
+    return conf_sorted[first_idx], first_idx, y_sorted, weights
+
+
+def has_counts_evaluation(criteria):
+    """Returns True if the criteria provides an 'evaluate_counts'
+    function (see criteria.ConfusionMatrixCriteria)."""
+    return getattr(criteria, 'evaluate_counts', None) is not None
+
+
+def evaluate_criteria(criteria, tp, fp, tn, fn, position):
+    """Evaluates the criteria for arrays of confusion matrix entries.
+
+    The criteria has to provide an 'evaluate_counts' function (see
+    criteria.ConfusionMatrixCriteria), which evaluates all cuts at once.
+    Plain callables criteria(y_true, y_pred, position, sample_weights)
+    can only be evaluated on the examples (see find_best_cut).
+
+    Parameters
+    ----------
+    criteria : callable
+        See ConfidenceCutter.
+
+    tp, fp, tn, fn : array, shape=(n_cuts) or (n_windows, n_cuts)
+        Weighted confusion matrix entries for each cut.
+
+    position : float or array, shape=(n_windows) or (n_windows, n_dims)
+        Value(s) indicating the postion of the cut window(s). For
+        windows in several dimensions, each row is the position of a
+        window.
+
+    Returns
+    -------
+    criteria_values : array, same shape as tp
+        Value of the criteria for each cut.
+    """
+    if not has_counts_evaluation(criteria):
+        raise TypeError('The criteria has no \'evaluate_counts\' function! '
+                        'Confusion matrix counts can only be evaluated with '
+                        'criteria like criteria.ConfusionMatrixCriteria.')
+    return np.asarray(criteria.evaluate_counts(tp, fp, tn, fn, position),
+                      dtype=float)
+
+
+def _find_best_cut_masked(confidence,
+                          y_true,
+                          sample_weight,
+                          criteria,
+                          position,
+                          cuts,
+                          n_points=5,
+                          tolerance=0.):
+    """Coarse-to-fine search for plain callable criteria. The criteria
+    is evaluated on the examples for n_points cuts spread over the
+    sorted cuts and the search is repeated between the neighbours of
+    the best cut until all remaining cuts are tested.
+    """
+    def evaluate(cut):
+        y_pred = np.array(confidence >= cut, dtype=int)
+        return criteria(y_true,
+                        y_pred,
+                        position,
+                        sample_weights=sample_weight)
+
+    while True:
+        step_width = int(len(cuts) / (n_points - 1))
+        if step_width == 0:
+            criteria_values = np.array([evaluate(cut) for cut in cuts],
+                                       dtype=float)
+            return _select_cuts(cuts, criteria_values, tolerance)[()]
+        idx = np.arange(n_points) * step_width
+        idx[-1] = len(cuts) - 1
+        criteria_values = [evaluate(cut) for cut in cuts[idx]]
+        idx_min = int(np.argmin(criteria_values))
+        if idx_min == 0:
+            cuts = cuts[:idx[1]]
+        elif idx_min == n_points - 1:
+            cuts = cuts[idx[-2]:]
+        else:
+            cuts = cuts[idx[idx_min - 1]:idx[idx_min + 1]]
+
+
+def find_best_cut(confidence,
+                  y_true,
+                  sample_weight,
+                  criteria,
+                  position,
+                  min_examples=10,
+                  tolerance=0.):
+    """Finds the cut minimizing the criteria.
+
+    All unique confidence values of examples with a non-zero weight
+    are tested as cuts. The lowest cut
+    with a criteria value not larger than the minimal value plus the
+    tolerance is returned. Preferring the lowest cut keeps the cut from
+    jumping to high confidences, where few examples are left and the
+    criteria fluctuates.
+
+    Criteria with an 'evaluate_counts' function are evaluated for all
+    cuts at once. Plain callables are evaluated on the examples in a
+    coarse-to-fine search over the sorted cuts.
+
+    Parameters
+    ----------
+    confidence : 1d array-like, shape=(n_samples)
+        Confidence values of the examples.
+
+    y_true : 1d array-like, shape=(n_samples)
+        Ground truth (correct) target values.
+
+    sample_weight : 1d array-like, shape=(n_samples) or None
+        Sample weights. If None, then samples are equally weighted.
+
+    criteria : callable
+        See ConfidenceCutter.
+
+    position : float
+        Value indicating the postion of the cut window.
+
+    min_examples : int, optional (default=10)
+        If the number of possible cuts is not larger than min_examples
+        np.nan is returned.
+
+    tolerance : float, optional (default=0.)
+        Criteria values differing less than the tolerance from the
+        minimal value are treated as equally good.
+
+    Returns
+    -------
+    cut_value : float
+        Best cut or np.nan.
+    """
+    if sample_weight is not None:
+        is_weighted = sample_weight != 0
+        if not np.all(is_weighted):
+            confidence = confidence[is_weighted]
+            y_true = y_true[is_weighted]
+            sample_weight = sample_weight[is_weighted]
+    cuts, tp, fp, tn, fn = confusion_counts(confidence,
+                                            y_true,
+                                            sample_weight)
+    if len(cuts) <= min_examples:
+        return np.nan
+    if not has_counts_evaluation(criteria):
+        return _find_best_cut_masked(confidence, y_true, sample_weight,
+                                     criteria, position, cuts,
+                                     tolerance=tolerance)
+    criteria_values = evaluate_criteria(criteria, tp, fp, tn, fn, position)
+    return _select_cuts(cuts, criteria_values, tolerance)[()]
+
+
+def find_best_cuts(confidence,
+                   y_true,
+                   sample_weights,
+                   criteria,
+                   position,
+                   min_examples=10,
+                   tolerance=0.):
+    """Finds the best cut for several sets of weights of the same
+    examples at once, e.g. for multiple bootstraps represented by
+    their multiplicity weights. The confidences are sorted once and
+    the confusion matrices of all sets are obtained from cumulative
+    sums along the examples. For each set the result is the same as
+    the one of 'find_best_cut' with the weights of the set.
+
+    Parameters
+    ----------
+    confidence : 1d array-like, shape=(n_samples)
+        Confidence values of the examples.
+
+    y_true : 1d array-like, shape=(n_samples)
+        Ground truth (correct) target values.
+
+    sample_weights : 2d array-like, shape=(n_samples, n_sets)
+        Sets of sample weights.
+
+    criteria : callable
+        See ConfidenceCutter.
+
+    position : float
+        Value indicating the postion of the cut window.
+
+    min_examples : int, optional (default=10)
+        If the number of possible cuts of a set is not larger than
+        min_examples np.nan is returned for the set.
+
+    tolerance : float, optional (default=0.)
+        See find_best_cut.
+
+    Returns
+    -------
+    cut_values : 1d array, shape=(n_sets)
+        Best cut or np.nan for each set.
+    """
+    sample_weights = np.asarray(sample_weights, dtype=float)
+    n_sets = sample_weights.shape[1]
+    if len(confidence) == 0:
+        return np.full(n_sets, np.nan)
+    if not has_counts_evaluation(criteria):
+        confidence = np.asarray(confidence)
+        y_true = np.asarray(y_true)
+        return np.array([find_best_cut(confidence,
+                                       y_true,
+                                       sample_weights[:, i],
+                                       criteria,
+                                       position,
+                                       min_examples=min_examples,
+                                       tolerance=tolerance)
+                         for i in range(n_sets)])
+    cuts, first_idx, y_sorted, weights = _sort_confidence(confidence,
+                                                          y_true,
+                                                          sample_weights)
+    is_cut = np.add.reduceat(weights != 0, first_idx, axis=0) > 0
+    tp, fp, tn, fn = _cumulative_counts(first_idx, y_sorted, weights)
+    criteria_values = evaluate_criteria(criteria, tp, fp, tn, fn, position)
+    criteria_values[~is_cut] = np.inf
+    cut_values = np.full(n_sets, np.nan)
+    enough_cuts = np.sum(is_cut, axis=0) > min_examples
+    if np.any(enough_cuts):
+        cut_values[enough_cuts] = _select_cuts(
+            cuts, criteria_values[:, enough_cuts], tolerance)
+    return cut_values
+
+
+def _select_cuts(cuts, criteria_values, tolerance):
+    criteria_values = np.where(np.isfinite(criteria_values),
+                               criteria_values,
+                               np.inf)
+    min_value = np.min(criteria_values, axis=0)
+    idx_best = np.argmax(criteria_values <= min_value + tolerance, axis=0)
+    return np.where(np.isfinite(min_value), cuts[idx_best], np.nan)
+
+
+def find_best_binned_cuts(cuts,
+                          tp,
+                          fp,
+                          tn,
+                          fn,
+                          is_cut,
+                          criteria,
+                          positions,
+                          min_examples=10,
+                          tolerance=0.):
+    """Finds the best cut for many windows at once from binned
+    confusion matrices (see statistics.WindowHistograms).
+
+    Parameters
+    ----------
+    cuts : 1d array, shape=(n_bins)
+        Possible cuts (lower bin edges).
+
+    tp, fp, tn, fn : arrays, shape=(n_steps, n_bins)
+        Weighted confusion matrix entries of each window for each cut.
+
+    is_cut : array, shape=(n_steps, n_bins)
+        Whether a cut is possible for a window.
+
+    criteria : callable
+        See ConfidenceCutter.
+
+    positions : 1d array, shape=(n_steps)
+        Positions of the windows.
+
+    min_examples : int, optional (default=10)
+        If the number of possible cuts of a window is not larger than
+        min_examples np.nan is returned for the window.
+
+    tolerance : float, optional (default=0.)
+        See find_best_cut.
+
+    Returns
+    -------
+    cut_values : 1d array, shape=(n_steps)
+        Best cut or np.nan for each window.
+    """
+    criteria_values = evaluate_criteria(criteria, tp, fp, tn, fn, positions)
+    criteria_values = np.where(is_cut, criteria_values, np.inf)
+    cut_values = np.full(len(positions), np.nan)
+    enough_cuts = np.sum(is_cut, axis=1) > min_examples
+    if np.any(enough_cuts):
+        cut_values[enough_cuts] = _select_cuts(
+            cuts, criteria_values[enough_cuts].T, tolerance)
+    return cut_values
+
+
+def binned_confusion_counts(confidence,
+                            y_true,
+                            sample_weight=None,
+                            n_bins=100,
+                            binning='quantile',
+                            n_sub_bins=16):
+    """Calculates the weighted confusion matrix for cuts at the lower
+    edges of confidence bins. The examples are only binned, not sorted.
+
+    The examples are assigned to a fine uniform grid of
+    n_bins * n_sub_bins cells between the min/max confidence by
+    arithmetic. The bin edges are placed on the cell edges, so the
+    cells are mapped to the bins exactly.
+
+    Parameters
+    ----------
+    confidence : 1d array-like, shape=(n_samples)
+        Confidence values of the examples.
+
+    y_true : 1d array-like, shape=(n_samples)
+        Ground truth (correct) target values.
+
+    sample_weight : array-like, shape=(n_samples) or (n_samples, n_sets)
+        Sample weights. If None, then samples are equally weighted.
+
+    n_bins : int, optional (default=100)
+        Number of confidence bins.
+
+    binning : ['quantile', 'uniform'], optional (default='quantile')
+        'quantile': bins containing about the same number of examples
+            (up to the resolution of the grid).
+        'uniform': bins of equal width between the min/max confidence.
+
+    n_sub_bins : int, optional (default=16)
+        Number of grid cells per bin for the 'quantile' binning.
+
+    Returns
+    -------
+    bin_edges : 1d array, shape=(n_bins + 1)
+        Edges of the bins. The number of bins can be smaller than
+        requested, if quantiles coincide.
+
+    tp, fp, tn, fn : arrays, shape=(n_bins) or (n_bins, n_sets)
+        Weighted confusion matrix entries for cuts at bin_edges[:-1].
+
+    is_cut : array, shape=(n_bins) or (n_bins, n_sets)
+        Whether the bin contains any weight. Empty bins give the same
+        counts as the next filled bin and are no possible cuts.
+    """
+    confidence = np.asarray(confidence, dtype=float)
+    if binning == 'quantile':
+        n_cells = n_bins * n_sub_bins
+    elif binning == 'uniform':
+        n_cells = n_bins
+    else:
+        raise ValueError('Invalid binning [\'quantile\', \'uniform\']')
+    conf_min = np.min(confidence)
+    conf_max = np.max(confidence)
+    if conf_max > conf_min:
+        scale = n_cells / (conf_max - conf_min)
+    else:
+        scale = 0.
+    cell_idx = ((confidence - conf_min) * scale).astype(np.intp)
+    np.minimum(cell_idx, n_cells - 1, out=cell_idx)
+    cell_edges = np.linspace(conf_min, conf_max, n_cells + 1)
+
+    if binning == 'quantile':
+        cumsum_cells = np.cumsum(np.bincount(cell_idx, minlength=n_cells))
+        quantiles = np.linspace(0, len(confidence), n_bins + 1)[1:-1]
+        lower_cells = np.unique(np.searchsorted(cumsum_cells,
+                                                quantiles,
+                                                side='right'))
+        lower_cells = np.concatenate(([0], lower_cells[lower_cells > 0]))
+        bin_edges = np.append(cell_edges[lower_cells], conf_max)
+        cell_to_bin = np.searchsorted(lower_cells,
+                                      np.arange(n_cells),
+                                      side='right') - 1
+        bin_idx = cell_to_bin[cell_idx]
+    else:
+        bin_edges = cell_edges
+        bin_idx = cell_idx
+    n_bins = len(bin_edges) - 1
+
+    if sample_weight is None:
+        weights = np.ones((len(confidence), 1))
+    else:
+        weights = np.asarray(sample_weight, dtype=float)
+        if weights.ndim == 1:
+            weights = weights[:, np.newaxis]
+    n_sets = weights.shape[1]
+    # Signal and background histograms of all sets in one bincount
+    class_idx = bin_idx * 2 + np.asarray(y_true, dtype=bool)
+    flat_idx = (class_idx[:, np.newaxis] * n_sets +
+                np.arange(n_sets)).ravel()
+    n_flat = n_bins * 2 * n_sets
+    hist = np.bincount(flat_idx,
+                       weights=weights.ravel(),
+                       minlength=n_flat).reshape(n_bins, 2, n_sets)
+    background = hist[:, 0]
+    signal = hist[:, 1]
+    is_cut = np.bincount(flat_idx,
+                         weights=(weights != 0).ravel(),
+                         minlength=n_flat).reshape(n_bins, 2, n_sets)
+    is_cut = np.sum(is_cut, axis=1) > 0
+
+    tp = np.cumsum(signal[::-1], axis=0)[::-1]
+    fp = np.cumsum(background[::-1], axis=0)[::-1]
+    fn = tp[:1] - tp
+    tn = fp[:1] - fp
+    if sample_weight is None or np.ndim(sample_weight) == 1:
+        return bin_edges, tp[:, 0], fp[:, 0], tn[:, 0], fn[:, 0], \
+            is_cut[:, 0]
+    return bin_edges, tp, fp, tn, fn, is_cut
+
+
+def find_best_cut_approx(confidence,
+                         y_true,
+                         sample_weight,
+                         criteria,
+                         position,
+                         n_bins=100,
+                         binning='quantile',
+                         min_examples=10,
+                         tolerance=0.):
+    """Finds the best cut among the lower edges of confidence bins
+    (see binned_confusion_counts). Faster than find_best_cut for
+    windows with many more examples than bins, because the examples
+    are not sorted.
+
+    Parameters
+    ----------
+    confidence : 1d array-like, shape=(n_samples)
+        Confidence values of the examples.
+
+    y_true : 1d array-like, shape=(n_samples)
+        Ground truth (correct) target values.
+
+    sample_weight : array-like, shape=(n_samples) or (n_samples, n_sets)
+        Sample weights. If None, then samples are equally weighted. If
+        2d, the best cut is searched for each set of weights.
+
+    criteria : callable
+        See ConfidenceCutter.
+
+    position : float
+        Value indicating the postion of the cut window.
+
+    n_bins : int, optional (default=100)
+        Number of confidence bins.
+
+    binning : ['quantile', 'uniform'], optional (default='quantile')
+        See binned_confusion_counts.
+
+    min_examples : int, optional (default=10)
+        If the number of examples with a non-zero weight is not larger
+        than min_examples np.nan is returned.
+
+    tolerance : float, optional (default=0.)
+        See find_best_cut.
+
+    Returns
+    -------
+    cut_value : float or 1d array, shape=(n_sets)
+        Best cut or np.nan.
+
+    cut_error : float or 1d array, shape=(n_sets)
+        Width of the bin starting at the cut. The exact best cut
+        differs from the returned one by about this resolution.
+    """
+    bin_edges, tp, fp, tn, fn, is_cut = binned_confusion_counts(
+        confidence, y_true, sample_weight, n_bins=n_bins, binning=binning)
+    if not has_counts_evaluation(criteria):
+        return _find_best_cut_approx_masked(confidence, y_true,
+                                            sample_weight, criteria,
+                                            position, bin_edges, is_cut,
+                                            min_examples, tolerance)
+    squeeze = tp.ndim == 1
+    if squeeze:
+        tp, fp, tn, fn, is_cut = [entry[:, np.newaxis]
+                                  for entry in (tp, fp, tn, fn, is_cut)]
+    if sample_weight is None:
+        n_weighted = np.array([len(confidence)])
+    else:
+        n_weighted = np.sum(np.asarray(sample_weight) != 0, axis=0)
+    criteria_values = evaluate_criteria(criteria, tp, fp, tn, fn, position)
+    criteria_values[~is_cut] = np.inf
+    n_sets = tp.shape[1]
+    cut_values = np.full(n_sets, np.nan)
+    cut_errors = np.full(n_sets, np.nan)
+    enough_examples = np.atleast_1d(n_weighted > min_examples)
+    if np.any(enough_examples):
+        cut_values[enough_examples] = _select_cuts(
+            bin_edges[:-1], criteria_values[:, enough_examples], tolerance)
+        is_valid = np.isfinite(cut_values)
+        idx_bin = np.searchsorted(bin_edges[:-1], cut_values[is_valid])
+        cut_errors[is_valid] = bin_edges[idx_bin + 1] - bin_edges[idx_bin]
+    if squeeze:
+        return cut_values[0], cut_errors[0]
+    return cut_values, cut_errors
+
+
+def _find_best_cut_approx_masked(confidence,
+                                 y_true,
+                                 sample_weight,
+                                 criteria,
+                                 position,
+                                 bin_edges,
+                                 is_cut,
+                                 min_examples,
+                                 tolerance):
+    confidence = np.asarray(confidence)
+    y_true = np.asarray(y_true)
+    squeeze = is_cut.ndim == 1
+    if sample_weight is None:
+        weights = [None]
+    else:
+        weights = np.asarray(sample_weight, dtype=float)
+        weights = [weights] if squeeze else weights.T
+    is_cut = is_cut[:, np.newaxis] if squeeze else is_cut
+    cut_values = np.full(len(weights), np.nan)
+    cut_errors = np.full(len(weights), np.nan)
+    for i, weights_i in enumerate(weights):
+        if weights_i is None:
+            n_weighted = len(confidence)
+        else:
+            n_weighted = np.sum(weights_i != 0)
+        cuts = bin_edges[:-1][is_cut[:, i]]
+        if n_weighted <= min_examples or len(cuts) == 0:
+            continue
+        cut_values[i] = _find_best_cut_masked(confidence, y_true, weights_i,
+                                              criteria, position, cuts,
+                                              tolerance=tolerance)
+        idx_bin = np.searchsorted(bin_edges[:-1], cut_values[i])
+        cut_errors[i] = bin_edges[idx_bin + 1] - bin_edges[idx_bin]
+    if squeeze:
+        return cut_values[0], cut_errors[0]
+    return cut_values, cut_errors
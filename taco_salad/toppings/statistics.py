@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+import numpy as np
+
+
+class WindowHistograms(object):
+    """Weighted histograms of the confidence of signal and background
+    events for each sliding window.
+
+    The histograms are filled per segment of X_o between neighbouring
+    window edges. Each event is histogrammed once, independent of the
+    number of overlapping windows containing it. The histograms of a
+    window are the sum over its segments. The memory footprint depends
+    on n_steps * n_bins and not on the number of events.
+
+    The histograms are sufficient statistics for the cut search:
+    histograms filled on independent shards of the data can be merged
+    (associative and commutative) and give the same cut curve as
+    filling all events into one object. They can be stored with
+    'save'/'to_dict' and restored with 'load'/'from_dict'.
+
+    Parameters
+    ----------
+    edges : array-like, shape=(n_steps, 2)
+        Edges of the sliding windows:
+            lower edges := edges[:, 0]
+            upper edges := edges[:, 1]
+
+    conf_bins : array-like, shape=(n_bins + 1)
+        Bin edges of the confidence histograms. Confidences outside
+        the range of the bins are put into the first/last bin.
+
+    positions : array-like, shape=(n_steps) or None
+        Positions of the windows. If None, the centers of the windows
+        are used.
+
+    Attributes
+    ----------
+    boundaries : array, shape=(n_segments + 1)
+        Sorted unique window edges.
+
+    signal : array, shape=(n_segments, n_bins)
+        Weighted confidence histograms of the signal for each segment.
+
+    background : array, shape=(n_segments, n_bins)
+        Weighted confidence histograms of the background for each
+        segment.
+    """
+    def __init__(self, edges, conf_bins, positions=None):
+        self.edges = np.array(edges, dtype=float)
+        self.conf_bins = np.array(conf_bins, dtype=float)
+        if positions is None:
+            positions = np.mean(self.edges, axis=1)
+        self.positions = np.array(positions, dtype=float)
+        self.boundaries = np.unique(self.edges)
+        self.window_segments = np.zeros((len(self.edges), 2), dtype=int)
+        self.window_segments[:, 0] = np.searchsorted(self.boundaries,
+                                                     self.edges[:, 0])
+        self.window_segments[:, 1] = np.searchsorted(self.boundaries,
+                                                     self.edges[:, 1])
+        hist_shape = (len(self.boundaries) - 1, len(self.conf_bins) - 1)
+        self.signal = np.zeros(hist_shape)
+        self.background = np.zeros(hist_shape)
+
+    @property
+    def n_bins(self):
+        return len(self.conf_bins) - 1
+
+    def fill(self, X_o, X_c, y_true, sample_weight=None):
+        """Adds events to the histograms.
+
+        Parameters
+        ----------
+        X_o : array-like, shape=(n_samples)
+            X_o values of the events.
+
+        X_c : array-like, shape=(n_samples)
+            Confidences of the events.
+
+        y_true : array-like, shape=(n_samples)
+            Ground truth (correct) target values.
+
+        sample_weight : array-like, shape=(n_samples) or None
+            Sample weights. If None, then samples are equally weighted.
+
+        Returns
+        -------
+        self : WindowHistograms
+            Returns self.
+        """
+        X_o = np.asarray(X_o)
+        segment = np.searchsorted(self.boundaries, X_o, side='right') - 1
+        in_windows = np.logical_and(segment >= 0,
+                                    segment < len(self.boundaries) - 1)
+        conf_bin = np.searchsorted(self.conf_bins,
+                                   np.asarray(X_c)[in_windows],
+                                   side='right') - 1
+        np.clip(conf_bin, 0, self.n_bins - 1, out=conf_bin)
+        flat_idx = segment[in_windows] * self.n_bins + conf_bin
+        is_signal = np.asarray(y_true, dtype=bool)[in_windows]
+        if sample_weight is None:
+            weights = np.ones(len(flat_idx))
+        else:
+            weights = np.asarray(sample_weight, dtype=float)[in_windows]
+        n_flat = self.signal.size
+        self.signal += np.bincount(flat_idx[is_signal],
+                                   weights=weights[is_signal],
+                                   minlength=n_flat).reshape(
+                                       self.signal.shape)
+        self.background += np.bincount(flat_idx[~is_signal],
+                                       weights=weights[~is_signal],
+                                       minlength=n_flat).reshape(
+                                           self.background.shape)
+        return self
+
+    def get_window_histograms(self, windows=None):
+        """Returns the histograms of the sliding windows.
+
+        Parameters
+        ----------
+        windows : array-like of int or None
+            Indices of the windows. If None, all windows are returned.
+
+        Returns
+        -------
+        signal : array, shape=(n_steps, n_bins)
+            Weighted confidence histograms of the signal.
+
+        background : array, shape=(n_steps, n_bins)
+            Weighted confidence histograms of the background.
+        """
+        window_segments = self.window_segments
+        if windows is not None:
+            window_segments = window_segments[windows]
+        start = window_segments[:, 0]
+        stop = window_segments[:, 1]
+        histograms = []
+        for hist in [self.signal, self.background]:
+            cumsum = np.zeros((hist.shape[0] + 1, hist.shape[1]))
+            np.cumsum(hist, axis=0, out=cumsum[1:])
+            histograms.append(cumsum[stop] - cumsum[start])
+        return histograms
+
+    def get_occupancy(self):
+        """Returns the sum of weights in each window.
+
+        Returns
+        -------
+        occupancy : array, shape=(n_steps)
+            Sum of weights in each window.
+        """
+        total = np.zeros(len(self.boundaries))
+        np.cumsum(np.sum(self.signal, axis=1) +
+                  np.sum(self.background, axis=1), out=total[1:])
+        return total[self.window_segments[:, 1]] - \
+            total[self.window_segments[:, 0]]
+
+    def confusion_counts(self, windows=None):
+        """Calculates the weighted confusion matrix of each window for
+        cuts at the lower bin edges (positive: confidence >= cut).
+
+        Parameters
+        ----------
+        windows : array-like of int or None
+            Indices of the windows. If None, all windows are used.
+
+        Returns
+        -------
+        cuts : array, shape=(n_bins)
+            Lower bin edges used as cuts.
+
+        tp, fp, tn, fn : arrays, shape=(n_steps, n_bins)
+            Weighted confusion matrix entries.
+
+        is_cut : array, shape=(n_steps, n_bins)
+            Whether the bin of a cut contains any weight. Empty bins
+            give the same counts as the next filled bin and are no
+            possible cuts.
+        """
+        signal, background = self.get_window_histograms(windows)
+        tp, fp, tn, fn, is_cut = histogram_confusion_counts(signal,
+                                                            background)
+        return self.conf_bins[:-1], tp, fp, tn, fn, is_cut
+
+    def __check_compatible__(self, other):
+        if not isinstance(other, WindowHistograms):
+            raise TypeError('Only WindowHistograms can be merged!')
+        if not (np.array_equal(self.edges, other.edges) and
+                np.array_equal(self.conf_bins, other.conf_bins) and
+                np.array_equal(self.positions, other.positions)):
+            raise ValueError('Only histograms with the same windows '
+                             'and confidence bins can be merged!')
+
+    def merge(self, other):
+        """Adds the histograms of other to self.
+
+        Parameters
+        ----------
+        other : WindowHistograms
+            Histograms with the same edges and conf_bins.
+
+        Returns
+        -------
+        self : WindowHistograms
+            Returns self.
+        """
+        self.__check_compatible__(other)
+        self.signal += other.signal
+        self.background += other.background
+        return self
+
+    def empty_copy(self):
+        """Returns empty histograms with the same binning."""
+        return WindowHistograms(self.edges, self.conf_bins, self.positions)
+
+    def to_dict(self):
+        """Returns the state as a dict of numpy arrays.
+
+        Returns
+        -------
+        state : dict
+            Dict with the keys 'edges', 'conf_bins', 'positions',
+            'signal' and 'background'.
+        """
+        return {'edges': self.edges,
+                'conf_bins': self.conf_bins,
+                'positions': self.positions,
+                'signal': self.signal,
+                'background': self.background}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Creates histograms from a dict returned by 'to_dict'.
+
+        Parameters
+        ----------
+        state : dict
+            See to_dict.
+
+        Returns
+        -------
+        histograms : WindowHistograms
+            The restored histograms.
+        """
+        histograms = cls(state['edges'],
+                         state['conf_bins'],
+                         state['positions'])
+        for key in ['signal', 'background']:
+            hist = np.array(state[key], dtype=float)
+            if hist.shape != histograms.signal.shape:
+                raise ValueError('Shape of \'{}\' does not match the '
+                                 'binning!'.format(key))
+            setattr(histograms, key, hist)
+        return histograms
+
+    def save(self, filename):
+        """Saves the histograms with 'numpy.savez'. If the filename
+        doesn't end with '.npz' it is added.
+
+        Parameters
+        ----------
+        filename: str
+            Path where the histograms are saved.
+
+        Returns
+        -------
+        filename: str
+            Path of the saved file.
+        """
+        if not filename.endswith('.npz'):
+            filename += '.npz'
+        np.savez(filename, **self.to_dict())
+        return filename
+
+    @classmethod
+    def load(cls, filename):
+        """Loads histograms saved with 'save'.
+
+        Parameters
+        ----------
+        filename: str
+            Path from which the histograms are loaded.
+
+        Returns
+        -------
+        histograms : WindowHistograms
+            The loaded histograms.
+        """
+        if not filename.endswith('.npz'):
+            filename += '.npz'
+        with np.load(filename) as npzfile:
+            return cls.from_dict(npzfile)
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        self.__check_compatible__(other)
+        merged = self.empty_copy()
+        merged.merge(self)
+        return merged.merge(other)
+
+    def __radd__(self, other):
+        # Allows sum(list_of_histograms)
+        if isinstance(other, int) and other == 0:
+            return self + self.empty_copy()
+        return self.__add__(other)
+
+
+def histogram_confusion_counts(signal, background):
+    """Calculates the weighted confusion matrix for cuts at the lower
+    bin edges from confidence histograms (positive: confidence >= cut).
+
+    Parameters
+    ----------
+    signal, background : arrays, shape=(n_windows, n_bins)
+        Weighted confidence histograms of each window.
+
+    Returns
+    -------
+    tp, fp, tn, fn : arrays, shape=(n_windows, n_bins)
+        Weighted confusion matrix entries.
+
+    is_cut : array, shape=(n_windows, n_bins)
+        Whether the bin of a cut contains any weight.
+    """
+    tp = np.cumsum(signal[:, ::-1], axis=1)[:, ::-1]
+    fp = np.cumsum(background[:, ::-1], axis=1)[:, ::-1]
+    fn = tp[:, :1] - tp
+    tn = fp[:, :1] - fp
+    is_cut = (signal + background) != 0
+    return tp, fp, tn, fn, is_cut
+
+
+def fill_histograms(edges, conf_bins, positions, X_o, X_c, y_true,
+                    sample_weight=None):
+    """Fills events into new histograms with the given binning (see
+    WindowHistograms). Used as a pool task, only the binning and the
+    events are passed to the worker and the returned histograms are
+    merged by the caller.
+    """
+    histograms = WindowHistograms(edges, conf_bins, positions)
+    return histograms.fill(X_o, X_c, y_true, sample_weight)
+
+
+def merge_histograms(histograms):
+    """Merges WindowHistograms, e.g. filled on different shards of the
+    data, into new histograms. The inputs are not modified.
+
+    Parameters
+    ----------
+    histograms : iterable of WindowHistograms
+        Histograms with the same edges and conf_bins.
+
+    Returns
+    -------
+    merged : WindowHistograms
+        Sum of all histograms.
+    """
+    merged = None
+    for histograms_i in histograms:
+        if merged is None:
+            merged = histograms_i.empty_copy()
+        merged.merge(histograms_i)
+    if merged is None:
+        raise ValueError('No histograms provided!')
+    return merged
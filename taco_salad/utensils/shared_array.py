@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+class SharedArray(object):
+    """Numpy array placed in shared memory, so it can be handed to
+    worker processes without copying the data. Pickling a SharedArray
+    only transfers the name of the memory block, shape and dtype.
+    Unpickling attaches to the existing block.
+
+    If multiprocessing.shared_memory is not available (Python < 3.8)
+    a numpy.memmap of a temporary file is used instead.
+
+    The process creating the array owns it and has to call 'unlink'
+    when the array is not needed anymore. The class can be used as a
+    context manager doing so.
+
+    Parameters
+    ----------
+    array : array-like
+        Array copied into the shared memory.
+
+    Attributes
+    ----------
+    array : numpy.ndarray
+        View of the shared memory.
+    """
+    def __init__(self, array):
+        array = np.asarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.owner = True
+        nbytes = max(array.nbytes, 1)
+        if shared_memory is not None:
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.name = self._shm.name
+        else:
+            file_handle, self.name = tempfile.mkstemp(suffix='.taco_shm')
+            os.close(file_handle)
+            self._shm = None
+        self.__attach__(mode='w+')
+        self.array[...] = array
+
+    def __attach__(self, mode='r+'):
+        if shared_memory is not None:
+            if self._shm is None:
+                if sys.version_info >= (3, 13):
+                    self._shm = shared_memory.SharedMemory(name=self.name,
+                                                           track=False)
+                else:
+                    self._shm = shared_memory.SharedMemory(name=self.name)
+            self.array = np.ndarray(self.shape,
+                                    dtype=self.dtype,
+                                    buffer=self._shm.buf)
+        elif int(np.prod(self.shape)) == 0:
+            self.array = np.empty(self.shape, dtype=self.dtype)
+        else:
+            self.array = np.memmap(self.name,
+                                   dtype=self.dtype,
+                                   mode=mode,
+                                   shape=self.shape)
+
+    def __getstate__(self):
+        return {'name': self.name,
+                'shape': self.shape,
+                'dtype': self.dtype}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.owner = False
+        self._shm = None
+        self.__attach__()
+
+    def close(self):
+        """Releases the view of the shared memory in this process."""
+        self.array = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                # Views of the array are still alive. The mapping is
+                # released when they are garbage collected.
+                pass
+            self._shm = None
+
+    def unlink(self):
+        """Releases the shared memory. Only the owning process frees
+        the memory block.
+        """
+        shm = self._shm
+        self.close()
+        if self.owner:
+            if shared_memory is not None:
+                if shm is None:
+                    shm = shared_memory.SharedMemory(name=self.name)
+                    shm.close()
+                shm.unlink()
+            elif os.path.exists(self.name):
+                os.remove(self.name)
+            self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.unlink()
+
+
+def share_arrays(*arrays):
+    """Places arrays in shared memory. None entries stay None.
+
+    Parameters
+    ----------
+    arrays : array-like or None
+        Arrays to share.
+
+    Returns
+    -------
+    shared_arrays : list of SharedArray or None
+        The shared arrays.
+    """
+    return [None if array_i is None else SharedArray(array_i)
+            for array_i in arrays]
+
+
+def unlink_arrays(shared_arrays):
+    """Releases all arrays created with share_arrays."""
+    for shared_i in shared_arrays:
+        if shared_i is not None:
+            shared_i.unlink()
@@ -1,7 +1,18 @@
 import numpy as np
 import os
+import pickle
+import pytest
 
-from taco_salad.toppings import ConfidenceCutter, criteria
+from taco_salad.toppings import ConfidenceCutter, criteria, combine_cutters
+from taco_salad.toppings import GridConfidenceCutter
+from taco_salad.toppings.curve import Curve, CurveBank, CurveSliding, \
+    fill_gaps, reduce_curves
+from taco_salad.toppings.curve_io import curve_arrays, curve_from_file, \
+    load_curves, read_curve, read_header, write_curve
+from taco_salad.toppings.search import confusion_counts, evaluate_criteria, \
+    find_best_cut, find_best_cuts
+from taco_salad.toppings.statistics import WindowHistograms, \
+    merge_histograms
 
 
 def generate(n, purity, x_lims=[-1., 1]):
@@ -69,6 +80,18 @@ def generate_x(n, eff, pur, conf_cut_func=lambda x: np.ones_like(x) * 0.5,
     return x, y_pred, y_true
 
 
+def generate_gauss(n, x_dist='uniform', seed=1337):
+    random_state = np.random.RandomState(seed)
+    if x_dist == 'exponential':
+        x = random_state.exponential(1., n)
+    else:
+        x = random_state.uniform(-1., 1., n)
+    y_true = random_state.randint(0, 2, n)
+    conf = np.clip(random_state.normal(0.3 + 0.4 * y_true, 0.2), 0., 1.)
+    weights = random_state.uniform(0.5, 1.5, n)
+    return np.vstack((conf, x)).T, y_true, weights
+
+
 def test_conf_cutter():
     eff = 0.90
     pur = 0.90
@@ -127,6 +150,20 @@ def test_conf_cutter():
 
     assert tp / (tp + fp) - pur_treshold < 0.07
 
+    # cut_tolerance=0. uses the exact minimum, which jumps to the second
+    # crossing of the threshold at high confidences in some windows
+    exact_cutter = ConfidenceCutter(n_steps=100,
+                                    window_size=0.1,
+                                    n_bootstraps=1,
+                                    criteria=pur_crit,
+                                    conf_index=1,
+                                    n_jobs=1,
+                                    cut_tolerance=0.)
+    exact_cutter.fit(X, y_true)
+    default_cuts = conf_cutter.cut_opts.window_cuts
+    exact_cuts = exact_cutter.cut_opts.window_cuts
+    assert np.nanmax(exact_cuts - default_cuts) > 0.1
+
     cut_curve_file = conf_cutter.save_curve('test_curve.npz')
     conf_cutter_reloaded = ConfidenceCutter(curve_file=cut_curve_file)
     os.remove(cut_curve_file)
@@ -148,3 +185,646 @@ def test_criteria():
     val_gen = gen_crit(y_true, y_predict, pos)
     val_pur = pur_crit(y_true, y_predict, pos)
     assert val_gen == val_pur
+
+
+def test_criteria_counts():
+    def threshold(position):
+        return 0.8 + position / 10.
+
+    pur_crit = criteria.purity_criteria(threshold=threshold)
+    gen_crit = criteria.general_confusion_matrix_criteria(
+        'tp / (tp + fp)',
+        threshold=threshold)
+    tp = np.array([[4., 3., 1.], [10., 8., 0.]])
+    fp = np.array([[4., 1., 0.], [2., 1., 0.]])
+    tn = np.zeros_like(tp)
+    fn = np.zeros_like(tp)
+    positions = np.array([0.5, 1.])
+    val_pur = pur_crit.evaluate_counts(tp, fp, tn, fn, positions)
+    val_gen = gen_crit.evaluate_counts(tp, fp, tn, fn, positions)
+    assert val_pur.shape == (2, 3)
+    assert np.allclose(val_pur[:, :2], val_gen[:, :2])
+    assert np.allclose(val_pur[:, 2], [0.15, 0.9])
+
+    y_true = np.array([1, 0, 0, 1])
+    y_pred = np.array([1, 1, 0, 0])
+    for i, j in np.ndindex(*tp.shape):
+        weights = np.array([tp[i, j], fp[i, j], tn[i, j], fn[i, j]])
+        val = pur_crit(y_true, y_pred, positions[i], sample_weights=weights)
+        assert np.isclose(val, val_pur[i, j])
+
+
+def test_confusion_counts():
+    confidence = np.array([0.1, 0.4, 0.4, 0.7, 0.9, 0.2])
+    y_true = np.array([0, 1, 0, 1, 1, 0])
+    weights = np.array([1., 2., 3., 4., 5., 6.])
+    cuts, tp, fp, tn, fn = confusion_counts(confidence, y_true, weights)
+    assert all(cuts == np.unique(confidence))
+    for i, cut in enumerate(cuts):
+        y_pred = confidence >= cut
+        assert tp[i] == np.sum(weights[(y_true == 1) & y_pred])
+        assert fp[i] == np.sum(weights[(y_true == 0) & y_pred])
+        assert tn[i] == np.sum(weights[(y_true == 0) & ~y_pred])
+        assert fn[i] == np.sum(weights[(y_true == 1) & ~y_pred])
+
+    pur_crit = criteria.purity_criteria(threshold=0.75)
+
+    def legacy_crit(y_true, y_pred, position, sample_weights=None):
+        return pur_crit(y_true, y_pred, position, sample_weights)
+
+    cut = find_best_cut(confidence, y_true, weights, pur_crit, 0.,
+                        min_examples=0)
+    cut_legacy = find_best_cut(confidence, y_true, weights, legacy_crit, 0.,
+                               min_examples=0)
+    assert cut == cut_legacy == 0.4
+
+    # Plain callables may ignore the weights
+    X, y_true, weights = generate_gauss(2000)
+    confidence = X[:, 0]
+
+    def unweighted_crit(y_true, y_pred, position, sample_weights=None):
+        return pur_crit(y_true, y_pred, position)
+
+    cuts = np.unique(confidence)
+    brute_force = [unweighted_crit(y_true, confidence >= cut, 0.)
+                   for cut in cuts]
+    cut = find_best_cut(confidence, y_true, weights, unweighted_crit, 0.)
+    assert np.isclose(cut, cuts[np.argmin(brute_force)], atol=0.02)
+    cuts_sets = find_best_cuts(confidence, y_true,
+                               np.vstack((weights, weights)).T,
+                               unweighted_crit, 0.)
+    assert np.all(cuts_sets == cut)
+    with pytest.raises(TypeError):
+        evaluate_criteria(unweighted_crit,
+                          *confusion_counts(confidence, y_true)[1:],
+                          position=0.)
+
+
+def test_window_slices():
+    X_o = np.random.uniform(-1., 1., 1000)
+    X_o[:10] = 0.05
+    cut_opts = ConfidenceCutter.CutOpts(n_steps=20, window_size=0.2)
+    cut_opts.init_sliding_windows(X_o)
+    cut_opts.edges[5] = [0., 0.05]
+    X_o_sorted = X_o[cut_opts.sort_events(X_o)]
+    slices = cut_opts.get_window_slices(X_o_sorted)
+    for [lower, upper], [start, stop] in zip(cut_opts.edges, slices):
+        idx = np.logical_and(X_o >= lower, X_o < upper)
+        assert np.sum(idx) == stop - start
+        assert all(np.sort(X_o[idx]) == X_o_sorted[start:stop])
+
+
+def test_conf_cutter_parallel():
+    n = 20000
+    X, y_true, weights = generate_gauss(n)
+
+    curves = []
+    for n_jobs, backend in [(1, 'process'), (2, 'process'), (2, 'thread')]:
+        conf_cutter = ConfidenceCutter(n_steps=20,
+                                       window_size=0.2,
+                                       n_bootstraps=4,
+                                       n_jobs=n_jobs,
+                                       backend=backend,
+                                       random_state=42)
+        conf_cutter.fit(X, y_true, sample_weight=weights)
+        curves.append(conf_cutter.cut_opts.curve.y)
+    assert all(curves[0] == curves[1])
+    assert all(curves[0] == curves[2])
+    # The tasks don't carry the fitted state
+    assert len(pickle.dumps(conf_cutter.__task_copy__())) < X.nbytes / 10
+
+    # Unpicklable criteria work with the default backend
+    pur_crit = criteria.purity_criteria(threshold=lambda position: 0.7)
+    conf_cutter = ConfidenceCutter(n_steps=20,
+                                   window_size=0.2,
+                                   n_bootstraps=2,
+                                   n_jobs=2,
+                                   criteria=pur_crit,
+                                   random_state=42)
+    conf_cutter.fit(X, y_true, sample_weight=weights)
+    assert np.all(np.isfinite(conf_cutter.cut_opts.curve.y))
+
+
+def test_bootstrap_modes():
+    n = 20000
+    X, y_true, _ = generate_gauss(n)
+
+    curves = {}
+    for mode in ['index', 'multinomial', 'poisson']:
+        conf_cutter = ConfidenceCutter(n_steps=20,
+                                       window_size=0.2,
+                                       n_bootstraps=3,
+                                       bootstrap_mode=mode,
+                                       criteria=criteria.purity_criteria(0.9),
+                                       random_state=42)
+        conf_cutter.fit(X, y_true)
+        curves[mode] = conf_cutter.cut_opts.curve.y
+    assert all(curves['index'] == curves['multinomial'])
+
+    conf_cutter = ConfidenceCutter(n_steps=20,
+                                   window_size=0.2,
+                                   n_bootstraps=3,
+                                   batch_bootstraps=True,
+                                   criteria=criteria.purity_criteria(0.9),
+                                   random_state=42)
+    conf_cutter.fit(X, y_true)
+    assert all(curves['index'] == conf_cutter.cut_opts.curve.y)
+    assert np.all(np.absolute(curves['index'] - curves['poisson']) < 0.05)
+
+
+def test_conf_cutter_stream():
+    n = 100000
+    X, y_true, weights = generate_gauss(n)
+    pur_crit = criteria.purity_criteria(threshold=0.9)
+
+    conf_cutter = ConfidenceCutter(n_steps=20,
+                                   window_size=0.2,
+                                   n_bootstraps=0,
+                                   criteria=pur_crit,
+                                   positions=np.linspace(-0.9, 0.9, 20))
+    conf_cutter.fit(X, y_true, sample_weight=weights)
+
+    chunks = [(X[i:i + 10000], y_true[i:i + 10000], weights[i:i + 10000])
+              for i in range(0, n, 10000)]
+    curves = []
+    for n_jobs, backend in [(1, 'thread'), (2, 'thread'), (2, 'process')]:
+        conf_cutter_stream = ConfidenceCutter(
+            n_steps=20,
+            window_size=0.2,
+            criteria=pur_crit,
+            n_conf_bins=2000,
+            n_jobs=n_jobs,
+            backend=backend,
+            positions=np.linspace(-0.9, 0.9, 20))
+        conf_cutter_stream.fit_stream(iter(chunks))
+        curves.append(conf_cutter_stream.cut_opts.curve.y)
+    assert np.allclose(curves[0], curves[1])
+    assert np.allclose(curves[0], curves[2])
+    diff = np.absolute(conf_cutter.cut_opts.curve.y - curves[0])
+    assert np.all(diff <= 0.005)
+
+    conf_cutter_partial = ConfidenceCutter(n_steps=20,
+                                           window_size=0.2,
+                                           criteria=pur_crit,
+                                           n_conf_bins=2000)
+    for X_i, y_i, weights_i in chunks:
+        conf_cutter_partial.partial_fit(X_i, y_i, weights_i,
+                                        X_o_range=(-1., 1.))
+    assert conf_cutter_partial.cut_opts.curve(0.) > 0.
+
+
+def test_conf_cutter_approx():
+    n = 100000
+    X, y_true, weights = generate_gauss(n)
+    pur_crit = criteria.purity_criteria(threshold=0.9)
+
+    curves = {}
+    errors = {}
+    for approx_bins, approx_binning in [(None, 'quantile'),
+                                        (500, 'quantile'),
+                                        (500, 'uniform'),
+                                        (n, 'quantile')]:
+        conf_cutter = ConfidenceCutter(n_steps=20,
+                                       window_size=0.2,
+                                       n_bootstraps=0,
+                                       criteria=pur_crit,
+                                       approx_bins=approx_bins,
+                                       approx_binning=approx_binning,
+                                       positions=np.linspace(-0.9, 0.9, 20))
+        conf_cutter.fit(X, y_true, sample_weight=weights)
+        curves[approx_bins, approx_binning] = conf_cutter.cut_opts.curve.y
+        errors[approx_bins, approx_binning] = conf_cutter.cut_opts.cut_errors
+    exact_curve = curves[None, 'quantile']
+    # Windows not larger than approx_bins are searched exactly
+    assert np.allclose(curves[n, 'quantile'], exact_curve)
+    assert np.all(errors[n, 'quantile'] == 0.)
+    for approx_binning in ['quantile', 'uniform']:
+        cut_errors = errors[500, approx_binning]
+        assert cut_errors.shape == (20,)
+        assert np.all(cut_errors > 0.)
+        assert np.all(cut_errors <= 0.005)
+        diff = np.absolute(curves[500, approx_binning] - exact_curve)
+        assert np.all(diff <= 0.005)
+
+
+def test_merge_statistics():
+    n = 40000
+    X, y_true, weights = generate_gauss(n)
+    pur_crit = criteria.purity_criteria(threshold=0.9)
+
+    def new_cutter():
+        return ConfidenceCutter(n_steps=20,
+                                window_size=0.2,
+                                criteria=pur_crit,
+                                n_conf_bins=500)
+
+    conf_cutter = new_cutter()
+    conf_cutter.partial_fit(X, y_true, weights, X_o_range=(-1., 1.))
+
+    shards = [new_cutter().compute_statistics(X[i:i + 10000],
+                                              y_true[i:i + 10000],
+                                              weights[i:i + 10000],
+                                              X_o_range=(-1., 1.))
+              for i in range(0, n, 10000)]
+    merged = merge_histograms(shards[::-1])
+    assert np.allclose(merged.signal, sum(shards).signal)
+    merged_file = merged.save('test_statistics')
+    reloaded = WindowHistograms.load(merged_file)
+    os.remove(merged_file)
+
+    conf_cutter_merged = new_cutter().fit_statistics(reloaded)
+    assert np.allclose(conf_cutter_merged.cut_opts.curve.y,
+                       conf_cutter.cut_opts.curve.y)
+    assert np.allclose(conf_cutter_merged.cut_opts.positions,
+                       conf_cutter.cut_opts.positions)
+
+
+def test_conf_cutter_update():
+    n = 30000
+    X, y_true, weights = generate_gauss(n)
+    is_new = np.logical_and(X[:, 1] > 0.2, X[:, 1] < 0.5)
+    is_new[::2] = False
+    pur_crit = criteria.purity_criteria(threshold=0.9)
+
+    def new_cutter():
+        return ConfidenceCutter(window_size=0.2,
+                                n_bootstraps=0,
+                                criteria=pur_crit,
+                                positions=np.linspace(-0.9, 0.9, 19),
+                                occupancy_weighting=True,
+                                n_conf_bins=500,
+                                incremental=True)
+
+    conf_cutter_all = new_cutter().fit(X, y_true, weights)
+    conf_cutter = new_cutter().fit(X[~is_new], y_true[~is_new],
+                                   weights[~is_new])
+    window_cuts_old = np.array(conf_cutter.cut_opts.window_cuts)
+    assert conf_cutter.__task_copy__().events is None
+    conf_cutter.update(X[is_new], y_true[is_new], weights[is_new])
+    assert np.allclose(conf_cutter.cut_opts.curve.y,
+                       conf_cutter_all.cut_opts.curve.y)
+    assert np.allclose(conf_cutter.cut_opts.occupancy,
+                       conf_cutter_all.cut_opts.occupancy)
+    is_changed = conf_cutter.cut_opts.window_cuts != window_cuts_old
+    positions = conf_cutter.cut_opts.positions[is_changed]
+    assert len(positions) > 0
+    assert np.all(np.abs(positions - 0.35) < 0.3)
+
+    conf_cutter_stream = new_cutter().fit_stream(
+        (X[i::3], y_true[i::3], weights[i::3]) for i in range(3))
+    conf_cutter = new_cutter().partial_fit(X[::3], y_true[::3],
+                                           weights[::3])
+    for i in range(1, 3):
+        conf_cutter.update(X[i::3], y_true[i::3], weights[i::3])
+    conf_cutter.update(X[is_new][:0], y_true[is_new][:0])
+    assert np.allclose(conf_cutter.cut_opts.curve.y,
+                       conf_cutter_stream.cut_opts.curve.y)
+
+
+def test_quantile_windows():
+    n = 50000
+    X, y_true, weights = generate_gauss(n, x_dist='exponential')
+    conf_cutter = ConfidenceCutter(window_placement='quantile',
+                                   window_events=np.sum(weights) / 10.,
+                                   n_bootstraps=0,
+                                   criteria=criteria.purity_criteria(0.9),
+                                   occupancy_weighting=True)
+    conf_cutter.fit(X, y_true, weights)
+    cut_opts = conf_cutter.cut_opts
+    assert cut_opts.n_steps == 19
+    assert len(cut_opts.positions) == 19
+    assert np.all(np.diff(cut_opts.positions) > 0)
+    assert np.all(cut_opts.edges[:, 0] < cut_opts.positions)
+    assert np.all(cut_opts.edges[:, 1] > cut_opts.positions)
+    assert np.allclose(cut_opts.occupancy, np.sum(weights) / 10., rtol=1e-3)
+    assert np.all(np.isfinite(cut_opts.window_cuts))
+    edges = cut_opts.edges.copy()
+    conf_cutter.fit(X[::2], y_true[::2], weights[::2])
+    assert np.all(conf_cutter.cut_opts.edges == edges)
+
+    # Ties in X_o collapse quantiles, the collapsed windows are merged
+    X_ties = X.copy()
+    X_ties[:, 1] = np.round(X_ties[:, 1] * 2.) / 2.
+    conf_cutter = ConfidenceCutter(window_placement='quantile',
+                                   n_steps=40,
+                                   n_bootstraps=0,
+                                   criteria=criteria.purity_criteria(0.9),
+                                   gap_filling='spline')
+    conf_cutter.fit(X_ties, y_true, weights)
+    cut_opts = conf_cutter.cut_opts
+    assert cut_opts.n_steps == len(cut_opts.positions) < 40
+    assert np.all(np.diff(cut_opts.positions) > 0)
+    assert np.all(cut_opts.edges[:, 1] > cut_opts.edges[:, 0])
+
+
+def test_grid_conf_cutter():
+    random_state = np.random.RandomState(1337)
+    n = 400000
+    x_1 = random_state.uniform(0., 1., n)
+    x_2 = random_state.uniform(-1., 1., n)
+    y_true = random_state.randint(0, 2, n)
+    shift = 0.2 * x_1 + 0.1 * x_2
+    conf = random_state.normal(0.3 + 0.4 * y_true + shift, 0.15)
+    conf = np.clip(conf, 0., 1.5)
+    X = np.vstack((conf, x_1, x_2)).T
+    # No events in the upper corner, the corner cell is filled
+    is_empty = np.logical_and(x_1 > 0.8, x_2 > 0.6)
+    X, y_true = X[~is_empty], y_true[~is_empty]
+
+    thresholds = []
+
+    def threshold(position):
+        thresholds.append(position)
+        return 0.9
+
+    grid_cutter = GridConfidenceCutter(
+        bins=[10, 5],
+        window_cells=[1, 0],
+        criteria=criteria.purity_criteria(threshold=threshold),
+        conf_range=(0., 1.5),
+        chunk_size=100000)
+    grid_cutter.fit(X, y_true)
+    assert grid_cutter.cut_values.shape == (10, 5)
+    assert np.all(np.isfinite(grid_cutter.cut_values))
+    assert np.isnan(grid_cutter.cut_errors[-1, -1])
+    assert np.sum(np.isnan(grid_cutter.cut_errors)) == 1
+    assert grid_cutter.cut_values[-1, -1] == grid_cutter.cut_values[-1, -2]
+    assert np.all(np.diff(grid_cutter.cut_values[1:-1, :-1], axis=0) > 0)
+    assert np.all(np.diff(grid_cutter.cut_values[:-1], axis=1) > 0)
+    assert len(thresholds) == 50
+    assert np.allclose(thresholds[1], [0.05, -0.4], atol=1e-3)
+
+    y_pred = grid_cutter.predict(X, chunk_size=30000)
+    assert abs(np.mean(y_true[y_pred == 1]) - 0.9) < 0.01
+    cuts = grid_cutter.get_cut(X[:10, 1:])
+    assert np.all(y_pred[:10] == (X[:10, 0] >= cuts))
+
+    grid_cutter_stream = GridConfidenceCutter(
+        bins=grid_cutter.edges,
+        window_cells=[1, 0],
+        criteria=criteria.purity_criteria(threshold=0.9),
+        conf_range=(0., 1.5))
+    for i in range(0, len(y_true), 100000):
+        grid_cutter_stream.partial_fit(X[i:i + 100000],
+                                       y_true[i:i + 100000])
+    assert np.allclose(grid_cutter_stream.cut_values, grid_cutter.cut_values)
+
+    # Events with non-finite values are ignored
+    X_nan = np.vstack((X, [[np.nan, 0.5, 0.], [0.5, np.nan, 0.]]))
+    grid_cutter_nan = GridConfidenceCutter(
+        bins=[10, 5],
+        window_cells=[1, 0],
+        criteria=criteria.purity_criteria(threshold=0.9),
+        conf_range=(0., 1.5))
+    grid_cutter_nan.fit(X_nan, np.append(y_true, [1, 1]))
+    assert np.allclose(grid_cutter_nan.cut_values, grid_cutter.cut_values)
+
+
+def test_fill_gaps():
+    random_state = np.random.RandomState(1337)
+    x = np.cumsum(random_state.uniform(0.5, 1.5, 50))
+    values = np.sin(x / 5.)[:, np.newaxis] * np.ones((1, 4))
+    values[random_state.uniform(size=values.shape) < 0.3] = np.nan
+    values[:3, 1] = np.nan
+    values[-5:, 2] = np.nan
+    values[1:, 3] = np.nan
+    is_valid = np.isfinite(values)
+
+    for strategy in ['linear', 'nearest', 'hold', 'spline']:
+        filled = fill_gaps(values, x=x, strategy=strategy)
+        assert np.all(np.isfinite(filled))
+        assert np.all(filled[is_valid] == values[is_valid])
+        for i in range(values.shape[1]):
+            x_valid = x[is_valid[:, i]]
+            y_valid = values[is_valid[:, i], i]
+            assert np.allclose(filled[x < x_valid[0], i], y_valid[0])
+            assert np.allclose(filled[x > x_valid[-1], i], y_valid[-1])
+            filled_1d = fill_gaps(values[:, i], x=x, strategy=strategy)
+            assert np.allclose(filled_1d, filled[:, i])
+            if strategy == 'linear':
+                assert np.allclose(filled[:, i], np.interp(x, x_valid,
+                                                           y_valid))
+            elif strategy == 'hold':
+                idx = np.searchsorted(x_valid, x, side='right') - 1
+                assert np.allclose(filled[:, i],
+                                   y_valid[np.clip(idx, 0, None)])
+    assert np.all(fill_gaps(values, strategy='hold')[:, 3] == values[0, 3])
+    is_inner = np.logical_and(x > x[is_valid[:, 0]][0],
+                              x < x[is_valid[:, 0]][-1])
+    spline = fill_gaps(values[:, 0], x=x, strategy='spline')
+    linear = fill_gaps(values[:, 0], x=x, strategy='linear')
+    spline_error = np.abs(spline - np.sin(x / 5.))[is_inner]
+    linear_error = np.abs(linear - np.sin(x / 5.))[is_inner]
+    assert np.max(spline_error) < np.max(linear_error)
+    # Repeated x
+    x_repeated = np.repeat(x[::2], 2)
+    spline = fill_gaps(values[:, 0], x=x_repeated, strategy='spline')
+    assert np.all(np.isfinite(spline))
+
+
+def test_curve_sliding_overlapping():
+    random_state = np.random.RandomState(1337)
+    n_steps = 200
+    positions = np.sort(random_state.uniform(-1., 1., n_steps))
+    half_widths = random_state.uniform(0.05, 0.3, n_steps)
+    edges = np.vstack((positions - half_widths, positions + half_widths)).T
+    y = random_state.uniform(size=n_steps)
+    window_weights = random_state.uniform(1., 3., n_steps)
+
+    curve = CurveSliding(edges, y, combination_mode='overlapping')
+    curve_weighted = CurveSliding(edges, y,
+                                  combination_mode='overlapping',
+                                  window_weights=window_weights)
+    switch_points = np.unique(edges)[:-1]
+    assert np.allclose(curve.x, switch_points)
+    for x_i, y_i, y_weighted_i in zip(switch_points,
+                                      curve.y,
+                                      curve_weighted.y):
+        idx = np.logical_and(edges[:, 0] <= x_i, edges[:, 1] > x_i)
+        assert np.isclose(y_i, np.mean(y[idx]))
+        assert np.isclose(y_weighted_i,
+                          np.average(y[idx], weights=window_weights[idx]))
+
+
+def test_curve_lookup():
+    random_state = np.random.RandomState(1337)
+    x = np.sort(random_state.uniform(-1., 1., 100))
+    y = np.cumsum(random_state.normal(size=100))
+    x_eval = random_state.uniform(-1.5, 1.5, 10000)
+    lookup_size = 100000
+    node_distance = (x[-1] - x[0]) / lookup_size
+    for mode in ['linear', 'hist']:
+        curve = Curve(x, y, mode=mode)
+        curve_lookup = Curve(x, y, mode=mode, lookup_size=lookup_size)
+        y_exact = curve(x_eval)
+        y_lookup = curve_lookup(x_eval)
+        # Differences only close to the kinks/steps of the curve
+        if mode == 'linear':
+            kinks = x
+        else:
+            kinks = curve.edges
+        idx = np.searchsorted(kinks, x_eval)
+        distance = np.minimum(
+            np.absolute(x_eval - kinks[np.clip(idx - 1, 0, len(kinks) - 1)]),
+            np.absolute(x_eval - kinks[np.clip(idx, 0, len(kinks) - 1)]))
+        far = distance > node_distance
+        assert np.allclose(y_lookup[far], y_exact[far])
+        assert np.isclose(curve_lookup(-2.), y[0])
+        assert np.isclose(curve_lookup(2.), y[-1])
+        curve_lookup.setup_lookup(None)
+        assert np.array_equal(curve_lookup(x_eval), y_exact)
+
+
+def test_predict_chunked():
+    n = 20000
+    X, y_true, _ = generate_gauss(n)
+    conf_cutter = ConfidenceCutter(n_steps=20,
+                                   window_size=0.2,
+                                   n_bootstraps=0,
+                                   criteria=criteria.purity_criteria(0.9))
+    conf_cutter.fit(X, y_true)
+    y_expected = np.array(X[:, 0] >= conf_cutter.cut_opts.curve(X[:, 1]),
+                          dtype=int)
+
+    assert np.array_equal(conf_cutter.predict(X), y_expected)
+    conf_cutter.n_jobs = 3
+    y_pred = np.zeros(n, dtype=np.uint8)
+    returned = conf_cutter.predict(X, out=y_pred, chunk_size=1000)
+    assert returned is y_pred
+    assert np.array_equal(y_pred, y_expected)
+    y_pred_bool = conf_cutter.predict(X, dtype=bool, chunk_size=999)
+    assert y_pred_bool.dtype == bool
+    assert np.array_equal(y_pred_bool, y_expected)
+    conf_cutter.conf_index = 1
+    assert np.array_equal(conf_cutter.predict(X[:, ::-1]), y_expected)
+
+
+def test_binary_curve_file(tmpdir):
+    n = 20000
+    X, y_true, _ = generate_gauss(n)
+    filenames = []
+    for i, threshold in enumerate([0.8, 0.9]):
+        conf_cutter = ConfidenceCutter(
+            n_steps=20,
+            window_size=0.2,
+            n_bootstraps=0,
+            criteria=criteria.purity_criteria(threshold=threshold),
+            positions=np.linspace(-0.9, 0.9, 20))
+        conf_cutter.fit(X, y_true)
+        filenames.append(conf_cutter.save_curve(
+            str(tmpdir.join('run_{}.tcurve'.format(i)))))
+
+    header = read_header(filenames[-1])
+    assert header['version'] == 1
+    assert header['cut_opts']['window_size'] == 0.2
+    assert header['provenance']['fit']['n_events'] == n
+    assert 'threshold=0.9' in header['criteria']
+
+    conf_cutter_reloaded = ConfidenceCutter(curve_file=filenames[-1])
+    assert isinstance(conf_cutter_reloaded.cut_opts.curve.x, np.memmap)
+    # The evaluation tables are mapped from the file as well
+    assert isinstance(conf_cutter_reloaded.cut_opts.curve.slope, np.memmap)
+    assert isinstance(conf_cutter_reloaded.cut_opts.curve.offset, np.memmap)
+    assert np.array_equal(conf_cutter_reloaded.cut_opts.edges,
+                          conf_cutter.cut_opts.edges)
+    assert conf_cutter_reloaded.cut_opts.combination_mode == 'overlapping'
+    assert np.array_equal(conf_cutter_reloaded.predict(X),
+                          conf_cutter.predict(X))
+
+    stack = load_curves(str(tmpdir))
+    assert stack.names == ['run_0', 'run_1']
+    assert isinstance(stack['run_0'].y, np.memmap)
+    assert isinstance(stack['run_0'].slope, np.memmap)
+    assert stack.y_matrix.shape == (2, len(conf_cutter.cut_opts.curve.x))
+    assert np.array_equal(stack['run_1'](X[:, 1]),
+                          conf_cutter.cut_opts.curve(X[:, 1]))
+
+
+def test_curve_tables(tmpdir):
+    random_state = np.random.RandomState(1337)
+    x = np.sort(random_state.uniform(-1., 1., 50))
+    y = random_state.uniform(0., 1., 50)
+    x_eval = random_state.uniform(-1.5, 1.5, 1000)
+    for mode, lookup_size in [('linear', None), ('hist', None),
+                              ('linear', 64), ('hist', 64)]:
+        curve = Curve(x, y, mode=mode, lookup_size=lookup_size)
+        filename = write_curve(str(tmpdir.join(mode)),
+                               curve_arrays(curve),
+                               {'mode': mode, 'lookup_size': lookup_size})
+        header, arrays = read_curve(filename)
+        curve_reloaded = curve_from_file(header, arrays)
+        for key, table in curve_reloaded.get_tables().items():
+            assert isinstance(table, np.memmap)
+        assert np.array_equal(curve_reloaded(x_eval), curve(x_eval))
+    # Tables not matching the curve are recomputed
+    curve = Curve(x, y, tables={'slope': np.zeros(3), 'offset': np.zeros(3)})
+    assert len(curve.slope) == len(x) + 1
+    assert np.array_equal(curve(x_eval), Curve(x, y)(x_eval))
+
+
+def test_curve_bank():
+    random_state = np.random.RandomState(1337)
+    curves = []
+    for n_points, mode in [(50, 'linear'), (80, 'hist'), (1, 'linear'),
+                           (1, 'hist'), (120, 'linear')]:
+        x = random_state.uniform(-1., 1., n_points)
+        y = random_state.uniform(0., 1., n_points)
+        curves.append(Curve(x, y, mode=mode))
+    edges = np.vstack((np.linspace(-1., 0.8, 30),
+                       np.linspace(-0.8, 1., 30))).T
+    curves.append(CurveSliding(edges,
+                               random_state.uniform(size=30),
+                               combination_mode='overlapping'))
+    bank = CurveBank(curves)
+    x_eval = np.append(random_state.uniform(-1.5, 1.5, 5000), curves[0].x)
+    confidence = random_state.uniform(size=len(x_eval))
+    thresholds = bank(x_eval, chunk_size=1000)
+    decisions = bank.decide(confidence, x_eval, chunk_size=999)
+    assert thresholds.shape == (len(x_eval), len(curves))
+    for i, curve in enumerate(curves):
+        assert np.array_equal(thresholds[:, i], curve(x_eval))
+        assert np.array_equal(decisions[:, i], confidence >= curve(x_eval))
+
+
+def test_reduce_curves():
+    random_state = np.random.RandomState(1337)
+    curves = [Curve(np.sort(random_state.uniform(-1., 1., 30)),
+                    random_state.uniform(size=30)) for _ in range(20)]
+    x_eval = random_state.uniform(-1.5, 1.5, 1000)
+    values = np.array([curve(x_eval) for curve in curves])
+    assert np.allclose(reduce_curves(curves, 'mean')(x_eval),
+                       np.mean(values, axis=0))
+    assert np.allclose(reduce_curves(curves, 'sum')(x_eval),
+                       np.sum(values, axis=0))
+    grid = np.unique(np.concatenate([curve.x for curve in curves]))
+    grid_values = np.array([curve(grid) for curve in curves])
+    assert np.allclose(reduce_curves(curves, 'quantile', q=0.9)(grid),
+                       np.percentile(grid_values, 90., axis=0))
+
+    summed = curves[0]
+    summed += curves[1]
+    summed *= 0.5
+    assert summed is curves[0]
+    assert np.allclose(summed(x_eval), (values[0] + values[1]) * 0.5)
+
+    conf_cutters = []
+    for curve in curves[2:5]:
+        conf_cutter = ConfidenceCutter()
+        conf_cutter.init_curve(curve.x, curve.y)
+        conf_cutters.append(conf_cutter)
+    combined = combine_cutters(conf_cutters, operation='max')
+    grid = np.unique(np.concatenate([curve.x for curve in curves[2:5]]))
+    assert np.allclose(combined(grid),
+                       np.max([curve(grid) for curve in curves[2:5]], axis=0))
+    conf_cutter_sum = conf_cutters[0] + conf_cutters[1]
+    assert np.allclose(conf_cutter_sum(x_eval), values[2] + values[3])
+    assert np.allclose(conf_cutters[0](x_eval), values[2])
+    # The result is a shallow copy with its own options
+    assert conf_cutter_sum.cut_opts is not conf_cutters[0].cut_opts
+    assert conf_cutter_sum.cut_opts.n_steps == conf_cutters[0].cut_opts.n_steps
+    assert conf_cutter_sum.criteria is conf_cutters[0].criteria
+    conf_cutter_deep = conf_cutters[0].copy(deep=True)
+    assert conf_cutter_deep.criteria is not conf_cutters[0].criteria
+    assert conf_cutter_deep.cut_opts.curve is not \
+        conf_cutters[0].cut_opts.curve
+    assert np.allclose(conf_cutter_deep(x_eval), values[2])
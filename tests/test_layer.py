@@ -0,0 +1,189 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import KFold
+
+from taco_salad import TacoSalad
+from taco_salad.component import Component
+from taco_salad.layer import Layer, LayerParallel
+
+
+def generate_df(n=2000, seed=1337):
+    random_state = np.random.RandomState(seed)
+    df = pd.DataFrame({'a': random_state.normal(size=n),
+                       'b': random_state.normal(size=n),
+                       'c': random_state.normal(size=n)})
+    df['y'] = (df.a + df.b + random_state.normal(size=n) > 0).astype(int)
+    return df
+
+
+def new_component(name, attributes, returns):
+    return Component(name,
+                     clf=LogisticRegression(),
+                     attributes=attributes,
+                     label='y',
+                     returns=returns)
+
+
+def test_layer_fit_df():
+    df = generate_df()
+    kfold = KFold(n_splits=3, shuffle=True, random_state=1337)
+    layer = Layer('layer1', dtype=np.float32)
+    layer.add_component(new_component('ab', ['a', 'b'], ['ab_0', 'ab_1']))
+    layer.add_component(new_component('c', ['c'], ['c_0', 'c_1']))
+    layer['c'].deactivate()
+    layer_df = layer.fit_df(df, kfold)
+    assert list(layer_df.columns) == ['ab_0', 'ab_1', 'c_0', 'c_1']
+    assert all(layer_df.dtypes == np.float32)
+    assert layer_df.index.equals(df.index)
+    assert np.all(np.isnan(layer_df[['c_0', 'c_1']].values))
+
+    expected = np.zeros((len(df), 2))
+    for train, test in kfold.split(df):
+        clf = LogisticRegression().fit(df[['a', 'b']].values[train],
+                                       df.y.values[train])
+        expected[test] = clf.predict_proba(df[['a', 'b']].values[test])
+    assert np.allclose(layer_df[['ab_0', 'ab_1']].values, expected,
+                       atol=1e-6)
+
+
+def test_layer_fit_df_index():
+    df = generate_df()
+    random_state = np.random.RandomState(1337)
+    df_shuffled = df.copy()
+    df_shuffled.index = random_state.permutation(len(df)) * 2 + 100
+
+    def fit(df):
+        kfold = KFold(n_splits=3, shuffle=True, random_state=1337)
+        layer = Layer('layer1')
+        layer.add_component(new_component('ab', ['a', 'b'], ['ab_0',
+                                                             'ab_1']))
+        layer.add_component(new_component('ba', ['a', 'b'], ['ba_0',
+                                                             'ba_1']))
+        return layer.fit_df(df, kfold, final_model=True), layer
+
+    layer_df, layer = fit(df)
+    layer_df_shuffled, layer_shuffled = fit(df_shuffled)
+    assert layer_df_shuffled.index.equals(df_shuffled.index)
+    assert np.allclose(layer_df.values, layer_df_shuffled.values)
+    assert np.allclose(layer_df.values[:, :2], layer_df.values[:, 2:])
+    assert np.allclose(layer['ab'].clf.coef_,
+                       layer_shuffled['ab'].clf.coef_)
+
+
+def test_layer_parallel_fit_df():
+    df = generate_df()
+    df['w'] = np.random.RandomState(1337).uniform(0.5, 1.5, len(df))
+    kfold = KFold(n_splits=3, shuffle=True, random_state=1337)
+
+    def add_components(layer):
+        layer.add_component(new_component('ab', ['a', 'b'], ['ab_0',
+                                                             'ab_1']))
+        layer.add_component(Component('bc',
+                                      clf=LogisticRegression(),
+                                      attributes=['b', 'c'],
+                                      label='y',
+                                      returns=['bc_0', 'bc_1'],
+                                      weight='w'))
+        return layer
+
+    layer = add_components(Layer('layer1'))
+    layer_df = layer.fit_df(df, kfold)
+    layer_parallel = add_components(LayerParallel('layer1',
+                                                  n_jobs=2,
+                                                  keep_fold_models=True))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        layer_parallel_df = layer_parallel.fit_df(df, kfold,
+                                                  executor=executor)
+        fold_components = dict(layer_parallel.fold_components)
+        fold_clfs = {name: layer_parallel[name].clf for name in ['ab', 'bc']}
+        # The pool can be reused by the next layer
+        layer_parallel_final_df = layer_parallel.fit_df(df, kfold,
+                                                        final_model=True,
+                                                        executor=executor)
+    assert np.allclose(layer_df.values, layer_parallel_df.values)
+    assert np.allclose(layer_df.values, layer_parallel_final_df.values)
+    for name in ['ab', 'bc']:
+        assert len(fold_components[name]) == 3
+        assert fold_clfs[name] is fold_components[name][-1].clf
+        assert np.allclose(fold_clfs[name].coef_, layer[name].clf.coef_)
+
+    layer.fit_df(df, kfold, final_model=True)
+    for name in ['ab', 'bc']:
+        assert layer_parallel[name] is not \
+            layer_parallel.fold_components[name][-1]
+        assert np.allclose(layer_parallel[name].clf.coef_,
+                           layer[name].clf.coef_)
+
+    class CountingExecutor(object):
+        """Records the number of tasks in flight at each submit."""
+        def __init__(self, executor):
+            self.executor = executor
+            self.futures = []
+            self.max_running = 0
+
+        def submit(self, *args, **kwargs):
+            running = sum(not future.done() for future in self.futures)
+            self.max_running = max(self.max_running, running + 1)
+            future = self.executor.submit(*args, **kwargs)
+            self.futures.append(future)
+            return future
+
+    # A smaller n_jobs is respected in a larger shared pool
+    layer_parallel.n_jobs = 1
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        counting_executor = CountingExecutor(executor)
+        layer_parallel_df = layer_parallel.fit_df(df, kfold,
+                                                  final_model=True,
+                                                  executor=counting_executor)
+    assert counting_executor.max_running == 1
+    assert len(counting_executor.futures) == 8
+    assert np.allclose(layer_df.values, layer_parallel_df.values)
+
+
+def test_taco_salad_fit_df_dag():
+    df = generate_df()
+    salad = TacoSalad(df=df, roles=[0, 0, 0, 1], kfold=3)
+    salad.add_layer('layer1')
+    salad.add_layer('layer2', n_jobs=2, keep_fold_models=True)
+    salad.add_component('layer1', 'ab', LogisticRegression(), ['a', 'b'],
+                        'y', ['ab_0', 'ab_1'])
+    salad.add_component('layer1', 'c', LogisticRegression(), ['c'],
+                        'y', ['c_0', 'c_1'])
+    salad.add_component('layer2', 'stack', LogisticRegression(),
+                        ['ab_1', 'c_1', 'a'], 'y', ['stack_0', 'stack_1'])
+
+    def fit(**kwargs):
+        np.random.seed(1337)
+        return salad.fit_df(df, clear_df=False, final_mode='all', **kwargs)
+
+    layers_df = fit()
+    columns = ['ab_0', 'ab_1', 'c_0', 'c_1', 'stack_0', 'stack_1']
+    assert list(layers_df.columns) == list(df.columns) + columns
+    salad.get_layer('layer2').fold_components = {}
+    dag_dfs = [fit(scheduler='dag', n_jobs=n_jobs, backend=backend)
+               for n_jobs, backend in [(1, 'thread'),
+                                       (2, 'thread'),
+                                       (2, 'process')]]
+    for dag_df in dag_dfs:
+        assert list(dag_df.columns) == list(layers_df.columns)
+        assert np.all(np.isfinite(dag_df[columns].values))
+        assert np.allclose(dag_df[columns].values,
+                           dag_dfs[0][columns].values)
+    # The first layer sees the same folds in both schedulers
+    assert np.allclose(dag_dfs[0][columns[:4]].values,
+                       layers_df[columns[:4]].values)
+    # final_mode='all' refits every component on all rows
+    clf = LogisticRegression().fit(df[['a', 'b']].values, df.y.values)
+    assert np.allclose(salad.get_layer('layer1')['ab'].clf.coef_, clf.coef_)
+    X_stack = np.column_stack([dag_dfs[-1].ab_1, dag_dfs[-1].c_1, df.a])
+    clf = LogisticRegression().fit(X_stack, df.y.values)
+    assert np.allclose(salad.get_layer('layer2')['stack'].clf.coef_,
+                       clf.coef_)
+    # The DAG goes through LayerParallel.cross_fit and keeps its models
+    fold_components = salad.get_layer('layer2').fold_components
+    assert len(fold_components['stack']) == 3
+    assert list(salad.fit_df(df, scheduler='dag').columns) == \
+        list(df.columns)